@@ -0,0 +1,102 @@
+import struct
+import sys
+from array import array
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+MAGIC = b'TMDS'
+FORMAT_VERSION = 1
+# magic, version, markets
+HEADER = struct.Struct('<4sII')
+# name length (padded to 4 bytes), years
+MARKET_HEADER = struct.Struct('<II')
+# year, operators, links
+YEAR_HEADER = struct.Struct('<III')
+# Every value is a little-endian uint32, 9 digit numbering keeps volumes below 2**32.
+# Per year: ids[operators], volumes[operators], link offsets[operators + 1] and
+# link targets[links], links of operator i are targets[offsets[i]:offsets[i + 1]].
+# 'I' is 4 bytes wide on every platform CPython supports.
+TYPECODE = 'I'
+
+
+def encode(datasets: Dict[str, Dict]) -> bytes:
+    # datasets: {market: {year: {'year', 'operators': [{'id', 'volume', 'links'}]}}}
+    chunks = [HEADER.pack(MAGIC, FORMAT_VERSION, len(datasets))]
+    for market, dataset in datasets.items():
+        name = market.encode('utf-8')
+        chunks.append(MARKET_HEADER.pack(len(name), len(dataset)))
+        chunks.append(name.ljust(_padded(len(name)), b'\0'))
+        for year, status in dataset.items():
+            operators = status['operators']
+            ids = _uint32_array(int(op['id']) for op in operators)
+            volumes = _uint32_array(op['volume'] for op in operators)
+            offsets = _uint32_array([0])
+            targets = _uint32_array()
+            for op in operators:
+                targets.extend(int(link) for link in op['links'])
+                offsets.append(len(targets))
+            chunks.append(YEAR_HEADER.pack(int(year), len(operators), len(targets)))
+            chunks.extend(_little_endian(values).tobytes() for values in (ids, volumes, offsets, targets))
+    return b''.join(chunks)
+
+
+def decode(content: bytes) -> Dict[str, Dict]:
+    magic, version, markets = HEADER.unpack_from(content)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f'Not a version {FORMAT_VERSION} binary dataset')
+    position = HEADER.size
+    datasets = {}
+    for _ in range(markets):
+        name_length, years = MARKET_HEADER.unpack_from(content, position)
+        position += MARKET_HEADER.size
+        market = content[position:position + name_length].decode('utf-8')
+        position += _padded(name_length)
+        dataset = datasets[market] = {}
+        for _ in range(years):
+            year, operators, links = YEAR_HEADER.unpack_from(content, position)
+            position += YEAR_HEADER.size
+            (ids, volumes, offsets, targets), position = _read_arrays(
+                content, position, (operators, operators, operators + 1, links)
+            )
+            dataset[str(year)] = {
+                'year': str(year),
+                'operators': [
+                    {
+                        'id': str(ids[i]),
+                        'volume': volumes[i],
+                        'links': [str(link) for link in targets[offsets[i]:offsets[i + 1]]],
+                    }
+                    for i in range(operators)
+                ],
+            }
+    return datasets
+
+
+def _read_arrays(content: bytes, position: int, lengths: Tuple[int, ...]) -> Tuple[List[array], int]:
+    arrays = []
+    for length in lengths:
+        values = _uint32_array()
+        end = position + length * values.itemsize
+        values.frombytes(content[position:end])
+        arrays.append(_little_endian(values))
+        position = end
+    return arrays, position
+
+
+def _uint32_array(values=()) -> array:
+    return array(TYPECODE, values)
+
+
+def _little_endian(values: array) -> array:
+    # Swaps bytes in place on big-endian hosts, it is its own inverse
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _padded(length: int) -> int:
+    # Keeps arrays 4 bytes aligned, so the UI can read them in place
+    return (length + 3) // 4 * 4
@@ -0,0 +1,47 @@
+from typing import Dict
+
+ROOT_ID = '0'
+CLUSTER_PREFIX = 'cluster-'
+TOP_OPERATORS = 50
+
+
+def summarize(dataset: Dict, top: int = TOP_OPERATORS) -> Dict:
+    # Level of detail view of a market dataset, {year: {'year', 'operators', 'clusters'}}:
+    #   operators: the top operators by volume and their wholesalers, as in the dataset
+    #   clusters: [{'id', 'volume', 'links', 'members'}, ...] the rest of operators
+    #     folded by the first kept operator they link to (the root otherwise),
+    #     with summed volumes and links to kept operators.
+    return {year: _summarize_year(data, top) for year, data in dataset.items()}
+
+
+def cluster_id(wholesaler: str) -> str:
+    return f'{CLUSTER_PREFIX}{wholesaler}'
+
+
+def _summarize_year(data: Dict, top: int) -> Dict:
+    ranked = sorted(data['operators'], key=lambda op: op['volume'], reverse=True)
+    kept = {op['id'] for op in ranked[:top]}
+    kept.update(link for op in ranked[:top] for link in op['links'] if link != ROOT_ID)
+
+    clusters = {}
+    for op in ranked:
+        if op['id'] in kept:
+            continue
+        links = [link for link in op['links'] if link == ROOT_ID or link in kept]
+        wholesaler = links[0] if links else ROOT_ID
+        cluster = clusters.setdefault(wholesaler, {
+            'id': cluster_id(wholesaler),
+            'volume': 0,
+            'links': set(),
+            'members': [],
+        })
+        cluster['volume'] += op['volume']
+        cluster['links'].update(links or [ROOT_ID])
+        cluster['members'].append(op['id'])
+
+    return {
+        'year': data['year'],
+        'operators': [op for op in data['operators'] if op['id'] in kept],
+        # Ordered by their biggest member
+        'clusters': [{**cluster, 'links': sorted(cluster['links'])} for cluster in clusters.values()],
+    }
@@ -0,0 +1,134 @@
+import os
+import random
+import shutil
+import sys
+import time
+import traceback
+from datetime import datetime
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+from backend import preprocess_data
+
+# Seconds between source checks, plus a random delay up to JITTER
+INTERVAL = 3600
+JITTER = 600
+# Generations kept next to the published one, pages loaded before a swap may
+# still fetch shards or binary datasets from them.
+KEEP_GENERATIONS = 3
+GENERATIONS_SUFFIX = '.generations'
+
+
+def serve(link: str, run_options: Dict, interval: float = INTERVAL, jitter: float = JITTER,
+          keep: int = KEEP_GENERATIONS, cycles: int = None) -> int:
+    # Checks the source every interval (+ jitter) seconds and publishes a new
+    # generation when it changed, see refresh(). The HTTP session, imported
+    # modules and parsed registries stay warm between checks. cycles limits
+    # checks, forever by default.
+    if os.path.lexists(link) and not os.path.islink(link):
+        raise ValueError(f'{link} exists and is not a symlink')
+    session = preprocess_data._http_session()
+    try:
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            try:
+                generation = refresh(link, run_options, session=session, keep=keep)
+                print(f'Published {generation}' if generation else 'Source did not change')
+            except Exception:
+                # A failed build keeps the current generation published, next check retries
+                traceback.print_exc()
+            cycle += 1
+            if cycles is None or cycle < cycles:
+                time.sleep(interval + random.uniform(0, jitter))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+    return 0
+
+
+def refresh(link: str, run_options: Dict, session=None, keep: int = KEEP_GENERATIONS) -> Optional[str]:
+    # Builds a new generation directory when the source changed (or nothing was
+    # published yet) and swaps link to it. Returns the generation, None when the
+    # source didn't change. Raises RuntimeError when the build fails.
+    current = os.path.realpath(link) if os.path.islink(link) else None
+    source = (
+        f'{preprocess_data.TMP_DIR}/{preprocess_data.BD_FILE}' if run_options.get('from_zip')
+        else f'{preprocess_data.TMP_DIR}/{preprocess_data.LANDLINE_FILE}'
+    )
+    if current and not preprocess_data._db_is_outdated(filepath=source, session=session):
+        return None
+
+    generations_dir = f'{link}{GENERATIONS_SUFFIX}'
+    generation = os.path.join(generations_dir, datetime.now().strftime('%Y%m%dT%H%M%S.%f'))
+    if current:
+        # Unchanged files are carried over. Hard links are safe, exports replace
+        # files instead of writing into them.
+        shutil.copytree(current, generation, copy_function=os.link)
+    else:
+        os.makedirs(generation)
+    try:
+        exit_code = preprocess_data.run(**{**run_options, 'session': session, 'output_dir': generation, 'warm': True})
+    except BaseException:
+        shutil.rmtree(generation, ignore_errors=True)
+        raise
+    if exit_code != 0:
+        shutil.rmtree(generation, ignore_errors=True)
+        published = f', {current} is still published' if current else ''
+        raise RuntimeError(f'Build exited with code {exit_code}{published}')
+
+    _swap_link(link, generation)
+    _remove_old_generations(generations_dir, keep, published=generation)
+    return generation
+
+
+def _swap_link(link: str, target: str):
+    # A new symlink renamed over the old one, nginx sees either generation
+    tmp_link = f'{link}.tmp'
+    if os.path.lexists(tmp_link):
+        os.unlink(tmp_link)
+    os.symlink(os.path.relpath(target, os.path.dirname(os.path.abspath(link))), tmp_link)
+    os.replace(tmp_link, link)
+
+
+def _remove_old_generations(generations_dir: str, keep: int, published: str):
+    names = sorted(os.listdir(generations_dir), reverse=True)
+    published_name = os.path.basename(published)
+    kept = [published_name] + [name for name in names if name != published_name][:keep]
+    for name in names:
+        if name not in kept:
+            shutil.rmtree(os.path.join(generations_dir, name), ignore_errors=True)
+
+
+def main(argv: List[str]) -> int:
+    parser = preprocess_data.argument_parser('python -m backend.daemon')
+    parser.add_argument(
+        'link',
+        metavar='LINK',
+        help='symlink swapped to every published generation, serve it as the page\'s data/ directory'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=INTERVAL,
+        help='seconds between source checks (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=JITTER,
+        help='random extra seconds up to this added to every --interval (default: %(default)s)'
+    )
+    args = parser.parse_args(argv)
+    if args.as_of or args.hashed_names or args.output_dir:
+        parser.error('--as-of, --hashed-names and --output-dir can\'t be used here')
+    if os.path.lexists(args.link) and not os.path.islink(args.link):
+        parser.error(f'{args.link} exists and is not a symlink')
+    return serve(args.link, preprocess_data.run_options(parser, args), interval=args.interval, jitter=args.jitter)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,74 @@
+from typing import (
+    Dict,
+    List,
+)
+
+
+def encode(dataset: Dict) -> Dict:
+    # Encodes cumulative yearly snapshots as changes from the previous year:
+    #   add: [[id, volume, links], ...] operators showing up that year
+    #   remove: [id, ...] operators gone that year
+    #   volume: {id: increment} and links: {id: [new links]} for known operators
+    #   order: [id, ...] only when it isn't previous order plus added operators
+    years = list(dataset)
+    deltas = []
+    previous = {}
+    previous_order = []
+    for year in years:
+        operators = {op['id']: op for op in dataset[year]['operators']}
+        order = list(operators)
+        delta = {}
+        remove = [_id for _id in previous_order if _id not in operators]
+        for _id in previous_order:
+            if _id in operators and not set(previous[_id]['links']) <= set(operators[_id]['links']):
+                remove.append(_id)
+        added = [_id for _id in order if _id not in previous or _id in remove]
+        volumes = {}
+        links = {}
+        for _id in order:
+            if _id in added:
+                continue
+            if operators[_id]['volume'] != previous[_id]['volume']:
+                volumes[_id] = operators[_id]['volume'] - previous[_id]['volume']
+            new_links = [link for link in operators[_id]['links'] if link not in previous[_id]['links']]
+            if new_links:
+                links[_id] = new_links
+        if added:
+            delta['add'] = [[_id, operators[_id]['volume'], operators[_id]['links']] for _id in added]
+        if remove:
+            delta['remove'] = remove
+        if volumes:
+            delta['volume'] = volumes
+        if links:
+            delta['links'] = links
+        if order != [_id for _id in previous_order if _id not in remove] + added:
+            delta['order'] = order
+        deltas.append(delta)
+        previous = operators
+        previous_order = order
+    return {'years': years, 'deltas': deltas}
+
+
+def decode(encoded: Dict) -> Dict:
+    # Python counterpart of the decoder in ui/js/visualization.js
+    dataset = {}
+    operators = {}
+    order = []
+    for year, delta in zip(encoded['years'], encoded['deltas']):
+        for _id in delta.get('remove', []):
+            del operators[_id]
+        order = [_id for _id in order if _id in operators]
+        for _id, volume, links in delta.get('add', []):
+            operators[_id] = {'volume': volume, 'links': list(links)}
+            order.append(_id)
+        for _id, increment in delta.get('volume', {}).items():
+            operators[_id]['volume'] += increment
+        for _id, new_links in delta.get('links', {}).items():
+            operators[_id]['links'] = sorted(operators[_id]['links'] + new_links)
+        order = delta.get('order', order)
+        dataset[year] = {'year': year, 'operators': _snapshot(operators, order)}
+    return dataset
+
+
+def _snapshot(operators: Dict, order: List[str]) -> List[Dict]:
+    return [{'id': _id, 'volume': operators[_id]['volume'], 'links': list(operators[_id]['links'])} for _id in order]
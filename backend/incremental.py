@@ -0,0 +1,158 @@
+import os
+import pickle
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from backend.registries import (
+    Registry,
+    RegistryColumns,
+    build_dataset,
+    cumulative_operators_status,
+    registry_values,
+    unique_ordered_years,
+)
+
+STATE_VERSION = 1
+
+
+def load_state(filepath: str) -> Optional[Dict]:
+    try:
+        with open(filepath, 'rb') as f:
+            state = pickle.load(f)
+    except Exception:
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def save_state(filepath: str, registries: Sequence, operators_by_name: Dict, dataset: Dict):
+    if not isinstance(registries, RegistryColumns):
+        registries = RegistryColumns.from_registries(registries)
+    state = {
+        'version': STATE_VERSION,
+        'registries': registries,
+        'operators_by_name': operators_by_name,
+        'dataset': dataset,
+    }
+    with open(f'{filepath}.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{filepath}.tmp', filepath)
+
+
+def rebuild_dataset(registries: Sequence, operators_by_name: Dict, previous: Optional[Dict]) -> Dict:
+    # Patches the previous run's dataset with the operators whose registries changed
+    # (diffed by index, block and sub-block), from the first year with changes on.
+    # Falls back to a full build when there is no previous state, operator IDs
+    # changed or unchanged registries were reordered. Output matches build_dataset().
+    if not registries or not previous or not _same_operator_ids(previous['operators_by_name'], operators_by_name):
+        return build_dataset(registries, operators_by_name)
+
+    changes = _changed_registries(previous['registries'], registries)
+    if changes is None:
+        return build_dataset(registries, operators_by_name)
+    changed_operators, first_changed_year = changes
+
+    previous_dataset = previous['dataset']
+    years = [int(y) for y in unique_ordered_years(registries)]
+    all_years = [str(year) for year in range(min(years), max(years) + 1)]
+    if first_changed_year is None:
+        return {_y: previous_dataset[_y] for _y in all_years}
+
+    changed_ids = {
+        ids[name]
+        for ids in (previous['operators_by_name'], operators_by_name)
+        for name in changed_operators if name in ids
+    }
+    changed_registries = [
+        values for values in registry_values(registries, 'operator', 'wholesaler', 'date', 'volume')
+        if values[0] in changed_operators
+    ]
+    changed_years = [_y for _y in all_years if _y >= first_changed_year]
+    changed_status = cumulative_operators_status(
+        [dict(zip(('operator', 'wholesaler', 'date', 'volume'), values)) for values in changed_registries],
+        operators_by_name,
+        changed_years
+    )
+    first_positions = _first_positions_by_year(registries, operators_by_name, changed_years)
+    last_previous_year = max(previous_dataset)
+
+    dataset = {}
+    for _y in all_years:
+        if _y < first_changed_year and _y in previous_dataset:
+            dataset[_y] = previous_dataset[_y]
+            continue
+        if _y < first_changed_year:
+            # New year without registries after the previous last one
+            dataset[_y] = {'year': _y, 'operators': previous_dataset[last_previous_year]['operators']}
+            continue
+        _, operators = next(changed_status)
+        unchanged_year = previous_dataset.get(min(_y, last_previous_year), {'operators': []})
+        operators += [op for op in unchanged_year['operators'] if op['id'] not in changed_ids]
+        positions = first_positions[_y]
+        operators.sort(key=lambda op: (sum([int(i) for i in op['links']]), positions[op['id']]))
+        dataset[_y] = {'year': _y, 'operators': operators}
+
+    return dataset
+
+
+def _same_operator_ids(previous_operators_by_name: Dict, operators_by_name: Dict) -> bool:
+    # Operators may be added, but every known operator must keep its ID.
+    return all(operators_by_name.get(name, _id) == _id for name, _id in previous_operators_by_name.items())
+
+
+def _rows_by_block(registries: Sequence) -> Tuple[Dict[Tuple, List[Tuple]], List[Tuple]]:
+    rows = {}
+    keys = []
+    values = registry_values(registries, *Registry.__slots__)
+    for row in values:
+        _key = (row[3], row[4], row[5])  # index, block, sub_block
+        rows.setdefault(_key, []).append(row)
+        keys.append(_key)
+    return rows, keys
+
+
+def _changed_registries(previous_registries: Sequence, registries: Sequence) -> Optional[Tuple[Set[str], Optional[str]]]:
+    previous_rows, previous_keys = _rows_by_block(previous_registries)
+    rows, keys = _rows_by_block(registries)
+
+    changed_keys = {_key for _key in previous_rows.keys() | rows.keys() if previous_rows.get(_key) != rows.get(_key)}
+    if _unchanged_order(previous_keys, changed_keys) != _unchanged_order(keys, changed_keys):
+        return None
+
+    changed_operators = set()
+    changed_years = set()
+    for _key in changed_keys:
+        for row in previous_rows.get(_key, []) + rows.get(_key, []):
+            changed_operators.add(row[0])
+            changed_years.add(row[2].split('-')[0])
+    return changed_operators, min(changed_years) if changed_years else None
+
+
+def _unchanged_order(keys: Iterable[Tuple], changed_keys: Set[Tuple]) -> List[Tuple]:
+    return [_key for _key in keys if _key not in changed_keys]
+
+
+def _first_positions_by_year(registries: Sequence, operators_by_name: Dict, years: List[str]) -> Dict[str, Dict]:
+    # First registry position of every operator among registries up to each year,
+    # which breaks ties between operators with the same links in build_dataset().
+    first_by_year = {}
+    values = registry_values(registries, 'operator', 'date')
+    for position, (operator, _date) in enumerate(values):
+        first_by_year.setdefault(_date.split('-')[0], {}).setdefault(operators_by_name[operator], position)
+
+    positions = {}
+    running = {}
+    pending_years = sorted(first_by_year, reverse=True)
+    for _y in years:
+        while pending_years and pending_years[-1] <= _y:
+            for _id, position in first_by_year[pending_years.pop()].items():
+                if position < running.get(_id, position + 1):
+                    running[_id] = position
+        positions[_y] = dict(running)
+    return positions
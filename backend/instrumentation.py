@@ -0,0 +1,86 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import (
+    Dict,
+    Iterator,
+    List,
+)
+
+REPORT_VERSION = 1
+
+# Stages are recorded by the innermost recording() of the current process,
+# stage() does nothing outside of it.
+_stages = None
+_labels = {}
+
+
+@contextmanager
+def recording(enabled: bool = True, **labels) -> Iterator[List[Dict]]:
+    # Collects stage() records in the returned list while active. labels
+    # (e.g. market='mobile') are added to every record.
+    global _stages, _labels
+    if not enabled:
+        yield []
+        return
+
+    previous = _stages, _labels
+    _stages, _labels = [], labels
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield _stages
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _stages, _labels = previous
+
+
+@contextmanager
+def stage(name: str, rows_in: int = None) -> Iterator[Dict]:
+    # Records wall time, CPU time of this process and peak traced memory. The
+    # yielded record takes the stage output size: record['rows_out'] = n
+    if _stages is None:
+        yield {}
+        return
+
+    record = {'stage': name, **_labels, 'rows_in': rows_in, 'rows_out': None}
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+        record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+        record['peak_bytes'] = max(tracemalloc.get_traced_memory()[1] - memory_before, 0)
+        _stages.append(record)
+
+
+def extend(records: List[Dict]):
+    # Adds stages recorded elsewhere, e.g. by a pipeline in another process.
+    if _stages is not None:
+        _stages.extend(records)
+
+
+def write_report(filepath: str, stages: List[Dict], started: datetime, exit_code: int):
+    total_wall = round((datetime.now() - started).total_seconds(), 6)
+    report = {
+        'version': REPORT_VERSION,
+        'started': started.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'exit_code': exit_code,
+        'wall_seconds': total_wall,
+        'stages': stages,
+    }
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f'{filepath}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(f'{filepath}.tmp', filepath)
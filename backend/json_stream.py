@@ -0,0 +1,60 @@
+import filecmp
+import json
+import os
+from contextlib import contextmanager
+from typing import (
+    Iterator,
+    TextIO,
+    Tuple,
+)
+
+# json.dumps() defaults
+SEPARATORS = (', ', ': ')
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+@contextmanager
+def atomic_file(filepath: str) -> Iterator[TextIO]:
+    # Text file written next to filepath and renamed over it once complete, so
+    # HTTP servers never send a half written file. Identical files are kept as
+    # they are, their mtime (ETag and Last-Modified) doesn't change.
+    tmp_filepath = f'{filepath}.tmp'
+    try:
+        with open(tmp_filepath, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            yield f
+        if os.path.isfile(filepath) and filecmp.cmp(tmp_filepath, filepath, shallow=False):
+            os.unlink(tmp_filepath)
+        else:
+            os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.unlink(tmp_filepath)
+        raise
+
+
+def dump(value, f: TextIO, separators: Tuple[str, str] = SEPARATORS, depth: int = 1):
+    # Same output as f.write(json.dumps(value, separators=separators)) without
+    # building the whole string: dicts and lists are written item by item down
+    # to depth levels, deeper values are serialized at once.
+    if depth <= 0 or not isinstance(value, (dict, list)) or not value:
+        f.write(json.dumps(value, separators=separators))
+        return
+
+    item_separator, key_separator = separators
+    if isinstance(value, list):
+        f.write('[')
+        for i, item in enumerate(value):
+            if i:
+                f.write(item_separator)
+            dump(item, f, separators, depth - 1)
+        f.write(']')
+        return
+
+    f.write('{')
+    for i, (key, item) in enumerate(value.items()):
+        if i:
+            f.write(item_separator)
+        f.write(json.dumps(key if isinstance(key, str) else str(key)))
+        f.write(key_separator)
+        dump(item, f, separators, depth - 1)
+    f.write('}')
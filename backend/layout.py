@@ -0,0 +1,116 @@
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the UI falls back to vis.js physics without layouts
+    np = None
+
+# Node of the regulator, the UI draws it as 'ER' and links self-owned operators to it
+ROOT_ID = '0'
+# Side of the square nodes are spread over, in vis.js canvas units
+SIZE = 1000
+COLD_ITERATIONS = 120
+WARM_ITERATIONS = 40
+# Max node step on the first iteration as a fraction of SIZE. Warm started
+# layouts only settle operators around the previous year's positions.
+COLD_TEMPERATURE = 0.1
+WARM_TEMPERATURE = 0.02
+# Rows of the pairwise repulsion computed at once, bounds memory to BLOCK_ROWS * nodes
+BLOCK_ROWS = 512
+SEED = 0
+
+
+def compute(dataset: Dict, seed: int = SEED) -> Optional[Dict]:
+    # Returns {year: {id: [x, y]}} for a market dataset ({year: {'operators': [...]}}),
+    # None without NumPy. Every year starts from the previous year's positions,
+    # operators showing up that year are placed next to the ones they link to.
+    if np is None:
+        return None
+    rng = np.random.default_rng(seed)
+    layouts = {}
+    previous = {}
+    for year, data in dataset.items():
+        ids = [ROOT_ID] + [op['id'] for op in data['operators'] if op['id'] != ROOT_ID]
+        positions = {_id: i for i, _id in enumerate(ids)}
+        sources, targets = [], []
+        for op in data['operators']:
+            for link in op['links']:
+                if link in positions and link != op['id']:
+                    sources.append(positions[op['id']])
+                    targets.append(positions[link])
+        edges = np.array([sources, targets], dtype=np.intp).reshape(2, -1)
+        pos = _initial_positions(ids, edges, previous, rng)
+        warm = bool(previous)
+        pos = _fruchterman_reingold(
+            pos,
+            edges,
+            iterations=WARM_ITERATIONS if warm else COLD_ITERATIONS,
+            temperature=SIZE * (WARM_TEMPERATURE if warm else COLD_TEMPERATURE)
+        )
+        previous = {_id: pos[i] for i, _id in enumerate(ids)}
+        rounded = np.rint(pos).astype(int).tolist()
+        layouts[year] = {_id: rounded[i] for i, _id in enumerate(ids)}
+
+    return layouts
+
+
+def _initial_positions(ids: List[str], edges, previous: Dict, rng):
+    pos = np.zeros((len(ids), 2))
+    known = np.array([_id in previous for _id in ids])
+    known[0] = True
+    for i, _id in enumerate(ids):
+        if _id in previous:
+            pos[i] = previous[_id]
+    if not previous:
+        pos[1:] = rng.uniform(-SIZE / 2, SIZE / 2, (len(ids) - 1, 2))
+        return pos
+
+    # New operators go around the known operators they link to (the root otherwise)
+    sources, targets = edges
+    anchors = np.zeros_like(pos)
+    counts = np.zeros(len(ids))
+    linked = known[targets] & ~known[sources]
+    np.add.at(anchors, sources[linked], pos[targets[linked]])
+    np.add.at(counts, sources[linked], 1)
+    new = ~known
+    anchors[new] /= np.maximum(counts[new], 1)[:, None]
+    spread = SIZE / max(np.sqrt(len(ids)), 1)
+    pos[new] = anchors[new] + rng.uniform(-spread, spread, (int(new.sum()), 2))
+    return pos
+
+
+def _fruchterman_reingold(pos, edges, iterations: int, temperature: float):
+    n = len(pos)
+    if n < 2:
+        return pos
+    k = SIZE / np.sqrt(n)
+    sources, targets = edges
+    for t in np.linspace(temperature, 0, iterations, endpoint=False):
+        disp = np.zeros_like(pos)
+        squares = np.einsum('ij,ij->i', pos, pos)
+        # Repulsion k² / d between every pair of nodes: sum_j w_ij (p_i - p_j)
+        # with w_ij = k² / d_ij², as p_i * sum_j w_ij - (w @ p)_i
+        for start in range(0, n, BLOCK_ROWS):
+            rows = pos[start:start + BLOCK_ROWS]
+            distance2 = squares[start:start + BLOCK_ROWS, None] + squares[None, :] - 2 * rows @ pos.T
+            weights = k * k / np.maximum(distance2, 1e-2)
+            weights[np.arange(len(rows)), np.arange(start, start + len(rows))] = 0
+            disp[start:start + BLOCK_ROWS] += rows * weights.sum(axis=1)[:, None] - weights @ pos
+        # Attraction d² / k along links
+        delta = pos[sources] - pos[targets]
+        pull = delta * (np.sqrt(np.einsum('ij,ij->i', delta, delta)) / k)[:, None]
+        for axis in (0, 1):
+            disp[:, axis] += np.bincount(targets, pull[:, axis], n) - np.bincount(sources, pull[:, axis], n)
+        # Keeps components without links to the rest near the center
+        disp -= pos * (np.sqrt(squares) / (k * n))[:, None]
+
+        length = np.maximum(np.sqrt(np.einsum('ij,ij->i', disp, disp)), 1e-9)
+        pos = pos + disp * (np.minimum(length, t) / length)[:, None]
+        # The root stays in the middle, so it doesn't drift between years
+        pos -= pos[0]
+
+    return pos
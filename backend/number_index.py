@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from backend.registries import registry_values
+
+MAGIC = b'NIDX'
+INDEX_VERSION = 1
+# magic, version, segments, owners, owner values, names JSON length
+HEADER = struct.Struct('<4sIIIII')
+
+# (assignees, sub-assignees, wholesaler). Shared blocks have several assignees,
+# sub-assigned ranges lie inside their wholesaler's block.
+Owners = Tuple[Tuple[str, ...], Tuple[str, ...], str]
+
+
+class NumberIndex:
+    # Numbering ranges cut into disjoint, sorted segments: starts[i] is the first
+    # number of segment i and owner_ids[i] its owners (-1 for unassigned numbers),
+    # so a lookup is one bisect over starts. Owners are stored flat as operator
+    # positions in names: owner_values[owner_offsets[i]:owner_offsets[i + 1]] is
+    # [assignees quantity, *assignees, *sub-assignees, wholesaler or -1].
+
+    def __init__(self, starts: array, owner_ids: array, owner_offsets: array, owner_values: array, names: List[str]):
+        self.starts = starts
+        self.owner_ids = owner_ids
+        self.owner_offsets = owner_offsets
+        self.owner_values = owner_values
+        self.names = names
+
+    @classmethod
+    def from_registries(cls, registries: Sequence) -> 'NumberIndex':
+        # Sweep over range boundaries keeping the registries covering each segment.
+        # Adjacent segments with the same owners are merged.
+        names = {}
+        rows = []
+        changes = defaultdict(lambda: ([], []))
+        values = registry_values(registries, 'nmin', 'nmax', 'type', 'operator', 'wholesaler')
+        for row_id, (nmin, nmax, _type, operator, wholesaler) in enumerate(values):
+            operator_id = names.setdefault(operator, len(names))
+            wholesaler_id = names.setdefault(wholesaler, len(names)) if wholesaler else -1
+            rows.append((_type == 'subasignado', operator_id, wholesaler_id))
+            changes[nmin][0].append(row_id)
+            changes[nmax + 1][1].append(row_id)
+
+        starts, owner_ids, owners_ids = array('q'), array('i'), {}
+        active = set()
+        for position in sorted(changes):
+            added, removed = changes[position]
+            active.difference_update(removed)
+            active.update(added)
+            owner_id = owners_ids.setdefault(_owner_values(rows, active), len(owners_ids)) if active else -1
+            if not owner_ids or owner_ids[-1] != owner_id:
+                starts.append(position)
+                owner_ids.append(owner_id)
+
+        owner_offsets, owner_values = array('i', [0]), array('i')
+        for owner in owners_ids:
+            owner_values.extend(owner)
+            owner_offsets.append(len(owner_values))
+        return cls(starts, owner_ids, owner_offsets, owner_values, list(names))
+
+    def lookup(self, number: int) -> Optional[Dict]:
+        owner_id = self.owner_id(number)
+        if owner_id < 0:
+            return None
+        assignees, sub_assignees, wholesaler = self.owners(owner_id)
+        return {'assignees': list(assignees), 'sub_assignees': list(sub_assignees), 'wholesaler': wholesaler}
+
+    def owner_id(self, number: int) -> int:
+        position = bisect_right(self.starts, number) - 1
+        return self.owner_ids[position] if position >= 0 else -1
+
+    def owners(self, owner_id: int) -> Owners:
+        values = self.owner_values[self.owner_offsets[owner_id]:self.owner_offsets[owner_id + 1]]
+        assignees = values[0]
+        return (
+            tuple(self.names[i] for i in values[1:assignees + 1]),
+            tuple(self.names[i] for i in values[assignees + 1:-1]),
+            self.names[values[-1]] if values[-1] >= 0 else '',
+        )
+
+    def save(self, filepath: str):
+        names = json.dumps(self.names, ensure_ascii=False).encode('utf-8')
+        with open(f'{filepath}.tmp', 'wb') as f:
+            f.write(HEADER.pack(
+                MAGIC, INDEX_VERSION, len(self.starts), len(self.owner_offsets) - 1, len(self.owner_values), len(names)
+            ))
+            for values in (self.starts, self.owner_ids, self.owner_offsets, self.owner_values):
+                f.write(_little_endian(values).tobytes())
+            f.write(names)
+        os.replace(f'{filepath}.tmp', filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'NumberIndex':
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        magic, version, segments, owners, owner_values, names_size = HEADER.unpack_from(content)
+        if magic != MAGIC or version != INDEX_VERSION:
+            raise ValueError(f'{filepath} is not a version {INDEX_VERSION} number index')
+        arrays = []
+        offset = HEADER.size
+        for typecode, size in (('q', segments), ('i', segments), ('i', owners + 1), ('i', owner_values)):
+            values = array(typecode)
+            values.frombytes(content[offset:offset + size * values.itemsize])
+            arrays.append(_little_endian(values))
+            offset += size * values.itemsize
+        names = json.loads(content[offset:offset + names_size].decode('utf-8'))
+        return cls(*arrays, names)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+def _owner_values(rows: List[Tuple], active: set) -> Tuple[int, ...]:
+    assignees, sub_assignees, wholesaler = [], [], -1
+    for row_id in sorted(active):
+        sub_assigned, operator_id, wholesaler_id = rows[row_id]
+        if sub_assigned:
+            sub_assignees.append(operator_id)
+            # Sub-assigned numbers are operated by the block owner
+            wholesaler = wholesaler_id if wholesaler < 0 else wholesaler
+        else:
+            assignees.append(operator_id)
+    assignees = list(dict.fromkeys(assignees))
+    return (len(assignees), *assignees, *dict.fromkeys(sub_assignees), wholesaler)
+
+
+def _little_endian(values: array) -> array:
+    # Index files are little-endian, swap a copy on big-endian machines.
+    if sys.byteorder == 'little':
+        return values
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m backend.number_index')
+    parser.add_argument('index', nargs='+', help='index files written by backend.preprocess_data --number-index')
+    parser.add_argument('--number', action='append', required=True, help='9 digits number to look up')
+    args = parser.parse_args(argv)
+
+    indexes = [NumberIndex.load(filepath) for filepath in args.index]
+    for number in args.number:
+        owners = None
+        for index in indexes:
+            owners = index.lookup(int(number))
+            if owners:
+                break
+        print(f'{number}: {json.dumps(owners, ensure_ascii=False)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
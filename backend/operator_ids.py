@@ -0,0 +1,42 @@
+import json
+import os
+from typing import Dict
+
+REGISTRY_VERSION = 1
+
+
+def load(filepath: str, operators_js: str = None) -> Dict[str, str]:
+    # Operator name → ID given by previous runs, retired operators included.
+    # Without a registry yet, IDs are taken from the operators file published
+    # last time (operators_js), so clients' cached files stay valid.
+    try:
+        with open(filepath, encoding='utf-8') as f:
+            registry = json.load(f)
+        if registry.get('version') == REGISTRY_VERSION:
+            return registry['operators']
+    except Exception:
+        pass
+    return _from_operators_js(operators_js) if operators_js else {}
+
+
+def save(filepath: str, ids: Dict[str, str]):
+    with open(f'{filepath}.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': REGISTRY_VERSION, 'operators': ids}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(f'{filepath}.tmp', filepath)
+
+
+def merge(ids: Dict[str, str], operators: Dict) -> Dict[str, str]:
+    merged = dict(ids)
+    merged.update((operator['name'], _id) for _id, operator in operators.items())
+    return merged
+
+
+def _from_operators_js(filepath: str) -> Dict[str, str]:
+    # "landlineOperators = {...}" as written by preprocess_data._export_operators()
+    try:
+        with open(filepath, encoding='utf-8') as f:
+            content = f.read()
+        operators = json.loads(content[content.index('=') + 1:])
+    except Exception:
+        return {}
+    return {operator['name']: _id for _id, operator in operators.items()}
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import pickle
+from typing import (
+    List,
+    Optional,
+)
+from zipfile import ZipFile
+
+CACHE_EXTENSION = '.pickle'
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def source_key(filepath: str, parser_version: str, archive: str = None) -> Optional[str]:
+    # Content address of a CNMC source file (or archive member) for a parser version.
+    digest = hashlib.blake2b(f'{parser_version}:'.encode('utf-8'))
+    try:
+        if archive:
+            with ZipFile(archive, 'r') as zipObj, zipObj.open(os.path.basename(filepath)) as f:
+                _update_digest(digest, f)
+        else:
+            with open(filepath, 'rb') as f:
+                _update_digest(digest, f)
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+def load(cache_dir: str, key: str) -> Optional[List]:
+    path = _entry_path(cache_dir, key)
+    try:
+        with open(path, 'rb') as f:
+            registries = pickle.load(f)
+        os.utime(path)
+    except Exception:
+        return None
+    return registries
+
+
+def store(cache_dir: str, key: str, registries: List, max_bytes: int):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(cache_dir, key)
+    with open(f'{path}.tmp', 'wb') as f:
+        pickle.dump(registries, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{path}.tmp', path)
+    _evict(cache_dir, max_bytes, keep=path)
+
+
+def _update_digest(digest, f):
+    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+
+
+def _entry_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f'{key}{CACHE_EXTENSION}')
+
+
+def _evict(cache_dir: str, max_bytes: int, keep: str):
+    # Least recently used entries go first, the entry just written is never evicted.
+    entries = []
+    for filename in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, filename)
+        if filename.endswith(CACHE_EXTENSION) and path != keep:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = os.path.getsize(keep) + sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.unlink(path)
+        total -= size
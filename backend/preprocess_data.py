@@ -1,265 +1,786 @@
+import argparse
+import hashlib
 import json
 import os
 import requests
+import shutil
 import sys
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from datetime import (
     date,
     datetime,
 )
+from email.utils import parsedate_to_datetime
 from typing import (
     Dict,
-    Iterable,
     List,
 )
 from zipfile import ZipFile
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend import (
+    binary_dataset,
+    clusters,
+    delta,
+    incremental,
+    instrumentation,
+    json_stream,
+    layout,
+    number_index,
+    operator_ids,
+    parse_cache,
+    release_archive,
+    shards,
+    sqlite_sink,
+    static_assets,
+)
+from backend.registries import (
+    LANDLINE_FILE,
+    MOBILE_FILE,
+    Registry,
+    RegistryColumns,
+    build_dataset,
+    parse_lines,
+    read_csv_lines,
+    registry_values,
+)
+
 BD_URL = 'https://numeracionyoperadores.cnmc.es/bd-num.zip'
 USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:88.0) Gecko/20100101 Firefox/88.0'
 TMP_DIR = '/tmp'
 BD_FILE = 'bd-num.zip'
-LANDLINE_FILE = 'geograficos.txt'
-MOBILE_FILE = 'moviles.txt'
+BD_METADATA_FILE = 'bd-num.meta.json'
 OUTPUT_DIR = 'ui/data'
 LANDLINE_OPERATORS_FILE = 'landline_operators.js'
 MOBILE_OPERATORS_FILE = 'mobile_operators.js'
+OPERATOR_IDS_FILE = '{market}_operator_ids.json'
 DATASET_FILE = 'dataset.js'
-
-
-def run():
-
-    if _db_is_outdated(filepath=f'{TMP_DIR}/{LANDLINE_FILE}'):
-        _download_bd(BD_URL)
-
-    landline_registries = _load_file(f'{TMP_DIR}/{LANDLINE_FILE}')
-    mobile_registries = _load_file(f'{TMP_DIR}/{MOBILE_FILE}')
-    print(f'Readed {len(landline_registries)} landline registries')
-    print(f'Readed {len(mobile_registries)} mobile registries')
-
-    if not landline_registries or not mobile_registries:
-        return 1
-
-    landline_operators = _get_operators(registries=landline_registries)
-    mobile_operators = _get_operators(registries=mobile_registries)
-    _export_operators(
-        'landlineOperators',
-        f'{OUTPUT_DIR}/{LANDLINE_OPERATORS_FILE}',
-        landline_operators
+BINARY_DATASET_FILE = 'dataset.bin'
+LAYOUT_FILE = 'layout.js'
+CLUSTERS_FILE = 'clusters.js'
+INDEX_HTML = 'ui/index.html'
+SHARDS_DIR = 'shards'
+DATASET_FORMATS = ('json', 'shards', 'delta', 'binary')
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+HTTP_RETRIES = 3
+HTTP_TIMEOUT = 60
+PARSER_VERSION = '1'
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PIPELINE_WORKERS = 2
+REPORT_ENV = 'PREPROCESS_DATA_REPORT'
+NUMBER_INDEX_EXTENSION = 'numidx'
+
+# Kept by run(warm=True) for next runs of this process:
+# {market: {'source': source_key, 'registries': [...], 'state': previous dataset state}}
+_warm_markets = {}
+
+
+def run(from_zip: bool = False, session: requests.Session = None, parse_cache_dir: str = None,
+        state_dir: str = None, full_rebuild: bool = False, workers: int = None, dataset_format: str = 'json',
+        precompress: bool = False, hashed_names: bool = False, report_file: str = None,
+        number_index_dir: str = None, sqlite_path: str = None, sqlite_datasets: bool = False,
+        archive_dir: str = None, as_of: str = None, graph_layout: bool = False, cluster_top: int = None,
+        output_dir: str = None, warm: bool = False):
+    # from_zip: keep the downloaded archive and parse its members directly
+    # session: HTTP session to reuse between runs, a new one is used otherwise
+    # parse_cache_dir: reuse registries parsed from identical source files
+    # state_dir: keep this run's registries and datasets to patch them next time, and the
+    #   operator ID registries (TMP_DIR otherwise)
+    # full_rebuild: ignore the state kept in state_dir and build datasets from scratch
+    # workers: processes for landline and mobile pipelines (PIPELINE_WORKERS), 1 runs them serially
+    # dataset_format: one of DATASET_FORMATS, see _export()
+    # precompress: write .gz/.br sidecars for nginx gzip_static/brotli_static
+    # hashed_names: publish scripts under content hashed names and point INDEX_HTML at them
+    # report_file: write stage timings and memory as JSON (REPORT_ENV environment variable otherwise)
+    # number_index_dir: save {market}.numidx number to operator lookup indexes there
+    # sqlite_path: load registries and operators into this SQLite database
+    # sqlite_datasets: build datasets from SQL aggregates over sqlite_path
+    # archive_dir: keep every downloaded release there, see release_archive
+    # as_of: build outputs from the release archived on that date (YYYY-MM-DD) instead of downloading,
+    #   into an output_dir other than OUTPUT_DIR. state_dir and operator IDs are left as they are.
+    # graph_layout: precompute node positions of every year into LAYOUT_FILE (requires NumPy)
+    # cluster_top: keep that many operators per year in CLUSTERS_FILE and fold the rest, see clusters.summarize()
+    # output_dir: write exported files there instead of OUTPUT_DIR
+    # warm: keep registries and datasets in memory to reuse them on next runs of this process,
+    #   pipelines run serially then (see daemon)
+    output_dir = output_dir or OUTPUT_DIR
+    if as_of and os.path.abspath(output_dir) == os.path.abspath(OUTPUT_DIR):
+        raise ValueError(f'Outputs as of {as_of} would replace the published ones in {OUTPUT_DIR}')
+    os.makedirs(output_dir, exist_ok=True)
+    report_file = report_file or os.environ.get(REPORT_ENV)
+    pipeline_options = {
+        'archive': f'{TMP_DIR}/{BD_FILE}' if from_zip else None,
+        'parse_cache_dir': parse_cache_dir,
+        'state_dir': None if as_of else state_dir,
+        'full_rebuild': full_rebuild,
+        'number_index_dir': number_index_dir,
+        'sqlite_path': sqlite_path,
+        'sqlite_datasets': sqlite_datasets,
+        'archive_dir': archive_dir,
+        'as_of': as_of,
+        'graph_layout': graph_layout,
+        'cluster_top': cluster_top,
+        'warm': warm,
+        'instrument': bool(report_file),
+    }
+    started = datetime.now()
+    exit_code = 1
+    with instrumentation.recording(enabled=bool(report_file)) as stages:
+        try:
+            exit_code = _run(
+                from_zip, session, 1 if warm else workers, dataset_format, precompress, hashed_names,
+                output_dir, state_dir or TMP_DIR, pipeline_options
+            )
+        finally:
+            if report_file:
+                instrumentation.write_report(report_file, stages, started, exit_code)
+    return exit_code
+
+
+def _run(from_zip: bool, session: requests.Session, workers: int, dataset_format: str, precompress: bool,
+         hashed_names: bool, output_dir: str, operator_ids_dir: str, pipeline_options: Dict) -> int:
+    archive = pipeline_options['archive']
+    archive_dir = pipeline_options['archive_dir']
+
+    if not pipeline_options['as_of']:
+        http_session = session or _http_session()
+        try:
+            with instrumentation.stage('freshness'):
+                outdated = _db_is_outdated(filepath=archive or f'{TMP_DIR}/{LANDLINE_FILE}', session=http_session)
+            if outdated:
+                with instrumentation.stage('download'):
+                    _download_bd(BD_URL, extract=not from_zip, session=http_session)
+        finally:
+            if session is None:
+                http_session.close()
+
+    # Operators keep the IDs given by previous runs, new ones are appended. Registries
+    # are internal state, they're kept out of output_dir so they aren't published.
+    known_ids = {
+        market: operator_ids.load(
+            _operator_ids_path(operator_ids_dir, market), operators_js=f'{output_dir}/{operators_file}'
+        )
+        for market, operators_file in (('landline', LANDLINE_OPERATORS_FILE), ('mobile', MOBILE_OPERATORS_FILE))
+    }
+    landline, mobile = _run_market_pipelines(
+        [
+            {
+                'market': 'landline',
+                'filepath': f'{TMP_DIR}/{LANDLINE_FILE}',
+                'known_ids': known_ids['landline'],
+                **pipeline_options
+            },
+            {
+                'market': 'mobile',
+                'filepath': f'{TMP_DIR}/{MOBILE_FILE}',
+                'known_ids': known_ids['mobile'],
+                **pipeline_options
+            },
+        ],
+        workers=PIPELINE_WORKERS if workers is None else workers
     )
-    _export_operators(
-        'mobileOperators',
-        f'{OUTPUT_DIR}/{MOBILE_OPERATORS_FILE}',
-        mobile_operators
-    )
-
-    landline_operators_by_name = {}
-    for _id, operator in landline_operators.items():
-        landline_operators_by_name[operator['name']] = _id
+    instrumentation.extend(landline.get('stages', []) + mobile.get('stages', []))
+    print(f'Readed {landline["registries"]} landline registries')
+    print(f'Readed {mobile["registries"]} mobile registries')
 
-    mobile_operators_by_name = {}
-    for _id, operator in mobile_operators.items():
-        mobile_operators_by_name[operator['name']] = _id
+    if not landline['registries'] or not mobile['registries']:
+        return 1
 
-    landline_dataset = _build_dataset(landline_registries, landline_operators_by_name)
-    mobile_dataset = _build_dataset(mobile_registries, mobile_operators_by_name)
-    _export(landline_dataset, mobile_dataset)
+    # Only releases that could be parsed are archived
+    if archive_dir and not pipeline_options['as_of']:
+        with instrumentation.stage('archive'):
+            release = release_archive.archive_release(
+                archive_dir,
+                _release_date(),
+                {'landline': f'{TMP_DIR}/{LANDLINE_FILE}', 'mobile': f'{TMP_DIR}/{MOBILE_FILE}'},
+                archive=archive
+            )
+        print(f'Archived release {release}' if release else 'Release already archived')
+
+    # Historical operators (as_of) don't take IDs in the live registry
+    if not pipeline_options['as_of']:
+        os.makedirs(operator_ids_dir, exist_ok=True)
+        for market, result in (('landline', landline), ('mobile', mobile)):
+            operator_ids.save(
+                _operator_ids_path(operator_ids_dir, market), operator_ids.merge(known_ids[market], result['operators'])
+            )
+
+    with instrumentation.stage('export_operators', rows_in=len(landline['operators']) + len(mobile['operators'])):
+        _export_operators(
+            'landlineOperators',
+            f'{output_dir}/{LANDLINE_OPERATORS_FILE}',
+            landline['operators']
+        )
+        _export_operators(
+            'mobileOperators',
+            f'{output_dir}/{MOBILE_OPERATORS_FILE}',
+            mobile['operators']
+        )
+    with instrumentation.stage('export', rows_in=len(landline['dataset']) + len(mobile['dataset'])):
+        _export(landline['dataset'], mobile['dataset'], dataset_format=dataset_format, output_dir=output_dir)
+        _export_by_market(f'{output_dir}/{LAYOUT_FILE}', 'Layout', landline.get('layout'), mobile.get('layout'))
+        _export_by_market(
+            f'{output_dir}/{CLUSTERS_FILE}', 'Clusters', landline.get('clusters'), mobile.get('clusters')
+        )
+    # Also without precompress or hashed_names, so files from previous runs in
+    # those modes aren't served instead of the new ones
+    with instrumentation.stage('publish'):
+        _publish_static(dataset_format, precompress, hashed_names, output_dir)
 
     return 0
 
 
-def _download_bd(url: str):
+def _operator_ids_path(operator_ids_dir: str, market: str) -> str:
+    return f'{operator_ids_dir}/{OPERATOR_IDS_FILE.format(market=market)}'
+
+
+def _run_market_pipelines(jobs: List[Dict], workers: int) -> List[Dict]:
+    # Markets share no state, so their pipelines run in separate processes. Errors
+    # raised by a pipeline are raised again here by Future.result().
+    if workers > 1:
+        try:
+            executor = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        except (NotImplementedError, OSError):
+            print('_run_market_pipelines() - Process pool not available, running serially')
+        else:
+            with executor:
+                futures = [executor.submit(_market_pipeline, **job) for job in jobs]
+                return [future.result() for future in futures]
+    return [_market_pipeline(**job) for job in jobs]
+
+
+def _market_pipeline(market: str, filepath: str, known_ids: Dict = None, archive: str = None, parse_cache_dir: str = None,
+                     state_dir: str = None, full_rebuild: bool = False, number_index_dir: str = None,
+                     sqlite_path: str = None, sqlite_datasets: bool = False, archive_dir: str = None,
+                     as_of: str = None, graph_layout: bool = False, cluster_top: int = None,
+                     warm: bool = False, instrument: bool = False) -> Dict:
+    # Stages are recorded here and sent back with the results, pipelines may
+    # run in another process.
+    with instrumentation.recording(enabled=instrument, market=market) as stages:
+        if as_of:
+            registries = release_archive.registries_at(archive_dir, market, as_of)
+        elif warm:
+            registries = _warm_registries(market, filepath, archive=archive, cache_dir=parse_cache_dir)
+        else:
+            registries = _load_file(filepath, archive=archive, cache_dir=parse_cache_dir)
+        if not registries:
+            return {'registries': 0, 'operators': {}, 'dataset': {}, 'stages': stages}
+
+        with instrumentation.stage('operators', rows_in=len(registries)) as record:
+            operators = _get_operators(registries=registries, known_ids=known_ids)
+            operators_by_name = {}
+            for _id, operator in operators.items():
+                operators_by_name[operator['name']] = _id
+            record['rows_out'] = len(operators)
+        connection = sqlite_sink.connect(sqlite_path) if sqlite_path else None
+        try:
+            if connection:
+                with instrumentation.stage('sqlite', rows_in=len(registries)):
+                    sqlite_sink.store_market(connection, market, registries, operators)
+            with instrumentation.stage('dataset', rows_in=len(registries)) as record:
+                if connection and sqlite_datasets:
+                    dataset = sqlite_sink.build_dataset(connection, market)
+                else:
+                    dataset = _build_market_dataset(
+                        market, registries, operators_by_name, state_dir, full_rebuild, warm=warm
+                    )
+                record['rows_out'] = len(dataset)
+        finally:
+            if connection:
+                connection.close()
+        if number_index_dir:
+            with instrumentation.stage('number_index', rows_in=len(registries)) as record:
+                index = number_index.NumberIndex.from_registries(registries)
+                os.makedirs(number_index_dir, exist_ok=True)
+                index.save(f'{number_index_dir}/{market}.{NUMBER_INDEX_EXTENSION}')
+                record['rows_out'] = len(index)
+        positions = None
+        if graph_layout:
+            with instrumentation.stage('layout', rows_in=len(dataset)) as record:
+                positions = layout.compute(dataset)
+                if positions is None:
+                    print(f'NumPy is not installed, {market} graph layout skipped')
+                record['rows_out'] = len(positions or {})
+        summary = None
+        if cluster_top:
+            with instrumentation.stage('clusters', rows_in=len(dataset)) as record:
+                summary = clusters.summarize(dataset, top=cluster_top)
+                record['rows_out'] = len(summary)
+
+    return {
+        'registries': len(registries),
+        'operators': operators,
+        'dataset': dataset,
+        'layout': positions,
+        'clusters': summary,
+        'stages': stages
+    }
+
+
+def _http_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+    # The last response is returned once retries run out, callers check its status
+    adapter = HTTPAdapter(max_retries=Retry(
+        total=HTTP_RETRIES, backoff_factor=1, status_forcelist=(500, 502, 503, 504), raise_on_status=False
+    ))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _download_bd(url: str, extract: bool = True, session: requests.Session = None):
     print(f'Dowloading (with {str(requests)}): {url}')
-    response = requests.get(
-        url,
-        headers={'User-Agent': USER_AGENT},
-        allow_redirects=True
-    )
+    zip_tmp_path = f'{TMP_DIR}/{BD_FILE}'
+    cached_files = (LANDLINE_FILE, MOBILE_FILE) if extract else (BD_FILE, )
+    metadata = {}
+    if all(os.path.isfile(f'{TMP_DIR}/{filename}') for filename in cached_files):
+        metadata = _read_bd_metadata()
     try:
-        zip_tmp_path = f'{TMP_DIR}/{BD_FILE}'
-        with open(zip_tmp_path, 'wb') as f:
-            f.write(response.content)
-        with ZipFile(zip_tmp_path, 'r') as zipObj:
-            zipObj.extractall(path=TMP_DIR, members=(LANDLINE_FILE, MOBILE_FILE))
+        response = (session or requests).get(
+            url,
+            headers={'User-Agent': USER_AGENT, **_conditional_headers(metadata)},
+            allow_redirects=True,
+            stream=True,
+            timeout=HTTP_TIMEOUT
+        )
     except Exception:
-        print('_download_bd() - Can\'t extract DB files')
+        # Runs go on with the files downloaded before
+        print('_download_bd() - Can\'t download DB files')
+        return
+    if response.status_code == 304:
+        print('_download_bd() - DB files not modified')
+        response.close()
+        return
+    # Cached files and their metadata are only replaced by a complete archive,
+    # error pages and truncated downloads are discarded
+    part_path = f'{zip_tmp_path}.part'
+    try:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        _check_bd_archive(part_path)
+        os.replace(part_path, zip_tmp_path)
+        if extract:
+            with ZipFile(zip_tmp_path, 'r') as zipObj:
+                zipObj.extractall(path=TMP_DIR, members=(LANDLINE_FILE, MOBILE_FILE))
+        _write_bd_metadata(_bd_metadata(response))
+    except Exception:
+        print('_download_bd() - Can\'t download DB files')
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+    finally:
+        response.close()
+    if not extract:
+        return
     try:
         os.unlink(zip_tmp_path)
     except Exception:
         pass
 
 
-def _db_is_outdated(filepath: str) -> bool:
-    cdate = _db_creation_date(filepath)
-    if cdate is not None:
-        return cdate < datetime.now().date()
-    return True
+def _check_bd_archive(filepath: str):
+    with ZipFile(filepath, 'r') as archive:
+        missing = {LANDLINE_FILE, MOBILE_FILE} - set(archive.namelist())
+        if missing:
+            raise ValueError(f'{filepath} has no {", ".join(sorted(missing))}')
+        corrupt = archive.testzip()
+        if corrupt is not None:
+            raise ValueError(f'{filepath} has a corrupt {corrupt}')
 
 
-def _db_creation_date(filepath: str) -> date:
-    if os.path.exists(filepath) and os.path.isfile(filepath):
-        return datetime.fromtimestamp(os.path.getctime(filepath)).date()
-    return None
+def _bd_metadata(response: requests.Response) -> Dict:
+    return {
+        'etag': response.headers.get('ETag', ''),
+        'last_modified': response.headers.get('Last-Modified', ''),
+        'content_length': response.headers.get('Content-Length', ''),
+    }
 
 
-def _numbers_from_line(fields: List) -> Iterable:
-    index = fields[0]
-    block = fields[1]
-    sub_block = fields[3].split(' ')
-    sub_block = sub_block[1].strip() if len(sub_block) > 1 else ''
-    nmin = int(f'{index}{block}{sub_block}'.ljust(9, '0'))
-    nmax = int(f'{index}{block}{sub_block}'.ljust(9, '9'))
+def _read_bd_metadata() -> Dict:
+    try:
+        with open(f'{TMP_DIR}/{BD_METADATA_FILE}', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
-    return (index, block, sub_block, nmin, nmax)
 
+def _write_bd_metadata(metadata: Dict):
+    with open(f'{TMP_DIR}/{BD_METADATA_FILE}', 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
 
-def _date_to_iso(spanish_str_date: str) -> str:
-    dd, mm, yyyy = spanish_str_date.split('/')
-    return f'{yyyy}-{mm}-{dd}'
 
+def _conditional_headers(metadata: Dict) -> Dict:
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
 
-def _set_volumes_and_wholesaler(registries: List[Dict]):
-    block_owners = {}
-    block_shares = {}
 
-    # Volume: Count quantity of operators that shares number blocks.
-    # Wholesaler: Get owner of every number block.
-    for registry in registries:
-        _key = f'{registry["index"]}{registry["block"]}'
-        if _key not in block_owners and registry['type'] == 'asignado':
-            block_owners[_key] = registry['operator']
-        if _key not in block_shares:
-            block_shares[_key] = 0
-        block_shares[_key] += 1 if registry['type'] != 'subasignado' else 0
+def _db_is_outdated(filepath: str, session: requests.Session = None, url: str = BD_URL) -> bool:
+    # Asks the server when validators of the last download are known, otherwise
+    # (or when the server can't tell) files older than today are outdated.
+    metadata = _read_bd_metadata()
+    if session is not None and any(metadata.values()) and os.path.isfile(filepath):
+        try:
+            response = session.head(url, headers=_conditional_headers(metadata), allow_redirects=True, timeout=HTTP_TIMEOUT)
+            if response.status_code == 304:
+                return False
+            if response.status_code == 200 and any(_bd_metadata(response).values()):
+                return _bd_metadata(response) != metadata
+        except Exception:
+            print('_db_is_outdated() - Can\'t check DB freshness')
 
-    # Adjust volume for shared blocks and set wholesaler when sub-assigned range
-    for registry in registries:
-        _key = f'{registry["index"]}{registry["block"]}'
-        registry['volume'] = int(registry['volume'] / block_shares[_key])
-        if registry['type'] == 'subasignado':
-            registry['wholesaler'] = block_owners[_key]
+    cdate = _db_creation_date(filepath)
+    if cdate is not None:
+        return cdate < datetime.now().date()
+    return True
 
 
-def _read_csv_lines(filepath: str) -> List[str]:
-    lines = []
+def _release_date() -> str:
+    # Last-Modified of the downloaded database, today when the server didn't send it
     try:
-        with open(filepath, encoding='iso-8859-15') as f:
-            lines = [line.strip() for line in f.readlines()]
+        return parsedate_to_datetime(_read_bd_metadata()['last_modified']).date().isoformat()
     except Exception:
-        pass
-    return lines
-
-
-def _load_file(filepath: str) -> List[Dict]:
-    registries = []
-    lines = _read_csv_lines(filepath)
-
-    for line in lines:
-        fields = line.split('#')
-        if len(fields) != 6:
-            continue
-        if fields[3].startswith('Libre'):
-            continue
-        index, block, sub_block, nmin, nmax = _numbers_from_line(fields)
-        registries.append({
-            'operator': fields[4],
-            'wholesaler': '',
-            'date': _date_to_iso(fields[5]),
-            'index': index,
-            'block': block,
-            'sub_block': sub_block,
-            'nmin': nmin,
-            'nmax': nmax,
-            'volume': (nmax - nmin) + 1,
-            'type': fields[3].split(' ')[0].lower()
-        })
-
-    _set_volumes_and_wholesaler(registries)
-
-    return registries
+        return date.today().isoformat()
 
 
-def _get_operators(registries: List[Dict]) -> List[Dict]:
-    id = 0
-    operators = {}
-    operators_id = {}
-    for registry in registries:
-        if registry['operator'] not in operators:
-            id += 1
-            operators[registry['operator']] = {
-                'id': str(id),
-                'name': registry['operator'],
-                'date_added': registry['date'],
-            }
-            operators_id[str(id)] = registry['operator']
-        elif operators[registry['operator']]['date_added'] > registry['date']:
-            operators[registry['operator']]['date_added'] = registry['date']
-    operators_dict = {}
-    for i in range(1, len(operators) + 1):
-        operators_dict[str(i)] = operators[operators_id[str(i)]]
-
-    return operators_dict
+def _db_creation_date(filepath: str) -> date:
+    if os.path.exists(filepath) and os.path.isfile(filepath):
+        return datetime.fromtimestamp(os.path.getctime(filepath)).date()
+    return None
 
 
-def _export_operators(var_name: str, filepath: str, operators: Dict):
-    with open(filepath, mode='w', encoding='utf-8') as f:
-        content = f'{var_name} = ' + json.dumps(operators, )
-        f.write(content)
+def _load_file(filepath: str, archive: str = None, cache_dir: str = None) -> Sequence[Registry]:
+    cache_key = parse_cache.source_key(filepath, PARSER_VERSION, archive=archive) if cache_dir else None
+    if cache_key:
+        with instrumentation.stage('parse_cache') as record:
+            registries = parse_cache.load(cache_dir, cache_key)
+            record['rows_out'] = None if registries is None else len(registries)
+        if registries is not None:
+            return registries
 
+    registries = _parse_file(filepath, archive=archive)
 
-def _unique_ordered_years(registries: List[Dict]) -> List:
-    years = []
-    for registy in registries:
-        year = registy['date'].split('-')[0]
-        if year not in years:
-            years.append(year)
-    years.sort()
-    return years
+    if cache_key and registries:
+        parse_cache.store(cache_dir, cache_key, RegistryColumns.from_registries(registries), max_bytes=PARSE_CACHE_MAX_BYTES)
 
+    return registries
 
-def _operators_status_by_year(year_filter: str, registries: List[Dict], operators_by_name: Dict) -> List[Dict]:
-    operators = {}
 
-    for reg in registries:
-        year = reg['date'].split('-')[0]
-        if year > year_filter:
-            continue
+def _warm_registries(market: str, filepath: str, archive: str = None, cache_dir: str = None) -> Sequence[Registry]:
+    # Registries of the previous warm run while the source file is the same
+    source = parse_cache.source_key(filepath, PARSER_VERSION, archive=archive)
+    warm = _warm_markets.setdefault(market, {})
+    if source is not None and warm.get('source') == source:
+        return warm['registries']
+    registries = _load_file(filepath, archive=archive, cache_dir=cache_dir)
+    warm.update(source=source, registries=registries)
+    return registries
 
-        _id = operators_by_name[reg['operator']]
-        if _id not in operators:
-            operators[_id] = {'id': _id, 'volume': 0, 'links': []}
 
-        links = operators[_id]['links']
-        links.append(operators_by_name[reg['wholesaler']] if reg['wholesaler'] else '0')
-        links = list(set(links))
-        links.sort()
+def _parse_file(filepath: str, archive: str = None) -> List[Registry]:
+    return parse_lines(read_csv_lines(filepath, stream=True, archive=archive))
 
-        operators[_id]['volume'] += reg['volume']
-        operators[_id]['links'] = links
 
-    return sorted([op for _, op in operators.items()], key=lambda x: sum([int(i) for i in x['links']]))
+def _get_operators(registries: List[Dict], known_ids: Dict = None) -> List[Dict]:
+    # known_ids: operator name → ID given before, kept for those operators. New
+    # operators get the following IDs in order of first appearance.
+    known_ids = known_ids or {}
+    id = max([int(_id) for _id in known_ids.values()], default=0)
+    operators = {}
+    for operator, _date in registry_values(registries, 'operator', 'date'):
+        if operator not in operators:
+            if operator in known_ids:
+                _id = known_ids[operator]
+            else:
+                id += 1
+                _id = str(id)
+            operators[operator] = {
+                'id': _id,
+                'name': operator,
+                'date_added': _date,
+            }
+        elif operators[operator]['date_added'] > _date:
+            operators[operator]['date_added'] = _date
+    operators_dict = {}
+    for operator in sorted(operators.values(), key=lambda operator: int(operator['id'])):
+        operators_dict[operator['id']] = operator
 
+    return operators_dict
 
-def _build_dataset(registries: List[Dict], operators_by_name: Dict) -> Dict:
-    dataset = {}
-    years = [int(y) for y in _unique_ordered_years(registries)]
-    _from = min(years)
-    _to = max(years)
 
-    for year in range(_from, _to + 1):
-        _y = str(year)
-        dataset[_y] = {
-            'year': _y,
-            'operators': _operators_status_by_year(_y, registries, operators_by_name)
+def _export_operators(var_name: str, filepath: str, operators: Dict):
+    with json_stream.atomic_file(filepath) as f:
+        f.write(f'{var_name} = ')
+        json_stream.dump(operators, f)
+
+
+def _build_market_dataset(market: str, registries: Sequence, operators_by_name: Dict,
+                          state_dir: str = None, full_rebuild: bool = False, warm: bool = False) -> Dict:
+    if not state_dir and not warm:
+        return build_dataset(registries, operators_by_name)
+
+    # Warm state from memory goes first, it's the same state_dir would have
+    state_path = f'{state_dir}/{market}.state.pickle' if state_dir else None
+    previous = None
+    if not full_rebuild:
+        previous = _warm_markets.get(market, {}).get('state') if warm else None
+        if previous is None and state_path:
+            previous = incremental.load_state(state_path)
+    dataset = incremental.rebuild_dataset(registries, operators_by_name, previous)
+    if warm:
+        _warm_markets.setdefault(market, {})['state'] = {
+            'registries': registries,
+            'operators_by_name': operators_by_name,
+            'dataset': dataset,
         }
+    if state_path:
+        os.makedirs(state_dir, exist_ok=True)
+        incremental.save_state(state_path, registries, operators_by_name, dataset)
 
     return dataset
 
 
-def _export(landline_dataset, mobile_dataset):
-    with open(f'{OUTPUT_DIR}/{DATASET_FILE}', 'w', encoding='utf-8') as f:
-        sep = (',', ':')
-        f.write(f'landlineData = {json.dumps(landline_dataset, separators=sep)}; ')
-        f.write(f'mobileData = {json.dumps(mobile_dataset, separators=sep)};')
+def _export(landline_dataset, mobile_dataset, dataset_format: str = 'json', output_dir: str = None):
+    # json: every year of both markets inside dataset.js
+    # shards: one JSON file per market and year, dataset.js only has their manifest
+    # delta: dataset.js has a base year and yearly changes, see delta.encode()
+    # binary: uint32 arrays in BINARY_DATASET_FILE, see binary_dataset.encode(), dataset.js points to it
+    # Datasets are streamed year by year (depth 2), one year at a time is serialized.
+    output_dir = output_dir or OUTPUT_DIR
+    sep = (',', ':')
+    if dataset_format == 'delta':
+        with json_stream.atomic_file(f'{output_dir}/{DATASET_FILE}') as f:
+            f.write('landlineDelta = ')
+            json_stream.dump(delta.encode(landline_dataset), f, separators=sep, depth=2)
+            f.write('; mobileDelta = ')
+            json_stream.dump(delta.encode(mobile_dataset), f, separators=sep, depth=2)
+            f.write(';')
+        return
+    if dataset_format == 'binary':
+        content = binary_dataset.encode({'landline': landline_dataset, 'mobile': mobile_dataset})
+        with open(f'{output_dir}/{BINARY_DATASET_FILE}.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(f'{output_dir}/{BINARY_DATASET_FILE}.tmp', f'{output_dir}/{BINARY_DATASET_FILE}')
+        binary = {
+            'file': f'data/{BINARY_DATASET_FILE}',
+            'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        }
+        with json_stream.atomic_file(f'{output_dir}/{DATASET_FILE}') as f:
+            f.write(f'datasetBinary = {json.dumps(binary, separators=sep)};')
+        return
+    if dataset_format == 'shards':
+        manifest = shards.export(
+            f'{output_dir}/{SHARDS_DIR}',
+            f'data/{SHARDS_DIR}',
+            {'landline': landline_dataset, 'mobile': mobile_dataset}
+        )
+        with json_stream.atomic_file(f'{output_dir}/{DATASET_FILE}') as f:
+            f.write(f'datasetManifest = {json.dumps(manifest, separators=sep)};')
+        return
+
+    with json_stream.atomic_file(f'{output_dir}/{DATASET_FILE}') as f:
+        f.write('landlineData = ')
+        json_stream.dump(landline_dataset, f, separators=sep, depth=2)
+        f.write('; mobileData = ')
+        json_stream.dump(mobile_dataset, f, separators=sep, depth=2)
+        f.write(';')
+
+
+def _export_by_market(filepath: str, name: str, landline_values: Dict, mobile_values: Dict):
+    # landline{name} and mobile{name} variables, {year: ...} per market (layouts
+    # or clusters). Empty when they weren't built, so the UI falls back to the
+    # whole dataset.
+    sep = (',', ':')
+    with json_stream.atomic_file(filepath) as f:
+        f.write(f'landline{name} = ')
+        json_stream.dump(landline_values or {}, f, separators=sep)
+        f.write(f'; mobile{name} = ')
+        json_stream.dump(mobile_values or {}, f, separators=sep)
+        f.write(';')
+
+
+def _publish_static(dataset_format: str, precompress: bool, hashed_names: bool, output_dir: str):
+    published = static_assets.publish(
+        output_dir,
+        [LANDLINE_OPERATORS_FILE, MOBILE_OPERATORS_FILE, DATASET_FILE, LAYOUT_FILE, CLUSTERS_FILE],
+        # Other output dirs (daemon generations) are served behind data/ as they are
+        html_path=INDEX_HTML if output_dir == OUTPUT_DIR else None,
+        hashed=hashed_names,
+        compress=precompress
+    )
+    if precompress or hashed_names:
+        print(f'Published {", ".join(published.values())}')
+    dataset_files = []
+    if dataset_format == 'binary':
+        dataset_files.append(f'{output_dir}/{BINARY_DATASET_FILE}')
+    if dataset_format == 'shards':
+        for dirpath, _, filenames in os.walk(f'{output_dir}/{SHARDS_DIR}'):
+            dataset_files.extend(os.path.join(dirpath, filename) for filename in filenames if filename.endswith('.json'))
+    for filepath in dataset_files:
+        if precompress:
+            static_assets.precompress(filepath)
+        else:
+            static_assets.remove_sidecars(filepath)
+    _remove_unused_dataset_files(dataset_format, output_dir)
+
+
+def _remove_unused_dataset_files(dataset_format: str, output_dir: str):
+    # Files of other dataset formats left by previous runs, so they aren't
+    # published along with the current ones
+    if dataset_format != 'binary':
+        binary_path = f'{output_dir}/{BINARY_DATASET_FILE}'
+        if os.path.exists(binary_path):
+            os.unlink(binary_path)
+        static_assets.remove_sidecars(binary_path)
+    if dataset_format != 'shards':
+        shutil.rmtree(f'{output_dir}/{SHARDS_DIR}', ignore_errors=True)
+
+
+def argument_parser(prog: str = 'python -m backend.preprocess_data') -> argparse.ArgumentParser:
+    # Options of run(), also taken by backend.daemon
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument(
+        '--from-zip',
+        action='store_true',
+        help=f'parse CNMC files straight from {TMP_DIR}/{BD_FILE} instead of extracting them'
+    )
+    parser.add_argument(
+        '--parse-cache',
+        metavar='DIR',
+        help='cache parsed registries in DIR, keyed by source file contents'
+    )
+    parser.add_argument(
+        '--state-dir',
+        metavar='DIR',
+        help='keep registries, datasets and operator IDs in DIR and only rebuild what changed since last run'
+    )
+    parser.add_argument(
+        '--full-rebuild',
+        action='store_true',
+        help='build datasets from scratch even when --state-dir has a previous run'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=PIPELINE_WORKERS,
+        help=f'processes for landline and mobile pipelines, 1 runs them serially (default: {PIPELINE_WORKERS})'
+    )
+    parser.add_argument(
+        '--dataset-format',
+        choices=DATASET_FORMATS,
+        default='json',
+        help='json: whole dataset in dataset.js, shards: one file per market and year plus a manifest, '
+             'delta: yearly changes in dataset.js, binary: typed arrays in dataset.bin'
+    )
+    parser.add_argument(
+        '--precompress',
+        action='store_true',
+        help='write .gz (and .br with brotli installed) next to every exported file'
+    )
+    parser.add_argument(
+        '--number-index',
+        metavar='DIR',
+        help=f'save landline.{NUMBER_INDEX_EXTENSION} and mobile.{NUMBER_INDEX_EXTENSION} number to operator '
+             'lookup indexes in DIR, see backend.number_index'
+    )
+    parser.add_argument(
+        '--report',
+        metavar='FILE',
+        help=f'write wall time, CPU time, peak traced memory and rows of every stage to FILE as JSON '
+             f'(or set {REPORT_ENV}=FILE)'
+    )
+    parser.add_argument(
+        '--hashed-names',
+        action='store_true',
+        help=f'publish exported scripts under content hashed names and update {INDEX_HTML}'
+    )
+    parser.add_argument(
+        '--sqlite',
+        metavar='FILE',
+        help='load registries and operators into the FILE SQLite database, indexed for ad-hoc queries'
+    )
+    parser.add_argument(
+        '--dataset-from-sqlite',
+        action='store_true',
+        help='build datasets from SQL aggregates over the --sqlite database'
+    )
+    parser.add_argument(
+        '--archive',
+        metavar='DIR',
+        help='keep every downloaded CNMC release in DIR as diffs against the previous one'
+    )
+    parser.add_argument(
+        '--as-of',
+        metavar='YYYY-MM-DD',
+        help='build outputs from the last release archived on or before this date, requires --archive and '
+             '--output-dir'
+    )
+    parser.add_argument(
+        '--output-dir',
+        metavar='DIR',
+        help=f'write exported files to DIR instead of {OUTPUT_DIR}, required by --as-of'
+    )
+    parser.add_argument(
+        '--layout',
+        action='store_true',
+        help=f'precompute graph node positions of every year into {LAYOUT_FILE}, '
+             'each year starting from the previous one (requires NumPy)'
+    )
+    parser.add_argument(
+        '--clusters',
+        type=int,
+        metavar='N',
+        help=f'write a {CLUSTERS_FILE} view of every year with the N biggest operators and their wholesalers, '
+             'smaller ones folded into clusters the page expands on click'
+    )
+    return parser
+
+
+def run_options(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Dict:
+    # run() keyword arguments from parsed argument_parser() arguments
+    if args.dataset_from_sqlite and not args.sqlite:
+        parser.error('--dataset-from-sqlite requires --sqlite')
+    if args.as_of and not args.archive:
+        parser.error('--as-of requires --archive')
+    if args.as_of and (not args.output_dir or os.path.abspath(args.output_dir) == os.path.abspath(OUTPUT_DIR)):
+        parser.error(f'--as-of requires an --output-dir other than {OUTPUT_DIR}')
+    return dict(
+        from_zip=args.from_zip,
+        parse_cache_dir=args.parse_cache,
+        state_dir=args.state_dir,
+        full_rebuild=args.full_rebuild,
+        workers=args.workers,
+        dataset_format=args.dataset_format,
+        precompress=args.precompress,
+        hashed_names=args.hashed_names,
+        report_file=args.report,
+        number_index_dir=args.number_index,
+        sqlite_path=args.sqlite,
+        sqlite_datasets=args.dataset_from_sqlite,
+        archive_dir=args.archive,
+        as_of=args.as_of,
+        graph_layout=args.layout,
+        cluster_top=args.clusters,
+        output_dir=args.output_dir
+    )
+
+
+def main(argv: List[str]) -> int:
+    parser = argument_parser()
+    return run(**run_options(parser, parser.parse_args(argv)))
 
 
 if __name__ == '__main__':
-    sys.exit(run())
+    # Run the importable module, so pipelines sent to worker processes and warm
+    # state belong to backend.preprocess_data instead of a __main__ copy.
+    from backend import preprocess_data
+    sys.exit(preprocess_data.main(sys.argv[1:]))
@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import unquote
+
+from backend import (
+    incremental,
+    preprocess_data,
+)
+from backend.number_index import NumberIndex
+
+MARKETS = ('landline', 'mobile')
+CACHE_SIZE = 1024
+RELOAD_INTERVAL = 5.0
+MAX_REQUEST_LINE = 8 * 1024
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class NotFound(Exception):
+    pass
+
+
+class ResponseCache:
+    # Serialized responses by path, the least recently used goes away when full.
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        response = self._entries.get(key)
+        if response is not None:
+            self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: Tuple[int, bytes]):
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class QueryService:
+    # Answers JSON queries from the state kept by preprocess_data --state-dir
+    # (registries, operator IDs and datasets of every market) and, when given,
+    # number indexes saved by --number-index. Changed files are loaded again
+    # in a worker thread and replace the served data at once.
+    #   GET /markets/<market>/years/<year>          operators status of a year
+    #   GET /markets/<market>/operators/<id>        an operator's yearly history
+    #   GET /numbers/<number>                       owners of a number
+    #   GET /status                                 loaded data generation
+
+    def __init__(self, state_dir: str, number_index_dir: str = None, cache_size: int = CACHE_SIZE,
+                 reload_interval: float = RELOAD_INTERVAL):
+        self.state_dir = state_dir
+        self.number_index_dir = number_index_dir
+        self.reload_interval = reload_interval
+        self.cache = ResponseCache(cache_size)
+        self.generation = 0
+        self._data = {}
+        self._versions = None
+        self._server = None
+        self._reloader = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[str, int]:
+        await self.reload_if_changed()
+        self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_REQUEST_LINE)
+        if self.reload_interval:
+            self._reloader = asyncio.ensure_future(self._reload_periodically())
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._reloader:
+            self._reloader.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def reload_if_changed(self) -> bool:
+        versions = self._file_versions()
+        if versions == self._versions:
+            return False
+        data = await asyncio.get_running_loop().run_in_executor(None, self._load)
+        self._data, self._versions = data, versions
+        self.generation += 1
+        self.cache.clear()
+        print(f'QueryService - Loaded generation {self.generation} ({", ".join(sorted(data)) or "no data"})')
+        return True
+
+    def query(self, path: str) -> Tuple[int, bytes]:
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['status']:
+            # Never cached, it reports the current state
+            return 200, _json_body(self._status())
+        response = self.cache.get(path)
+        if response is None:
+            try:
+                status, body = 200, self._answer(parts)
+            except NotFound as e:
+                status, body = 404, {'error': str(e)}
+            response = (status, _json_body(body))
+            self.cache.put(path, response)
+        return response
+
+    def _status(self) -> Dict:
+        return {'generation': self.generation, 'markets': sorted(self._data), 'cached_responses': len(self.cache)}
+
+    def _answer(self, parts: List[str]):
+        data = self._data
+        if len(parts) == 2 and parts[0] == 'numbers':
+            return self._number_owners(parts[1])
+        if len(parts) == 4 and parts[0] == 'markets' and parts[1] in data:
+            market = data[parts[1]]
+            if parts[2] == 'years' and parts[3] in market['dataset']:
+                return {
+                    'year': parts[3],
+                    'operators': [
+                        {**status, 'name': market['names'].get(status['id'], '')}
+                        for status in market['dataset'][parts[3]]['operators']
+                    ],
+                }
+            if parts[2] == 'operators' and parts[3] in market['names']:
+                return {
+                    'id': parts[3],
+                    'name': market['names'][parts[3]],
+                    'years': [
+                        {'year': _y, **status}
+                        for _y, year_status in market['dataset'].items()
+                        for status in year_status['operators'] if status['id'] == parts[3]
+                    ],
+                }
+        raise NotFound('/'.join(parts))
+
+    def _number_owners(self, number: str) -> Dict:
+        if not (number.isdigit() and len(number) == 9):
+            raise NotFound(f'numbers/{number}')
+        for market, data in self._data.items():
+            owners = data['number_index'].lookup(int(number))
+            if owners:
+                return {'number': number, 'market': market, **owners}
+        raise NotFound(f'numbers/{number}')
+
+    def _load(self) -> Dict:
+        data = {}
+        for market in MARKETS:
+            state = incremental.load_state(self._state_path(market))
+            if not state:
+                continue
+            index_path = self._index_path(market)
+            data[market] = {
+                'dataset': state['dataset'],
+                'names': {_id: name for name, _id in state['operators_by_name'].items()},
+                'number_index': (
+                    NumberIndex.load(index_path) if index_path and os.path.exists(index_path)
+                    else NumberIndex.from_registries(state['registries'])
+                ),
+            }
+        return data
+
+    def _file_versions(self) -> Tuple:
+        versions = []
+        for market in MARKETS:
+            for filepath in (self._state_path(market), self._index_path(market)):
+                try:
+                    stat = os.stat(filepath)
+                    versions.append((stat.st_mtime_ns, stat.st_size))
+                except (OSError, TypeError):
+                    versions.append(None)
+        return tuple(versions)
+
+    def _state_path(self, market: str) -> str:
+        return f'{self.state_dir}/{market}.state.pickle'
+
+    def _index_path(self, market: str) -> Optional[str]:
+        if not self.number_index_dir:
+            return None
+        return f'{self.number_index_dir}/{market}.{preprocess_data.NUMBER_INDEX_EXTENSION}'
+
+    async def _reload_periodically(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                # Files may be half written, keep serving the loaded data
+                print(f'QueryService - Reload failed: {e}')
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method = None
+            try:
+                request_line = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass  # Headers are not used
+            except (ValueError, asyncio.LimitOverrunError):
+                # Lines longer than the reader limit (MAX_REQUEST_LINE)
+                request_line = b''
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3 or len(request_line) > MAX_REQUEST_LINE:
+                status, body = 400, b'{"error":"bad request"}'
+            elif parts[0] not in ('GET', 'HEAD'):
+                status, body = 405, b'{"error":"method not allowed"}'
+            else:
+                method = parts[0]
+                status, body = self.query(parts[1].split('?')[0])
+            writer.write(
+                f'HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n'
+                f'Content-Type: application/json; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1')
+            )
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _json_body(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+async def _serve(service: QueryService, host: str, port: int):
+    host, port = await service.start(host, port)
+    print(f'QueryService - Listening on http://{host}:{port} ({datetime.now().isoformat(timespec="seconds")})')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m backend.query_service')
+    parser.add_argument('--state-dir', required=True, help='directory given to backend.preprocess_data --state-dir')
+    parser.add_argument('--number-index', metavar='DIR', help='directory given to backend.preprocess_data --number-index')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='cached responses (default: %(default)s)')
+    parser.add_argument(
+        '--reload-interval',
+        type=float,
+        default=RELOAD_INTERVAL,
+        help='seconds between checks for regenerated data, 0 disables reloading (default: %(default)s)'
+    )
+    args = parser.parse_args(argv)
+    service = QueryService(args.state_dir, args.number_index, args.cache_size, args.reload_interval)
+    try:
+        asyncio.run(_serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
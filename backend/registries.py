@@ -0,0 +1,395 @@
+import io
+import os
+import sys
+from collections.abc import (
+    Mapping,
+    Sequence,
+)
+from operator import (
+    attrgetter,
+    itemgetter,
+)
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+)
+from zipfile import ZipFile
+
+from backend import instrumentation
+
+try:
+    import numpy as np
+except ImportError:  # Optional, pure Python parsing is used without it
+    np = None
+
+# CNMC numbering files, inside its bd-num.zip archive
+LANDLINE_FILE = 'geograficos.txt'
+MOBILE_FILE = 'moviles.txt'
+
+
+class Registry(Mapping):
+    # Compact, read/write mapping view of a numbering registry. Slots avoid a
+    # per-row dict and repeated strings (operators, dates, types) are interned.
+    __slots__ = ('operator', 'wholesaler', 'date', 'index', 'block', 'sub_block', 'nmin', 'nmax', 'volume', 'type')
+
+    def __init__(self, operator: str, wholesaler: str, date: str, index: str, block: str,
+                 sub_block: str, nmin: int, nmax: int, volume: int, type: str):
+        self.operator = sys.intern(operator)
+        self.wholesaler = sys.intern(wholesaler)
+        self.date = sys.intern(date)
+        self.index = sys.intern(index)
+        self.block = sys.intern(block)
+        self.sub_block = sys.intern(sub_block)
+        self.nmin = nmin
+        self.nmax = nmax
+        self.volume = volume
+        self.type = sys.intern(type)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __reduce__(self):
+        return (Registry, tuple(getattr(self, key) for key in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f'Registry({dict(self)!r})'
+
+
+class RegistryColumns(Sequence):
+    # Read-only columnar store of registries (one list per Registry field), used
+    # where rows are only scanned. Indexing it builds Registry records on demand.
+    __slots__ = ('_columns', )
+
+    def __init__(self, columns: Dict[str, List]):
+        self._columns = columns
+
+    @classmethod
+    def from_registries(cls, registries: Sequence) -> 'RegistryColumns':
+        keys = Registry.__slots__
+        values = list(zip(*registry_values(registries, *keys))) or [()] * len(keys)
+        return cls({key: list(column) for key, column in zip(keys, values)})
+
+    def column(self, key: str) -> List:
+        return self._columns[key]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        return Registry(*(self._columns[key][position] for key in Registry.__slots__))
+
+    def __len__(self) -> int:
+        return len(self._columns['operator'])
+
+    def __reduce__(self):
+        return (RegistryColumns, (self._columns, ))
+
+
+def registry_values(registries: Sequence, *keys: str) -> Iterable:
+    # Values of keys for every registry: one value per registry for a single key,
+    # tuples otherwise. Columns are zipped, records read through slots, dicts by key.
+    if isinstance(registries, RegistryColumns):
+        columns = [registries.column(key) for key in keys]
+        return iter(columns[0]) if len(columns) == 1 else zip(*columns)
+    if registries and isinstance(registries[0], Registry):
+        return map(attrgetter(*keys), registries)
+    return map(itemgetter(*keys), registries)
+
+
+def _numbers_from_line(fields: List) -> Iterable:
+    index = fields[0]
+    block = fields[1]
+    sub_block = fields[3].split(' ')
+    sub_block = sub_block[1].strip() if len(sub_block) > 1 else ''
+    nmin = int(f'{index}{block}{sub_block}'.ljust(9, '0'))
+    nmax = int(f'{index}{block}{sub_block}'.ljust(9, '9'))
+
+    return (index, block, sub_block, nmin, nmax)
+
+
+def _date_to_iso(spanish_str_date: str) -> str:
+    dd, mm, yyyy = spanish_str_date.split('/')
+    return f'{yyyy}-{mm}-{dd}'
+
+
+def _set_volumes_and_wholesaler(registries: List[Dict]):
+    block_owners = {}
+    block_shares = {}
+    block_rows = []
+
+    # Volume: Count quantity of operators that shares number blocks.
+    # Wholesaler: Get owner of every number block.
+    for index, block, _type, operator, volume in registry_values(registries, 'index', 'block', 'type', 'operator', 'volume'):
+        _key = f'{index}{block}'
+        block_rows.append((_key, _type, volume))
+        if _key not in block_owners and _type == 'asignado':
+            block_owners[_key] = operator
+        if _key not in block_shares:
+            block_shares[_key] = 0
+        block_shares[_key] += 1 if _type != 'subasignado' else 0
+
+    # Adjust volume for shared blocks and set wholesaler when sub-assigned range
+    for registry, (_key, _type, volume) in zip(registries, block_rows):
+        registry['volume'] = int(volume / block_shares[_key])
+        if _type == 'subasignado':
+            registry['wholesaler'] = block_owners[_key]
+
+
+def _iter_csv_lines(filepath: str) -> Iterator[str]:
+    try:
+        with open(filepath, encoding='iso-8859-15') as f:
+            for line in f:
+                yield line.strip()
+    except Exception:
+        pass
+
+
+def _iter_zip_lines(archive: str, member: str) -> Iterator[str]:
+    try:
+        with ZipFile(archive, 'r') as zipObj, zipObj.open(member) as raw:
+            with io.TextIOWrapper(raw, encoding='iso-8859-15') as f:
+                for line in f:
+                    yield line.strip()
+    except Exception:
+        pass
+
+
+def read_csv_lines(filepath: str, stream: bool = False, archive: str = None) -> Iterable[str]:
+    # archive: read the file named like filepath from this ZIP instead of disk
+    if archive:
+        lines = _iter_zip_lines(archive, os.path.basename(filepath))
+    else:
+        lines = _iter_csv_lines(filepath)
+    return lines if stream else list(lines)
+
+
+def _iter_fields(lines: Iterable[str]) -> Iterator[List[str]]:
+    for line in lines:
+        fields = line.split('#')
+        if len(fields) != 6:
+            continue
+        if fields[3].startswith('Libre'):
+            continue
+        yield fields
+
+
+def _registry_from_fields(fields: List[str]) -> Registry:
+    index, block, sub_block, nmin, nmax = _numbers_from_line(fields)
+    return Registry(
+        fields[4],
+        '',
+        _date_to_iso(fields[5]),
+        index,
+        block,
+        sub_block,
+        nmin,
+        nmax,
+        (nmax - nmin) + 1,
+        fields[3].split(' ')[0].lower()
+    )
+
+
+def _iter_registries(lines: Iterable[str]) -> Iterator[Registry]:
+    for fields in _iter_fields(lines):
+        yield _registry_from_fields(fields)
+
+
+def _vectorized_registries(indexes: List[str], blocks: List[str], kinds: List[str],
+                           operators: List[str], dates: List[str]) -> List[Registry]:
+    # Same results as _numbers_from_line() + _set_volumes_and_wholesaler(), computed
+    # over whole columns. Returns None when the pure Python path must decide (it
+    # raises the same errors for malformed numbers or blocks without owner).
+    # Kinds ("Subasignado 03") and dates repeat a lot, only unique values are parsed.
+    unique_kinds, kind_ids = np.unique(np.array(kinds, dtype=str), return_inverse=True)
+    unique_kinds = [kind.split(' ') for kind in unique_kinds.tolist()]
+    unique_types = np.array([kind[0].lower() for kind in unique_kinds], dtype=str)
+    unique_sub_blocks = np.array([kind[1].strip() if len(kind) > 1 else '' for kind in unique_kinds], dtype=str)
+    unique_dates, date_ids = np.unique(np.array(dates, dtype=str), return_inverse=True)
+    iso_dates = [_date_to_iso(_date) for _date in unique_dates.tolist()]
+    types_array = unique_types[kind_ids]
+    sub_blocks = unique_sub_blocks[kind_ids]
+
+    block_keys = np.char.add(np.array(indexes, dtype=str), np.array(blocks, dtype=str))
+    prefixes = np.char.add(block_keys, sub_blocks)
+    digits = np.char.str_len(prefixes)
+    if ((digits == 0) | (digits > 9)).any():
+        return None
+    try:
+        scales = np.power(10, 9 - digits, dtype=np.int64)
+        nmins = prefixes.astype(np.int64) * scales
+    except (ValueError, OverflowError):
+        return None
+
+    # Volume: Count quantity of operators that shares number blocks.
+    _, block_ids = np.unique(block_keys, return_inverse=True)
+    sub_assigned = types_array == 'subasignado'
+    shares = np.bincount(block_ids, weights=~sub_assigned)[block_ids]
+    if (shares == 0).any():
+        return None
+    volumes = (scales / shares).astype(np.int64)
+
+    # Wholesaler: Get owner of every number block.
+    assigned_rows = np.flatnonzero(types_array == 'asignado')
+    owned_blocks, first_rows = np.unique(block_ids[assigned_rows], return_index=True)
+    block_owner_rows = np.full(block_ids.max() + 1, -1, dtype=np.int64)
+    block_owner_rows[owned_blocks] = assigned_rows[first_rows]
+    owner_rows = np.where(sub_assigned, block_owner_rows[block_ids], -1)
+    if (sub_assigned & (owner_rows < 0)).any():
+        return None
+
+    return [
+        Registry(
+            operators[i],
+            operators[owner] if owner >= 0 else '',
+            iso_dates[date_id],
+            indexes[i],
+            blocks[i],
+            sub_block,
+            nmin,
+            nmin + scale - 1,
+            volume,
+            _type
+        )
+        for i, (nmin, scale, volume, owner, date_id, sub_block, _type) in enumerate(zip(
+            nmins.tolist(), scales.tolist(), volumes.tolist(), owner_rows.tolist(),
+            date_ids.tolist(), sub_blocks.tolist(), types_array.tolist()
+        ))
+    ]
+
+
+def _load_vectorized(lines: Iterable[str]) -> List[Registry]:
+    indexes, blocks, kinds, operators, dates = [], [], [], [], []
+    with instrumentation.stage('parse') as record:
+        for fields in _iter_fields(lines):
+            indexes.append(fields[0])
+            blocks.append(fields[1])
+            kinds.append(fields[3])
+            operators.append(fields[4])
+            dates.append(fields[5])
+        record['rows_out'] = len(indexes)
+    if not indexes:
+        return []
+
+    # Numbers, volumes and wholesalers are computed together over whole columns.
+    with instrumentation.stage('shares', rows_in=len(indexes)) as record:
+        registries = _vectorized_registries(indexes, blocks, kinds, operators, dates)
+        if registries is None:
+            registries = [
+                _registry_from_fields([index, block, '', kind, operator, _date])
+                for index, block, kind, operator, _date in zip(indexes, blocks, kinds, operators, dates)
+            ]
+            _set_volumes_and_wholesaler(registries)
+        record['rows_out'] = len(registries)
+    return registries
+
+
+def parse_lines(lines: Iterable[str]) -> List[Registry]:
+    if np is not None:
+        return _load_vectorized(lines)
+
+    # Lines are parsed lazily, only kept registries are held in memory
+    # since block totals need the whole file before adjusting volumes.
+    with instrumentation.stage('parse') as record:
+        registries = list(_iter_registries(lines))
+        record['rows_out'] = len(registries)
+
+    with instrumentation.stage('shares', rows_in=len(registries)) as record:
+        _set_volumes_and_wholesaler(registries)
+        record['rows_out'] = len(registries)
+
+    return registries
+
+
+def unique_ordered_years(registries: List[Dict]) -> List:
+    years = list({_date.split('-')[0] for _date in registry_values(registries, 'date')})
+    years.sort()
+    return years
+
+
+def _operators_status_by_year(year_filter: str, registries: List[Dict], operators_by_name: Dict) -> List[Dict]:
+    operators = {}
+
+    for reg in registries:
+        year = reg['date'].split('-')[0]
+        if year > year_filter:
+            continue
+
+        _id = operators_by_name[reg['operator']]
+        if _id not in operators:
+            operators[_id] = {'id': _id, 'volume': 0, 'links': []}
+
+        links = operators[_id]['links']
+        links.append(operators_by_name[reg['wholesaler']] if reg['wholesaler'] else '0')
+        links = list(set(links))
+        links.sort()
+
+        operators[_id]['volume'] += reg['volume']
+        operators[_id]['links'] = links
+
+    return sorted([op for _, op in operators.items()], key=lambda x: sum([int(i) for i in x['links']]))
+
+
+def cumulative_operators_status(registries: List[Dict], operators_by_name: Dict, years: Iterable[str]) -> Iterator:
+    # Registries are bucketed by year once, then every snapshot is emitted from
+    # running per-operator totals. Operators are ordered by links sum and then by
+    # their first position in registries, same as _operators_status_by_year().
+    # Operators are referenced by integer codes (their IDs) until output.
+    codes = {name: int(_id) for name, _id in operators_by_name.items()}
+    codes[''] = 0  # No wholesaler
+    registries_by_year = {}
+    values = registry_values(registries, 'date', 'operator', 'wholesaler', 'volume')
+    for position, (_date, operator, wholesaler, volume) in enumerate(values):
+        registries_by_year.setdefault(_date.split('-')[0], []).append((position, codes[operator], codes[wholesaler], volume))
+    pending_years = sorted(registries_by_year, reverse=True)
+
+    volumes = {}
+    links = {}
+    first_positions = {}
+    for year_filter in years:
+        while pending_years and pending_years[-1] <= year_filter:
+            for position, code, wholesaler_code, volume in registries_by_year[pending_years.pop()]:
+                if code not in volumes:
+                    volumes[code] = 0
+                    links[code] = set()
+                    first_positions[code] = position
+                elif position < first_positions[code]:
+                    first_positions[code] = position
+                volumes[code] += volume
+                links[code].add(wholesaler_code)
+
+        ordered_codes = sorted(volumes, key=lambda code: (sum(links[code]), first_positions[code]))
+        yield year_filter, [
+            {'id': str(code), 'volume': volumes[code], 'links': sorted([str(link) for link in links[code]])}
+            for code in ordered_codes
+        ]
+
+
+def build_dataset(registries: List[Dict], operators_by_name: Dict) -> Dict:
+    dataset = {}
+    years = [int(y) for y in unique_ordered_years(registries)]
+    _from = min(years)
+    _to = max(years)
+
+    all_years = [str(year) for year in range(_from, _to + 1)]
+    for _y, operators in cumulative_operators_status(registries, operators_by_name, all_years):
+        dataset[_y] = {
+            'year': _y,
+            'operators': operators
+        }
+
+    return dataset
@@ -0,0 +1,226 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+from backend.registries import (
+    LANDLINE_FILE,
+    MOBILE_FILE,
+    parse_lines,
+    read_csv_lines,
+)
+
+INDEX_FILE = 'releases.json'
+# A full copy every CHECKPOINT_INTERVAL releases bounds the diffs applied on rebuilds
+CHECKPOINT_INTERVAL = 12
+ENCODING = 'utf-8'
+GZIP_LEVEL = 6
+
+
+def archive_release(archive_dir: str, release_date: str, sources: Dict[str, str], archive: str = None) -> Optional[str]:
+    # Adds the CNMC files in sources ({market: filepath}, read from archive when
+    # given) as a release dated release_date (YYYY-MM-DD). Markets are stored as
+    # line diffs against the previous release, or as checkpoints (full copies)
+    # periodically and when a diff wouldn't be smaller. Returns the release id,
+    # None when files didn't change since the last release. Raises ValueError
+    # when a market has no lines.
+    releases = read_index(archive_dir)
+    lines_by_market = {
+        market: [line for line in read_csv_lines(filepath, archive=archive) if line]
+        for market, filepath in sources.items()
+    }
+    # Missing or unreadable files read as no lines, they would replace the market
+    # in every later date.
+    empty = [market for market, lines in lines_by_market.items() if not lines]
+    if empty:
+        raise ValueError(f'No lines to archive for {", ".join(empty)}')
+    hashes = {market: _lines_hash(lines) for market, lines in lines_by_market.items()}
+    if releases and all(releases[-1]['markets'].get(market, {}).get('sha256') == sha for market, sha in hashes.items()):
+        return None
+
+    release_id = release_date
+    suffix = 0
+    while any(release['id'] == release_id for release in releases):
+        suffix += 1
+        release_id = f'{release_date}.{suffix}'
+
+    release = {'id': release_id, 'date': release_date, 'markets': {}}
+    os.makedirs(f'{archive_dir}/{release_id}', exist_ok=True)
+    for market, lines in lines_by_market.items():
+        content = None
+        previous = _previous_release(releases, market)
+        if previous and _releases_since_checkpoint(releases, market) < CHECKPOINT_INTERVAL:
+            content = _diff(release_lines(archive_dir, market, previous['id']), lines)
+            if content and len(content['added']) + len(content['removed']) >= len(lines):
+                content = None
+        if content is None:
+            content = {'kind': 'checkpoint', 'lines': lines}
+        filepath = f'{release_id}/{market}.json.gz'
+        _write_json_gz(f'{archive_dir}/{filepath}', content)
+        release['markets'][market] = {
+            'file': filepath,
+            'kind': content['kind'],
+            'lines': len(lines),
+            'sha256': hashes[market],
+        }
+
+    _write_index(archive_dir, releases + [release])
+    return release_id
+
+
+def read_index(archive_dir: str) -> List[Dict]:
+    try:
+        with open(f'{archive_dir}/{INDEX_FILE}', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def release_lines(archive_dir: str, market: str, release_id: str) -> List[str]:
+    # Source lines of market as they were in release_id: the previous checkpoint
+    # with every following diff applied.
+    releases = [release for release in read_index(archive_dir) if market in release['markets']]
+    position = next(i for i, release in enumerate(releases) if release['id'] == release_id)
+    start = max(i for i in range(position + 1) if releases[i]['markets'][market]['kind'] == 'checkpoint')
+    lines = None
+    for release in releases[start:position + 1]:
+        content = _read_json_gz(f'{archive_dir}/{release["markets"][market]["file"]}')
+        lines = content['lines'] if content['kind'] == 'checkpoint' else _patch(lines, content)
+    return lines
+
+
+def release_at(archive_dir: str, market: str, on_date: str) -> Optional[Dict]:
+    # Last release archived on or before on_date (YYYY-MM-DD) with market files.
+    releases = [
+        release for release in read_index(archive_dir)
+        if market in release['markets'] and release['date'] <= on_date
+    ]
+    return releases[-1] if releases else None
+
+
+def registries_at(archive_dir: str, market: str, on_date: str) -> List:
+    release = release_at(archive_dir, market, on_date)
+    if release is None:
+        return []
+    return parse_lines(release_lines(archive_dir, market, release['id']))
+
+
+def _diff(previous: List[str], lines: List[str]) -> Optional[Dict]:
+    # Removed line positions in previous and added lines with their position in
+    # lines. Kept lines must keep their relative order (None otherwise), CNMC
+    # files are sorted by number block so they do between releases.
+    previous_counts, counts = Counter(previous), Counter(lines)
+    kept_counts = previous_counts & counts
+
+    removed, kept_previous = [], []
+    remaining = Counter(kept_counts)
+    for position, line in enumerate(previous):
+        if remaining[line] > 0:
+            remaining[line] -= 1
+            kept_previous.append(line)
+        else:
+            removed.append(position)
+
+    added, kept = [], []
+    remaining = Counter(kept_counts)
+    for position, line in enumerate(lines):
+        if remaining[line] > 0:
+            remaining[line] -= 1
+            kept.append(line)
+        else:
+            added.append([position, line])
+
+    if kept != kept_previous:
+        return None
+    return {'kind': 'diff', 'removed': removed, 'added': added}
+
+
+def _patch(previous: List[str], diff: Dict) -> List[str]:
+    removed = set(diff['removed'])
+    kept = iter([line for position, line in enumerate(previous) if position not in removed])
+    added = diff['added']
+    lines = []
+    for position, line in added:
+        while len(lines) < position:
+            lines.append(next(kept))
+        lines.append(line)
+    lines.extend(kept)
+    return lines
+
+
+def _previous_release(releases: List[Dict], market: str) -> Optional[Dict]:
+    releases = [release for release in releases if market in release['markets']]
+    return releases[-1] if releases else None
+
+
+def _releases_since_checkpoint(releases: List[Dict], market: str) -> int:
+    count = 0
+    for release in reversed(releases):
+        if market not in release['markets']:
+            continue
+        count += 1
+        if release['markets'][market]['kind'] == 'checkpoint':
+            break
+    return count
+
+
+def _lines_hash(lines: List[str]) -> str:
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode(ENCODING))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _write_json_gz(filepath: str, content: Dict):
+    with gzip.open(f'{filepath}.tmp', 'wt', encoding=ENCODING, compresslevel=GZIP_LEVEL) as f:
+        json.dump(content, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(f'{filepath}.tmp', filepath)
+
+
+def _read_json_gz(filepath: str) -> Dict:
+    with gzip.open(filepath, 'rt', encoding=ENCODING) as f:
+        return json.load(f)
+
+
+def _write_index(archive_dir: str, releases: List[Dict]):
+    with open(f'{archive_dir}/{INDEX_FILE}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(releases, f, indent=2)
+    os.replace(f'{archive_dir}/{INDEX_FILE}.tmp', f'{archive_dir}/{INDEX_FILE}')
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m backend.release_archive')
+    parser.add_argument('archive_dir', help='directory given to backend.preprocess_data --archive')
+    parser.add_argument('--export', metavar='DATE', help='write the files of the last release on or before DATE')
+    parser.add_argument('--output-dir', default='.', help='where --export writes CNMC files (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not args.export:
+        for release in read_index(args.archive_dir):
+            markets = ', '.join(f'{market}: {info["lines"]} lines ({info["kind"]})' for market, info in release['markets'].items())
+            print(f'{release["id"]}  {markets}')
+        return 0
+
+    files = {'landline': LANDLINE_FILE, 'mobile': MOBILE_FILE}
+    for market, filename in files.items():
+        release = release_at(args.archive_dir, market, args.export)
+        if release is None:
+            print(f'No {market} release on or before {args.export}')
+            return 1
+        with open(f'{args.output_dir}/{filename}', 'w', encoding='iso-8859-15') as f:
+            f.writelines(f'{line}\n' for line in release_lines(args.archive_dir, market, release['id']))
+        print(f'{filename} from release {release["id"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+import argparse
+import csv
+import io
+import sys
+import time
+from itertools import islice
+from typing import (
+    Iterable,
+    List,
+    TextIO,
+)
+
+from backend.number_index import NumberIndex
+
+try:
+    import numpy as np
+except ImportError:  # Optional, numbers are resolved one by one with bisect without it
+    np = None
+
+CHUNK_SIZE = 1000000
+CSV_HEADER = ('number', 'assignees', 'sub_assignees', 'wholesaler')
+# Several assignees (shared blocks) or sub-assignees go in the same CSV field
+OPERATORS_SEPARATOR = '|'
+
+
+def resolve(lines: Iterable[str], indexes: List[NumberIndex], output: TextIO, chunk_size: int = CHUNK_SIZE,
+            header: bool = True) -> int:
+    # Writes one CSV row per input line, numbers that can't be parsed or aren't
+    # assigned get empty operators. Returns the quantity of resolved lines.
+    resolver = _Resolver(indexes)
+    if header:
+        output.write(_csv_row(CSV_HEADER))
+    lines = iter(lines)
+    resolved = 0
+    while True:
+        chunk = [line.strip() for line in islice(lines, chunk_size)]
+        if not chunk:
+            return resolved
+        fields = [None] * (2 * len(chunk))
+        fields[::2] = [line if line.isalnum() else _csv_row((line, ))[:-1] for line in chunk]
+        fields[1::2] = resolver.columns(resolver.owner_ids(chunk))
+        output.write(''.join(fields))
+        resolved += len(chunk)
+
+
+class _Resolver:
+    # Owners of every index are numbered one after another, so one owner id
+    # tells both the index and its owners. CSV columns are rendered once per owner.
+
+    def __init__(self, indexes: List[NumberIndex]):
+        self.indexes = indexes
+        self.first_owner_ids = []
+        first_owner_id = 0
+        for index in indexes:
+            self.first_owner_ids.append(first_owner_id)
+            first_owner_id += len(index.owner_offsets) - 1
+        self.rendered = {-1: ',' + _csv_row(('', '', ''))}
+        if np is not None:
+            self.arrays = [
+                (np.frombuffer(index.starts, dtype=np.int64), np.frombuffer(index.owner_ids, dtype=np.int32))
+                for index in indexes
+            ]
+
+    def owner_ids(self, lines: List[str]):
+        if np is None:
+            return [self._owner_id(_number(line)) for line in lines]
+
+        numbers = _numbers_array(lines)
+        result = np.full(len(numbers), -1, dtype=np.int64)
+        for (starts, owner_ids), first_owner_id in zip(self.arrays, self.first_owner_ids):
+            positions = np.searchsorted(starts, numbers, side='right') - 1
+            found = owner_ids[np.maximum(positions, 0)].astype(np.int64)
+            found = np.where((positions >= 0) & (found >= 0) & (numbers >= 0), found + first_owner_id, -1)
+            result = np.where(result < 0, found, result)
+        return result
+
+    def _owner_id(self, number: int) -> int:
+        if number < 0:
+            return -1
+        for index, first_owner_id in zip(self.indexes, self.first_owner_ids):
+            owner_id = index.owner_id(number)
+            if owner_id >= 0:
+                return owner_id + first_owner_id
+        return -1
+
+    def columns(self, owner_ids) -> List[str]:
+        # ",assignees,sub_assignees,wholesaler\n" for every owner id
+        if np is None:
+            return [self._columns(owner_id) for owner_id in owner_ids]
+        unique_ids, positions = np.unique(owner_ids, return_inverse=True)
+        rendered = np.array([self._columns(owner_id) for owner_id in unique_ids.tolist()], dtype=object)
+        return rendered[positions].tolist()
+
+    def _columns(self, owner_id: int) -> str:
+        rendered = self.rendered.get(owner_id)
+        if rendered is None:
+            position = next(i for i in reversed(range(len(self.indexes))) if self.first_owner_ids[i] <= owner_id)
+            assignees, sub_assignees, wholesaler = self.indexes[position].owners(owner_id - self.first_owner_ids[position])
+            rendered = self.rendered[owner_id] = ',' + _csv_row(
+                (OPERATORS_SEPARATOR.join(assignees), OPERATORS_SEPARATOR.join(sub_assignees), wholesaler)
+            )
+        return rendered
+
+
+def _number(line: str) -> int:
+    # 9 digits national numbers, spaces and +34/0034 prefixes are accepted.
+    number = line.replace(' ', '')
+    if number.startswith('+34'):
+        number = number[3:]
+    elif number.startswith('0034'):
+        number = number[4:]
+    return int(number) if len(number) == 9 and number.isdigit() else -1
+
+
+def _numbers_array(lines: List[str]):
+    # Chunks of plain 9 digits lines (the usual CDR export) are converted from
+    # their bytes at once, lines in other formats go through _number().
+    data = ('\n'.join(lines) + '\n').encode('ascii', errors='replace')
+    if len(data) != len(lines) * 10:
+        return np.array([_number(line) for line in lines], dtype=np.int64)
+    rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, 10)
+    digits = rows[:, :9] - ord('0')
+    numbers = digits.astype(np.int64) @ (10 ** np.arange(8, -1, -1, dtype=np.int64))
+    for position in np.flatnonzero((digits > 9).any(axis=1) | (rows[:, 9] != ord('\n'))).tolist():
+        numbers[position] = _number(lines[position])
+    return numbers
+
+
+def _csv_row(fields: Iterable[str]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(fields)
+    return buffer.getvalue()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m backend.resolve_numbers')
+    parser.add_argument('index', nargs='+', help='index files written by backend.preprocess_data --number-index')
+    parser.add_argument('--input', metavar='FILE', help='one number per line (default: stdin)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='numbers resolved at once (default: %(default)s)')
+    parser.add_argument('--no-header', action='store_true', help='do not write the CSV header')
+    args = parser.parse_args(argv)
+
+    indexes = [NumberIndex.load(filepath) for filepath in args.index]
+    output = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='', write_through=False)
+    start = time.perf_counter()
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            resolved = resolve(f, indexes, output, chunk_size=args.chunk_size, header=not args.no_header)
+    else:
+        resolved = resolve(sys.stdin, indexes, output, chunk_size=args.chunk_size, header=not args.no_header)
+    output.flush()
+    seconds = time.perf_counter() - start
+    print(f'Resolved {resolved} numbers in {seconds:.2f}s ({resolved / max(seconds, 1e-9):.0f} numbers/s)', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
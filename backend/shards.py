@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+from typing import Dict
+
+SEPARATORS = (',', ':')
+
+
+def export(output_dir: str, url_prefix: str, datasets: Dict[str, Dict]) -> Dict:
+    # Writes one JSON file per (market, year) under output_dir and returns the
+    # manifest the UI uses to fetch them: {market: {year: {file, size, sha256}}}.
+    manifest = {}
+    for market, dataset in datasets.items():
+        market_dir = os.path.join(output_dir, market)
+        os.makedirs(market_dir, exist_ok=True)
+        manifest[market] = {}
+        for year, status in dataset.items():
+            content = json.dumps(status, separators=SEPARATORS).encode('utf-8')
+            _write_if_changed(os.path.join(market_dir, f'{year}.json'), content)
+            manifest[market][year] = {
+                'file': f'{url_prefix}/{market}/{year}.json',
+                'size': len(content),
+                'sha256': hashlib.sha256(content).hexdigest(),
+            }
+        _remove_stale_shards(market_dir, manifest[market])
+    return manifest
+
+
+def _write_if_changed(filepath: str, content: bytes):
+    # Unchanged shards keep their mtime, so HTTP caches can revalidate them.
+    try:
+        with open(filepath, 'rb') as f:
+            if f.read() == content:
+                return
+    except FileNotFoundError:
+        pass
+    with open(f'{filepath}.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(f'{filepath}.tmp', filepath)
+
+
+def _remove_stale_shards(market_dir: str, years: Dict):
+    # Precompressed sidecars (2019.json.gz) go away with their shard.
+    for filename in os.listdir(market_dir):
+        shard = filename.split('.json')[0]
+        if filename != shard and shard not in years:
+            os.unlink(os.path.join(market_dir, filename))
@@ -0,0 +1,120 @@
+import sqlite3
+from collections import deque
+from typing import (
+    Dict,
+    Sequence,
+)
+
+from backend.registries import registry_values
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS operators (
+    market TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date_added TEXT NOT NULL,
+    PRIMARY KEY (market, id)
+);
+CREATE TABLE IF NOT EXISTS registries (
+    market TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    operator TEXT NOT NULL,
+    wholesaler TEXT NOT NULL,
+    date TEXT NOT NULL,
+    "index" TEXT NOT NULL,
+    block TEXT NOT NULL,
+    sub_block TEXT NOT NULL,
+    nmin INTEGER NOT NULL,
+    nmax INTEGER NOT NULL,
+    volume INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (market, position)
+);
+'''
+# Dropped while loading a market and created again after, it's faster than
+# updating them row by row. Operator and date ones cover build_dataset() queries.
+INDEXES = {
+    'registries_operator': 'registries (market, operator, wholesaler, date)',
+    'registries_date': 'registries (market, date, operator, volume, position)',
+    'registries_block': 'registries (market, "index", block)',
+    'registries_numbers': 'registries (nmin, nmax)',
+}
+REGISTRY_KEYS = ('operator', 'wholesaler', 'date', 'index', 'block', 'sub_block', 'nmin', 'nmax', 'volume', 'type')
+# Pipelines of both markets may write at the same time
+LOCK_TIMEOUT = 300
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path, timeout=LOCK_TIMEOUT, isolation_level=None)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def store_market(connection: sqlite3.Connection, market: str, registries: Sequence, operators: Dict):
+    # Replaces every registry and operator of market in a single transaction.
+    # position keeps the registries file order, datasets depend on it.
+    rows = (
+        (market, position, *values)
+        for position, values in enumerate(registry_values(registries, *REGISTRY_KEYS))
+    )
+    placeholders = ', '.join('?' * (len(REGISTRY_KEYS) + 2))
+    # Index changes must be part of the transaction too, sqlite3 only opens one
+    # implicitly before data changes.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for name in INDEXES:
+            connection.execute(f'DROP INDEX IF EXISTS {name}')
+        connection.execute('DELETE FROM registries WHERE market = ?', (market, ))
+        connection.execute('DELETE FROM operators WHERE market = ?', (market, ))
+        connection.executemany(f'INSERT INTO registries VALUES ({placeholders})', rows)
+        connection.executemany(
+            'INSERT INTO operators VALUES (?, ?, ?, ?)',
+            ((market, _id, operator['name'], operator['date_added']) for _id, operator in operators.items())
+        )
+        for name, columns in INDEXES.items():
+            connection.execute(f'CREATE INDEX {name} ON {columns}')
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def build_dataset(connection: sqlite3.Connection, market: str) -> Dict:
+    # Same output as registries.build_dataset() for the stored registries. SQLite sums
+    # volumes and finds first positions and first link years per operator and
+    # year, only those aggregates are accumulated here.
+    operators_by_name = dict(connection.execute('SELECT name, id FROM operators WHERE market = ?', (market, )))
+    yearly = deque(connection.execute(
+        '''SELECT substr(date, 1, 4) AS year, operator, SUM(volume), MIN(position)
+           FROM registries WHERE market = ? GROUP BY year, operator ORDER BY year''',
+        (market, )
+    ))
+    if not yearly:
+        return {}
+    first_links = deque(connection.execute(
+        '''SELECT MIN(substr(date, 1, 4)) AS year, operator, wholesaler
+           FROM registries WHERE market = ? GROUP BY operator, wholesaler ORDER BY year''',
+        (market, )
+    ))
+
+    volumes, links, first_positions = {}, {}, {}
+    dataset = {}
+    for year in range(int(yearly[0][0]), int(yearly[-1][0]) + 1):
+        _y = str(year)
+        while yearly and yearly[0][0] <= _y:
+            _, operator, volume, position = yearly.popleft()
+            _id = operators_by_name[operator]
+            volumes[_id] = volumes.get(_id, 0) + volume
+            first_positions[_id] = min(first_positions.get(_id, position), position)
+            links.setdefault(_id, set())
+        while first_links and first_links[0][0] <= _y:
+            _, operator, wholesaler = first_links.popleft()
+            links[operators_by_name[operator]].add(operators_by_name[wholesaler] if wholesaler else '0')
+
+        ordered_ids = sorted(volumes, key=lambda _id: (sum([int(i) for i in links[_id]]), first_positions[_id]))
+        dataset[_y] = {
+            'year': _y,
+            'operators': [{'id': _id, 'volume': volumes[_id], 'links': sorted(links[_id])} for _id in ordered_ids],
+        }
+    return dataset
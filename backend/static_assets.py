@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import (
+    Dict,
+    List,
+)
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip sidecars are written without it
+    brotli = None
+
+MANIFEST_FILE = '.static_assets.json'
+HASH_LENGTH = 10
+SIDECAR_EXTENSIONS = ('.gz', '.br')
+# Hashed copies kept per file, current one included: pages and CDNs holding a
+# previous index.html still find the scripts it references.
+KEEP_HASHED_NAMES = 3
+
+
+def publish(output_dir: str, filenames: List[str], html_path: str = None, hashed: bool = False,
+            compress: bool = True) -> Dict[str, str]:
+    # Publishes output_dir files for nginx gzip_static/brotli_static: writes .gz and
+    # .br sidecars and, when hashed, copies named after their content hash
+    # (dataset.<hash>.js) that can be cached forever. Script references in
+    # html_path are rewritten to the published names. Artifacts whose hash is
+    # the same as last time are left untouched. Call it on every run: sidecars
+    # and hashed copies left by other modes would serve stale content, they are
+    # removed (hashed copies after KEEP_HASHED_NAMES). Returns {filename: published name}.
+    manifest = _read_manifest(output_dir)
+    published = {}
+    for filename in filenames:
+        with open(os.path.join(output_dir, filename), 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        name = _hashed_name(filename, digest) if hashed else filename
+        if hashed:
+            _write_if_missing(os.path.join(output_dir, name), content)
+            # Marks it as the newest copy, it may have been published before
+            os.utime(os.path.join(output_dir, name))
+        _remove_old_hashed_names(output_dir, filename, keep=name if hashed else None)
+        if compress:
+            precompress(os.path.join(output_dir, name), content, up_to_date=manifest.get(name) == digest)
+        else:
+            remove_sidecars(os.path.join(output_dir, name))
+        if name != filename:
+            # The plain file is rewritten every run, its sidecars aren't
+            remove_sidecars(os.path.join(output_dir, filename))
+        manifest[name] = digest
+        published[filename] = name
+
+    _write_manifest(output_dir, {name: manifest[name] for name in published.values()})
+    if html_path:
+        _rewrite_script_references(html_path, os.path.relpath(output_dir, os.path.dirname(html_path) or '.'), published)
+    return published
+
+
+def precompress(filepath: str, content: bytes = None, up_to_date: bool = None):
+    # Writes filepath.gz (and filepath.br with brotli installed). Without
+    # up_to_date, sidecars newer than filepath are considered current.
+    sidecars = {f'{filepath}.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        sidecars[f'{filepath}.br'] = lambda data: brotli.compress(data, quality=11)
+    elif os.path.exists(f'{filepath}.br'):
+        os.unlink(f'{filepath}.br')  # Written before brotli was uninstalled, it would be stale
+    if up_to_date is None:
+        up_to_date = all(_is_newer(sidecar, filepath) for sidecar in sidecars)
+    elif up_to_date:
+        up_to_date = all(os.path.exists(sidecar) for sidecar in sidecars)
+    if up_to_date:
+        return
+    if content is None:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+    for sidecar, compress in sidecars.items():
+        _write_atomically(sidecar, compress(content))
+
+
+def remove_sidecars(filepath: str):
+    for extension in SIDECAR_EXTENSIONS:
+        if os.path.exists(f'{filepath}{extension}'):
+            os.unlink(f'{filepath}{extension}')
+
+
+def _is_newer(filepath: str, than: str) -> bool:
+    try:
+        return os.stat(filepath).st_mtime >= os.stat(than).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _hashed_name(filename: str, digest: str) -> str:
+    stem, extension = os.path.splitext(filename)
+    return f'{stem}.{digest[:HASH_LENGTH]}{extension}'
+
+
+def _hashed_name_pattern(filename: str) -> str:
+    stem, extension = os.path.splitext(filename)
+    return re.escape(stem) + r'(\.[0-9a-f]{' + str(HASH_LENGTH) + '})?' + re.escape(extension)
+
+
+def _remove_old_hashed_names(output_dir: str, filename: str, keep: str = None):
+    # Keeps keep and the newest other hashed copies up to KEEP_HASHED_NAMES, all of
+    # them go away without keep (plain names published).
+    pattern = re.compile(_hashed_name_pattern(filename) + '$')
+    others = []
+    for other in os.listdir(output_dir):
+        match = pattern.match(other)
+        if match and match.group(1) and other != keep:
+            others.append(other)
+    others.sort(key=lambda other: os.path.getmtime(os.path.join(output_dir, other)), reverse=True)
+    for other in others[KEEP_HASHED_NAMES - 1 if keep else 0:]:
+        os.unlink(os.path.join(output_dir, other))
+        remove_sidecars(os.path.join(output_dir, other))
+
+
+def _rewrite_script_references(html_path: str, src_prefix: str, published: Dict[str, str]):
+    with open(html_path, encoding='utf-8') as f:
+        html = f.read()
+    rewritten = html
+    for filename, name in published.items():
+        pattern = r'(src=")' + re.escape(f'{src_prefix}/') + _hashed_name_pattern(filename) + '"'
+        rewritten = re.sub(pattern, lambda match: f'{match.group(1)}{src_prefix}/{name}"', rewritten)
+    if rewritten != html:
+        _write_atomically(html_path, rewritten.encode('utf-8'))
+
+
+def _read_manifest(output_dir: str) -> Dict:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _write_manifest(output_dir: str, manifest: Dict):
+    _write_atomically(os.path.join(output_dir, MANIFEST_FILE), json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+
+def _write_if_missing(filepath: str, content: bytes):
+    if not os.path.exists(filepath):
+        _write_atomically(filepath, content)
+
+
+def _write_atomically(filepath: str, content: bytes):
+    with open(f'{filepath}.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(f'{filepath}.tmp', filepath)
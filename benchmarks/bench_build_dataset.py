@@ -0,0 +1,76 @@
+import json
+import random
+import sys
+import time
+from typing import (
+    Dict,
+    List,
+)
+
+from backend.registries import (
+    _operators_status_by_year,
+    build_dataset,
+    unique_ordered_years,
+)
+
+REGISTRIES = 20000
+OPERATORS = 400
+FIRST_YEAR = 1998
+LAST_YEAR = 2021
+SEED = 1998
+
+
+def _synthetic_registries(size: int, operators: int) -> List[Dict]:
+    rnd = random.Random(SEED)
+    names = [f'OPERATOR {i}' for i in range(operators)]
+    registries = []
+    for _ in range(size):
+        sub_assigned = rnd.random() < 0.2
+        registries.append({
+            'operator': rnd.choice(names),
+            'wholesaler': rnd.choice(names) if sub_assigned else '',
+            'date': f'{rnd.randint(FIRST_YEAR, LAST_YEAR)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+            'volume': 100 if sub_assigned else 10000,
+            'type': 'subasignado' if sub_assigned else 'asignado',
+        })
+    return registries
+
+
+def _legacy_build_dataset(registries: List[Dict], operators_by_name: Dict) -> Dict:
+    dataset = {}
+    years = [int(y) for y in unique_ordered_years(registries)]
+    for year in range(min(years), max(years) + 1):
+        _y = str(year)
+        dataset[_y] = {
+            'year': _y,
+            'operators': _operators_status_by_year(_y, registries, operators_by_name)
+        }
+    return dataset
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(size: int = REGISTRIES, operators: int = OPERATORS) -> int:
+    registries = _synthetic_registries(size, operators)
+    operators_by_name = {f'OPERATOR {i}': str(i + 1) for i in range(operators)}
+
+    legacy, legacy_time = _timed(_legacy_build_dataset, registries, operators_by_name)
+    engine, engine_time = _timed(build_dataset, registries, operators_by_name)
+
+    sep = (',', ':')
+    identical = json.dumps(legacy, separators=sep) == json.dumps(engine, separators=sep)
+    print(f'Registries: {size}, operators: {operators}')
+    print(f'Per-year rescan:       {legacy_time:.3f}s')
+    print(f'Single-pass engine:    {engine_time:.3f}s')
+    print(f'Speed-up:              x{legacy_time / engine_time:.1f}')
+    print(f'Byte-identical output: {identical}')
+
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(run(*[int(arg) for arg in sys.argv[1:3]]))
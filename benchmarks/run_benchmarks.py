@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+from unittest import mock
+
+from backend import (
+    preprocess_data,
+    registries,
+)
+from benchmarks import synthetic
+
+SIZES = (10000, 100000, 1000000)
+RESULTS_FILE = 'benchmark_results.json'
+
+
+def _measure(func: Callable, memory: bool) -> Dict:
+    # Peak memory is measured in a second call, tracemalloc slows Python code
+    # down too much to time it at the same time.
+    start = time.perf_counter()
+    func()
+    result = {'seconds': round(time.perf_counter() - start, 6)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _benchmark_size(lines: int, workdir: str, options: Dict, memory: bool) -> Dict:
+    filepath = os.path.join(workdir, f'synthetic-{lines}.txt')
+    file_bytes = synthetic.write_cnmc_file(filepath, lines, **options)
+    stages = {}
+
+    stages['_load_file'] = _measure(lambda: preprocess_data._load_file(filepath), memory)
+    loaded = preprocess_data._load_file(filepath)
+
+    # Volumes are set while loading, measure it again on freshly parsed registries.
+    parsed = list(registries._iter_registries(registries.read_csv_lines(filepath, stream=True)))
+    stages['_set_volumes_and_wholesaler'] = _measure(
+        lambda: registries._set_volumes_and_wholesaler(parsed), memory
+    )
+    parsed.clear()
+
+    stages['_get_operators'] = _measure(lambda: preprocess_data._get_operators(loaded), memory)
+    operators_by_name = {
+        operator['name']: _id for _id, operator in preprocess_data._get_operators(loaded).items()
+    }
+
+    stages['_build_dataset'] = _measure(
+        lambda: registries.build_dataset(loaded, operators_by_name), memory
+    )
+    dataset = registries.build_dataset(loaded, operators_by_name)
+
+    with mock.patch.object(preprocess_data, 'OUTPUT_DIR', workdir):
+        stages['_export'] = _measure(lambda: preprocess_data._export(dataset, dataset), memory)
+    os.unlink(filepath)
+
+    return {
+        'lines': lines,
+        'file_bytes': file_bytes,
+        'registries': len(loaded),
+        'operators': len(operators_by_name),
+        'years': len(dataset),
+        'stages': stages,
+    }
+
+
+def _print_run(run: Dict, previous: Dict = None):
+    print(f'{run["lines"]} lines, {run["registries"]} registries, {run["operators"]} operators, {run["years"]} years')
+    for stage, result in run['stages'].items():
+        line = f'  {stage:<30} {result["seconds"]:>10.3f}s'
+        if 'peak_bytes' in result:
+            line += f' {result["peak_bytes"] / 1024 / 1024:>10.1f}MB'
+        if previous and stage in previous['stages']:
+            line += f'  x{previous["stages"][stage]["seconds"] / max(result["seconds"], 1e-9):.2f} vs previous'
+        print(line)
+
+
+def run(sizes: List[int], options: Dict, memory: bool = True, output: str = RESULTS_FILE,
+        compare: str = None) -> int:
+    previous = {}
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            previous = {run['lines']: run for run in json.load(f)['runs']}
+
+    results = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': registries.np.__version__ if registries.np is not None else None,
+        'parameters': options,
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for lines in sizes:
+            result = _benchmark_size(lines, workdir, options, memory)
+            _print_run(result, previous.get(lines))
+            results['runs'].append(result)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved in {output}')
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run_benchmarks')
+    parser.add_argument(
+        '--sizes',
+        type=lambda value: [int(size) for size in value.split(',')],
+        default=list(SIZES),
+        help='comma separated quantities of synthetic lines (default: %(default)s)'
+    )
+    parser.add_argument('--operators', type=int, default=400)
+    parser.add_argument('--first-year', type=int, default=1998)
+    parser.add_argument('--last-year', type=int, default=2021)
+    parser.add_argument('--share-ratio', type=float, default=0.05, help='blocks shared by several owners')
+    parser.add_argument('--sub-assign-ratio', type=float, default=0.2, help='blocks with sub-assigned ranges')
+    parser.add_argument('--free-ratio', type=float, default=0.05, help='free ("Libre") blocks')
+    parser.add_argument('--seed', type=int, default=synthetic.SEED)
+    parser.add_argument('--no-memory', action='store_true', help='only measure time, skip tracemalloc runs')
+    parser.add_argument('--no-numpy', action='store_true', help='measure pure Python parsing even with NumPy installed')
+    parser.add_argument('--output', default=RESULTS_FILE, help='JSON results file (default: %(default)s)')
+    parser.add_argument('--compare', metavar='FILE', help='print speed-ups against a previous results file')
+    args = parser.parse_args(argv)
+
+    options = {
+        'operators': args.operators,
+        'first_year': args.first_year,
+        'last_year': args.last_year,
+        'share_ratio': args.share_ratio,
+        'sub_assign_ratio': args.sub_assign_ratio,
+        'free_ratio': args.free_ratio,
+        'seed': args.seed,
+    }
+    with mock.patch.object(registries, 'np', None if args.no_numpy else registries.np):
+        return run(args.sizes, options, memory=not args.no_memory, output=args.output, compare=args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+import random
+from typing import (
+    Iterator,
+    List,
+)
+
+ENCODING = 'iso-8859-15'
+PROVINCES = ['Madrid', 'Barcelona', 'A Coruña', 'Málaga', 'Cuenca', 'Castellón', 'León', 'Cáceres']
+FIRST_INDEX = 600
+INDEXES = 200
+SEED = 1998
+
+
+def operator_names(operators: int) -> List[str]:
+    # Accented names, so files really need ISO-8859-15 like CNMC ones.
+    return [f'OPERADOR {i} TELECOMUNICACIÓN ESPAÑA, S.L.' for i in range(operators)]
+
+
+def cnmc_lines(lines: int, operators: int = 400, first_year: int = 1998, last_year: int = 2021,
+               share_ratio: float = 0.05, sub_assign_ratio: float = 0.2, free_ratio: float = 0.05,
+               seed: int = SEED) -> Iterator[str]:
+    # Yields "index#block#province#kind#operator#dd/mm/yyyy" lines, grouped by
+    # number block like CNMC files: one owner ("Asignado"), sometimes more owners
+    # sharing the block and "Subasignado N" ranges given to other operators.
+    # Free blocks ("Libre") are written too, the parser has to skip them.
+    rnd = random.Random(seed)
+    names = operator_names(operators)
+    block_width = len(str(max(lines // INDEXES, 1)))
+    written = 0
+    block_number = 0
+    while written < lines:
+        index = FIRST_INDEX + block_number % INDEXES
+        block = str(block_number // INDEXES).zfill(block_width)
+        province = PROVINCES[index % len(PROVINCES)]
+        block_number += 1
+
+        if rnd.random() < free_ratio:
+            yield f'{index}#{block}#{province}#Libre##\n'
+            written += 1
+            continue
+
+        owners = 1 + (rnd.randint(1, 2) if rnd.random() < share_ratio else 0)
+        sub_assignees = rnd.randint(1, 3) if rnd.random() < sub_assign_ratio else 0
+        year = rnd.randint(first_year, last_year)
+        for _ in range(owners):
+            yield f'{index}#{block}#{province}#Asignado#{rnd.choice(names)}#{_random_date(rnd, year, year)}\n'
+        for sub_block in range(sub_assignees):
+            yield (
+                f'{index}#{block}# #Subasignado {sub_block}#{rnd.choice(names)}#'
+                f'{_random_date(rnd, year, last_year)}\n'
+            )
+        written += owners + sub_assignees
+
+
+def write_cnmc_file(filepath: str, lines: int, **options) -> int:
+    # Returns the size of the written file in bytes.
+    with open(filepath, 'w', encoding=ENCODING) as f:
+        f.writelines(cnmc_lines(lines, **options))
+        return f.tell()
+
+
+def _random_date(rnd: random.Random, first_year: int, last_year: int) -> str:
+    return f'{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/{rnd.randint(first_year, last_year)}'
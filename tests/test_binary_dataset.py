@@ -0,0 +1,50 @@
+import struct
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect,
+    raise_error
+)
+
+from backend import binary_dataset
+
+DATASETS = {
+    'landline': {
+        '2003': {'year': '2003', 'operators': [{'id': '2', 'volume': 10000, 'links': ['0']}]},
+    },
+    'mobile': {
+        '2020': {'year': '2020', 'operators': [{'id': '1', 'volume': 1000000, 'links': ['0']}]},
+        '2021': {
+            'year': '2021',
+            'operators': [
+                {'id': '1', 'volume': 990000, 'links': ['0']},
+                {'id': '3', 'volume': 4000000000, 'links': []},
+                {'id': '2', 'volume': 10000, 'links': ['1', '3']},
+            ],
+        },
+    },
+}
+
+
+class BinaryDatasetTestCase(TestCase):
+
+    def test_it_decodes_encoded_datasets(self):
+        expect(binary_dataset.decode(binary_dataset.encode(DATASETS))).to(equal(DATASETS))
+
+    def test_it_writes_little_endian_csr_arrays(self):
+        content = binary_dataset.encode({'mobile': {'2021': DATASETS['mobile']['2021']}})
+
+        expect(content[:12]).to(equal(b'TMDS' + struct.pack('<II', 1, 1)))
+        expect(content[12:28]).to(equal(struct.pack('<II', 6, 1) + b'mobile\0\0'))
+        expect(content[28:]).to(equal(struct.pack(
+            '<III3I3I4I3I',
+            2021, 3, 3,
+            1, 3, 2,
+            990000, 4000000000, 10000,
+            0, 1, 1, 3,
+            0, 1, 3
+        )))
+
+    def test_it_rejects_other_formats(self):
+        expect(lambda: binary_dataset.decode(b'NIDX' + bytes(8))).to(raise_error(ValueError))
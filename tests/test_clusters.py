@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import clusters
+
+
+def _op(_id, volume, links=('0', )):
+    return {'id': _id, 'volume': volume, 'links': list(links)}
+
+
+class ClustersTestCase(TestCase):
+
+    def setUp(self):
+        self.dataset = {
+            '2021': {
+                'year': '2021',
+                'operators': [
+                    _op('1', 9000),
+                    _op('2', 8000, ['5']),
+                    _op('3', 50, ['1']),
+                    _op('4', 40, ['1', '6']),
+                    _op('5', 30),
+                    _op('6', 20),
+                    _op('7', 10, ['6']),
+                ],
+            },
+        }
+
+    def test_it_keeps_top_operators_and_their_wholesalers(self):
+        summary = clusters.summarize(self.dataset, top=2)
+
+        expect([op['id'] for op in summary['2021']['operators']]).to(equal(['1', '2', '5']))
+        expect(summary['2021']['operators'][1]).to(equal(_op('2', 8000, ['5'])))
+
+    def test_it_folds_the_rest_by_the_first_kept_operator_they_link_to(self):
+        summary = clusters.summarize(self.dataset, top=2)
+
+        expect(summary['2021']['clusters']).to(equal([
+            {'id': 'cluster-1', 'volume': 90, 'links': ['1'], 'members': ['3', '4']},
+            {'id': 'cluster-0', 'volume': 30, 'links': ['0'], 'members': ['6', '7']},
+        ]))
+
+    def test_it_keeps_volumes_of_every_year(self):
+        summary = clusters.summarize(self.dataset, top=1)['2021']
+
+        volume = sum(op['volume'] for op in summary['operators'] + summary['clusters'])
+        expect(volume).to(equal(sum(op['volume'] for op in self.dataset['2021']['operators'])))
+
+    def test_it_has_no_clusters_when_every_operator_is_kept(self):
+        summary = clusters.summarize(self.dataset, top=10)
+
+        expect(summary['2021']['operators']).to(equal(self.dataset['2021']['operators']))
+        expect(summary['2021']['clusters']).to(equal([]))
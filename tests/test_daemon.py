@@ -0,0 +1,144 @@
+import io
+import os
+import shutil
+from unittest import TestCase
+from unittest import mock
+
+from expects import (
+    be_above_or_equal,
+    be_below_or_equal,
+    be_false,
+    be_none,
+    be_true,
+    equal,
+    expect
+)
+
+from backend import (
+    daemon,
+    preprocess_data,
+)
+
+WORK_DIR = '/tmp/daemon_test'
+LINK = f'{WORK_DIR}/data'
+LANDLINE_LINES = '822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003\n'
+MOBILE_LINES = '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998\n'
+
+
+def _write(filepath, content):
+    with open(filepath, 'w', encoding='iso-8859-15') as f:
+        f.write(content)
+
+
+def _read(filepath):
+    with open(filepath, encoding='utf-8') as f:
+        return f.read()
+
+
+@mock.patch('backend.preprocess_data._download_bd', mock.MagicMock())
+@mock.patch('backend.preprocess_data._warm_markets', {})
+class DaemonTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(WORK_DIR)
+        _write('/tmp/geograficos.txt', LANDLINE_LINES)
+        _write('/tmp/moviles.txt', MOBILE_LINES)
+        self.options = {'workers': 2}
+
+    def tearDown(self):
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+        for filepath in (
+            '/tmp/geograficos.txt', '/tmp/moviles.txt', '/tmp/landline_operator_ids.json', '/tmp/mobile_operator_ids.json'
+        ):
+            if os.path.exists(filepath):
+                os.unlink(filepath)
+
+    @mock.patch('backend.preprocess_data._db_is_outdated', return_value=False)
+    def test_it_publishes_first_generation_and_then_waits_for_changes(self, _):
+        generation = daemon.refresh(LINK, self.options)
+
+        expect(os.path.islink(LINK)).to(be_true)
+        expect(os.path.realpath(LINK)).to(equal(generation))
+        expect(_read(f'{LINK}/landline_operators.js').startswith('landlineOperators = {"1"')).to(be_true)
+        expect(daemon.refresh(LINK, self.options)).to(be_none)
+        expect(os.listdir(f'{LINK}{daemon.GENERATIONS_SUFFIX}')).to(equal([os.path.basename(generation)]))
+
+    def test_it_swaps_link_to_a_new_generation_when_source_changes(self):
+        with mock.patch('backend.preprocess_data._db_is_outdated', return_value=False):
+            first = daemon.refresh(LINK, self.options)
+        first_dataset = _read(f'{first}/dataset.js')
+        _write('/tmp/moviles.txt', MOBILE_LINES + '601#4##Asignado#NEW OPERATOR#21/09/2015\n')
+
+        with mock.patch('backend.preprocess_data._db_is_outdated', side_effect=[True, False]):
+            second = daemon.refresh(LINK, self.options)
+
+        expect(os.path.realpath(LINK)).to(equal(second))
+        expect(_read(f'{first}/dataset.js')).to(equal(first_dataset))
+        expect('NEW OPERATOR' in _read(f'{LINK}/mobile_operators.js')).to(be_true)
+        expect(os.path.exists(f'{LINK}/mobile_operator_ids.json')).to(be_false)
+        expect('NEW OPERATOR' in _read('/tmp/mobile_operator_ids.json')).to(be_true)
+
+    @mock.patch('backend.preprocess_data._db_is_outdated', return_value=True)
+    def test_it_keeps_unchanged_registries_warm(self, _):
+        daemon.refresh(LINK, self.options)
+        landline_registries = preprocess_data._warm_markets['landline']['registries']
+        _write('/tmp/moviles.txt', MOBILE_LINES.replace('VODAFONE', 'TELEFONICA'))
+
+        with mock.patch('backend.preprocess_data._load_file', wraps=preprocess_data._load_file) as load_file:
+            daemon.refresh(LINK, self.options)
+
+        expect(preprocess_data._warm_markets['landline']['registries'] is landline_registries).to(be_true)
+        expect([call.args[0] for call in load_file.call_args_list]).to(equal(['/tmp/moviles.txt']))
+        expect('TELEFONICA' in _read(f'{LINK}/mobile_operators.js')).to(be_true)
+
+    @mock.patch('backend.preprocess_data._db_is_outdated', return_value=True)
+    def test_it_removes_old_generations(self, _):
+        generations = [daemon.refresh(LINK, self.options, keep=1) for _ in range(3)]
+
+        expect(sorted(os.listdir(f'{LINK}{daemon.GENERATIONS_SUFFIX}'))).to(equal(
+            [os.path.basename(generation) for generation in generations[1:]]
+        ))
+
+    @mock.patch('backend.preprocess_data._db_is_outdated', return_value=False)
+    def test_it_keeps_current_generation_when_a_build_fails(self, _):
+        generation = daemon.refresh(LINK, self.options)
+        os.unlink('/tmp/moviles.txt')
+
+        with mock.patch('backend.preprocess_data._db_is_outdated', return_value=True):
+            with self.assertRaises(RuntimeError):
+                daemon.refresh(LINK, self.options)
+
+        expect(os.path.realpath(LINK)).to(equal(generation))
+        expect(os.listdir(f'{LINK}{daemon.GENERATIONS_SUFFIX}')).to(equal([os.path.basename(generation)]))
+
+    @mock.patch('backend.daemon.time.sleep', mock.MagicMock())
+    @mock.patch('backend.preprocess_data._db_is_outdated', return_value=True)
+    def test_it_reports_failed_builds(self, _):
+        os.unlink('/tmp/moviles.txt')
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                daemon.serve(LINK, self.options, cycles=1)
+
+        expect('Source did not change' in stdout.getvalue()).to(equal(False))
+        expect('RuntimeError: Build exited with code 1' in stderr.getvalue()).to(be_true)
+        expect(os.path.lexists(LINK)).to(equal(False))
+
+    @mock.patch('backend.daemon.time.sleep')
+    @mock.patch('backend.daemon.refresh', return_value=None)
+    def test_it_waits_interval_plus_jitter_between_checks(self, refresh, sleep):
+        daemon.serve(LINK, self.options, interval=60, jitter=10, cycles=3)
+
+        expect(refresh.call_count).to(equal(3))
+        expect(sleep.call_count).to(equal(2))
+        for call in sleep.call_args_list:
+            expect(call.args[0]).to(be_above_or_equal(60))
+            expect(call.args[0]).to(be_below_or_equal(70))
+
+    def test_it_rejects_options_that_write_outside_generations(self):
+        with mock.patch('sys.stderr', io.StringIO()):
+            for argv in ([LINK, '--hashed-names'], [LINK, '--output-dir', '/tmp/out']):
+                with self.assertRaises(SystemExit):
+                    daemon.main(argv)
+
+        expect(os.path.lexists(LINK)).to(be_false)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect,
+    have_keys,
+)
+
+from backend import delta
+
+
+class DeltaEncodingTestCase(TestCase):
+
+    def setUp(self):
+        self.dataset = {
+            '2003': {'year': '2003', 'operators': [
+                {'id': '2', 'volume': 15000, 'links': ['0']},
+            ]},
+            '2004': {'year': '2004', 'operators': [
+                {'id': '2', 'volume': 15000, 'links': ['0']},
+            ]},
+            '2016': {'year': '2016', 'operators': [
+                {'id': '2', 'volume': 15000, 'links': ['0']},
+                {'id': '3', 'volume': 5000, 'links': ['0']},
+            ]},
+            '2018': {'year': '2018', 'operators': [
+                {'id': '3', 'volume': 5100, 'links': ['0', '10']},
+                {'id': '2', 'volume': 15000, 'links': ['0']},
+                {'id': '4', 'volume': 100, 'links': ['2']},
+            ]},
+        }
+
+    def test_it_encodes_yearly_changes(self):
+        encoded = delta.encode(self.dataset)
+
+        expect(encoded['years']).to(equal(['2003', '2004', '2016', '2018']))
+        expect(encoded['deltas'][0]).to(equal({'add': [['2', 15000, ['0']]]}))
+        expect(encoded['deltas'][1]).to(equal({}))
+        expect(encoded['deltas'][2]).to(equal({'add': [['3', 5000, ['0']]]}))
+        expect(encoded['deltas'][3]).to(have_keys({
+            'add': [['4', 100, ['2']]],
+            'volume': {'3': 100},
+            'links': {'3': ['10']},
+            'order': ['3', '2', '4'],
+        }))
+
+    def test_it_decodes_same_dataset(self):
+        expect(delta.decode(delta.encode(self.dataset))).to(equal(self.dataset))
+
+    def test_it_decodes_removed_operators_and_links(self):
+        self.dataset['2018']['operators'] = [{'id': '2', 'volume': 10000, 'links': ['1']}]
+
+        expect(delta.decode(delta.encode(self.dataset))).to(equal(self.dataset))
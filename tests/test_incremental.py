@@ -0,0 +1,116 @@
+import os
+import shutil
+from unittest import (
+    TestCase,
+    mock,
+)
+
+from expects import (
+    be,
+    be_none,
+    equal,
+    expect
+)
+
+from backend import incremental
+from backend.preprocess_data import _get_operators
+from backend.registries import (
+    _iter_registries,
+    _set_volumes_and_wholesaler,
+    build_dataset,
+)
+
+STATE_DIR = '/tmp/test_incremental'
+LINES = [
+    '822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003',
+    '822#02#Cuenca#Asignado#VODAFONE ONO#20/08/2003',
+    '822#01#Cuenca#Compartido#VODAFONE ESPAÑA#21/12/2016',
+    '822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013',
+    '822#24#Cuenca#Subasignado 03#WIFI CANARIAS#15/05/2018',
+    '815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2019',
+    '600###Asignado#DUOCOM#19/11/1998',
+]
+
+
+def _registries(lines):
+    registries = list(_iter_registries(lines))
+    _set_volumes_and_wholesaler(registries)
+    return registries
+
+
+def _operators_by_name(registries):
+    return {operator['name']: _id for _id, operator in _get_operators(registries).items()}
+
+
+class IncrementalRebuildTestCase(TestCase):
+
+    def setUp(self):
+        self.registries = _registries(LINES)
+        self.operators_by_name = _operators_by_name(self.registries)
+        self.previous = {
+            'registries': self.registries,
+            'operators_by_name': self.operators_by_name,
+            'dataset': build_dataset(self.registries, self.operators_by_name),
+        }
+
+    def tearDown(self) -> None:
+        shutil.rmtree(STATE_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def _expect_same_as_full_rebuild(self, lines):
+        registries = _registries(lines)
+        operators_by_name = dict(self.operators_by_name, **_operators_by_name(registries))
+
+        dataset = incremental.rebuild_dataset(registries, operators_by_name, self.previous)
+
+        expect(dataset).to(equal(build_dataset(registries, operators_by_name)))
+        return dataset
+
+    def test_it_reuses_previous_dataset_when_nothing_changed(self):
+        dataset = self._expect_same_as_full_rebuild(LINES)
+
+        expect(dataset['2010']).to(be(self.previous['dataset']['2010']))
+
+    def test_it_only_rebuilds_years_since_first_change(self):
+        lines = LINES[:4] + ['822#24#Cuenca#Subasignado 03#WIFI CANARIAS#15/05/2017'] + LINES[5:]
+
+        with mock.patch('backend.incremental.build_dataset') as full_build:
+            dataset = incremental.rebuild_dataset(_registries(lines), self.operators_by_name, self.previous)
+
+            full_build.assert_not_called()
+        expect(dataset['2016']).to(be(self.previous['dataset']['2016']))
+        expect(dataset).to(equal(build_dataset(_registries(lines), self.operators_by_name)))
+
+    def test_it_patches_shared_blocks_and_new_operators(self):
+        self._expect_same_as_full_rebuild(LINES + [
+            '822#02#Cuenca#Compartido#AIRE NETWORKS#01/02/2014',
+            '822#24#Cuenca#Subasignado 05#NEW OPERATOR#01/02/2015',
+        ])
+
+    def test_it_removes_operators_without_registries(self):
+        self._expect_same_as_full_rebuild(LINES[:4] + LINES[5:])
+
+    def test_it_adds_new_years(self):
+        self._expect_same_as_full_rebuild(LINES + ['601#0##Asignado#DUOCOM#01/11/2022'])
+
+    def test_it_builds_full_dataset_when_registries_are_reordered(self):
+        self._expect_same_as_full_rebuild(list(reversed(LINES)))
+
+    def test_it_builds_full_dataset_when_operator_ids_change(self):
+        registries = _registries(LINES)
+        operators_by_name = {name: str(int(_id) + 1) for name, _id in self.operators_by_name.items()}
+
+        dataset = incremental.rebuild_dataset(registries, operators_by_name, self.previous)
+
+        expect(dataset).to(equal(build_dataset(registries, operators_by_name)))
+
+    def test_it_saves_and_loads_state(self):
+        os.makedirs(STATE_DIR)
+        path = f'{STATE_DIR}/landline.state.pickle'
+
+        incremental.save_state(path, self.registries, self.operators_by_name, self.previous['dataset'])
+        state = incremental.load_state(path)
+
+        expect(list(state['registries'])).to(equal(self.registries))
+        expect(state['dataset']).to(equal(self.previous['dataset']))
+        expect(incremental.load_state(f'{STATE_DIR}/missing.state.pickle')).to(be_none)
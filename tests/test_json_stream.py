@@ -0,0 +1,70 @@
+import io
+import json
+import os
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import json_stream
+
+OUTPUT_FILE = '/tmp/test_json_stream.js'
+DATASET = {
+    '2003': {'year': '2003', 'operators': [{'id': '2', 'volume': 15000, 'links': ['0']}]},
+    '2004': {'year': '2004', 'operators': [
+        {'id': '2', 'volume': 15000, 'links': ['0']},
+        {'id': '3', 'volume': 100, 'links': ['2', '5']},
+    ]},
+    '2005': {'year': '2005', 'operators': []},
+    'ÑANDÚ': {},
+}
+
+
+class JsonStreamTestCase(TestCase):
+
+    def tearDown(self) -> None:
+        for filepath in (OUTPUT_FILE, f'{OUTPUT_FILE}.tmp'):
+            if os.path.exists(filepath):
+                os.unlink(filepath)
+        return super().tearDown()
+
+    def test_it_writes_same_output_as_json_dumps(self):
+        for separators in ((',', ':'), json_stream.SEPARATORS):
+            for depth in range(5):
+                f = io.StringIO()
+
+                json_stream.dump(DATASET, f, separators=separators, depth=depth)
+
+                expect(f.getvalue()).to(equal(json.dumps(DATASET, separators=separators)))
+
+    def test_it_keeps_previous_file_when_writing_fails(self):
+        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+            f.write('landlineData = {};')
+
+        with self.assertRaises(TypeError):
+            with json_stream.atomic_file(OUTPUT_FILE) as f:
+                f.write('landlineData = ')
+                json_stream.dump({'2003': object()}, f)
+
+        with open(OUTPUT_FILE, encoding='utf-8') as f:
+            expect(f.read()).to(equal('landlineData = {};'))
+        expect(os.path.exists(f'{OUTPUT_FILE}.tmp')).to(equal(False))
+
+    def test_it_keeps_unchanged_files(self):
+        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+            f.write('landlineData = {};')
+        os.utime(OUTPUT_FILE, (0, 0))
+
+        with json_stream.atomic_file(OUTPUT_FILE) as f:
+            f.write('landlineData = {};')
+
+        expect(os.path.getmtime(OUTPUT_FILE)).to(equal(0))
+        expect(os.path.exists(f'{OUTPUT_FILE}.tmp')).to(equal(False))
+
+        with json_stream.atomic_file(OUTPUT_FILE) as f:
+            f.write('landlineData = {"2003": {}};')
+
+        with open(OUTPUT_FILE, encoding='utf-8') as f:
+            expect(f.read()).to(equal('landlineData = {"2003": {}};'))
@@ -0,0 +1,74 @@
+from unittest import (
+    TestCase,
+    skipIf,
+)
+
+from expects import (
+    be_below,
+    be_none,
+    equal,
+    expect
+)
+
+from backend import layout
+
+
+def _dataset(years):
+    # years: {year: {id: links}}
+    return {
+        year: {
+            'year': year,
+            'operators': [{'id': _id, 'volume': 1000, 'links': links} for _id, links in operators.items()]
+        }
+        for year, operators in years.items()
+    }
+
+
+def _distance(a, b):
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
+
+
+@skipIf(layout.np is None, 'NumPy is not installed')
+class LayoutTestCase(TestCase):
+
+    def setUp(self):
+        operators = {str(_id): ['0'] for _id in range(1, 31)}
+        operators.update({str(_id): ['1'] for _id in range(31, 41)})
+        self.dataset = _dataset({
+            '2019': operators,
+            '2020': {**operators, '41': ['1'], '42': ['0']},
+        })
+
+    def test_it_places_every_operator_and_the_root_of_every_year(self):
+        positions = layout.compute(self.dataset)
+
+        expect(list(positions)).to(equal(['2019', '2020']))
+        expect(sorted(positions['2020'], key=int)).to(equal([str(_id) for _id in range(43)]))
+        expect(positions['2019']['0']).to(equal([0, 0]))
+
+    def test_it_is_deterministic(self):
+        expect(layout.compute(self.dataset)).to(equal(layout.compute(self.dataset)))
+
+    def test_it_places_operators_near_their_wholesaler(self):
+        positions = layout.compute(self.dataset)['2020']
+
+        to_wholesaler = sum(_distance(positions[str(_id)], positions['1']) for _id in range(31, 42)) / 11
+        to_others = sum(_distance(positions[str(_id)], positions['1']) for _id in range(2, 31)) / 29
+        expect(to_wholesaler).to(be_below(to_others))
+
+    def test_it_starts_every_year_from_previous_year_positions(self):
+        positions = layout.compute(self.dataset)
+        restarted = layout.compute({'2020': self.dataset['2020']})
+
+        def moved(year_positions):
+            return sum(_distance(positions['2019'][_id], year_positions[_id]) for _id in positions['2019'])
+
+        expect(moved(positions['2020'])).to(be_below(moved(restarted['2020']) / 4))
+
+    def test_it_returns_nothing_without_numpy(self):
+        np = layout.np
+        layout.np = None
+        try:
+            expect(layout.compute(self.dataset)).to(be_none)
+        finally:
+            layout.np = np
@@ -0,0 +1,78 @@
+import os
+from unittest import TestCase
+
+from expects import (
+    be_none,
+    equal,
+    expect
+)
+
+from backend.number_index import NumberIndex
+from backend.registries import (
+    Registry,
+    RegistryColumns,
+)
+
+INDEX_FILE = '/tmp/test_number_index.numidx'
+
+
+def _registry(operator, index, block, sub_block='', _type='asignado', wholesaler=''):
+    prefix = f'{index}{block}{sub_block}'
+    nmin, nmax = int(prefix.ljust(9, '0')), int(prefix.ljust(9, '9'))
+    return Registry(operator, wholesaler, '2021-01-01', index, block, sub_block, nmin, nmax, nmax - nmin + 1, _type)
+
+
+class NumberIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.registries = [
+            _registry('VODAFONE', '600', ''),
+            _registry('VODAFONE', '601', '4'),
+            _registry('ORANGE', '601', '4'),
+            _registry('XFERA', '601', '4', '0', 'subasignado', 'VODAFONE'),
+            _registry('LEMON', '601', '4', '00', 'subasignado', 'VODAFONE'),
+            _registry('ÑETFON', '601', '5'),
+        ]
+        self.index = NumberIndex.from_registries(self.registries)
+
+    def tearDown(self) -> None:
+        if os.path.exists(INDEX_FILE):
+            os.unlink(INDEX_FILE)
+        return super().tearDown()
+
+    def test_it_resolves_assigned_numbers(self):
+        expect(self.index.lookup(600123456)).to(equal({'assignees': ['VODAFONE'], 'sub_assignees': [], 'wholesaler': ''}))
+
+    def test_it_resolves_shared_blocks_and_nested_sub_assigned_ranges(self):
+        expect(self.index.lookup(601419999)).to(equal(
+            {'assignees': ['VODAFONE', 'ORANGE'], 'sub_assignees': [], 'wholesaler': ''}
+        ))
+        expect(self.index.lookup(601409999)).to(equal(
+            {'assignees': ['VODAFONE', 'ORANGE'], 'sub_assignees': ['XFERA'], 'wholesaler': 'VODAFONE'}
+        ))
+        expect(self.index.lookup(601400999)).to(equal(
+            {'assignees': ['VODAFONE', 'ORANGE'], 'sub_assignees': ['XFERA', 'LEMON'], 'wholesaler': 'VODAFONE'}
+        ))
+
+    def test_it_returns_none_for_unassigned_numbers(self):
+        expect(self.index.lookup(100000000)).to(be_none)
+        expect(self.index.lookup(601300000)).to(be_none)
+        expect(self.index.lookup(999999999)).to(be_none)
+
+    def test_it_merges_adjacent_ranges_with_same_owners(self):
+        index = NumberIndex.from_registries([_registry('VODAFONE', '600', '1'), _registry('VODAFONE', '600', '2')])
+
+        expect(list(index.starts)).to(equal([600100000, 600300000]))
+
+    def test_it_loads_saved_indexes(self):
+        self.index.save(INDEX_FILE)
+
+        loaded = NumberIndex.load(INDEX_FILE)
+
+        for number in (600123456, 601400999, 601409999, 601500000, 601300000):
+            expect(loaded.lookup(number)).to(equal(self.index.lookup(number)))
+
+    def test_it_indexes_registry_columns(self):
+        index = NumberIndex.from_registries(RegistryColumns.from_registries(self.registries))
+
+        expect(index.lookup(601400999)).to(equal(self.index.lookup(601400999)))
@@ -0,0 +1,39 @@
+import os
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import operator_ids
+
+REGISTRY_FILE = '/tmp/test_operator_ids.json'
+OPERATORS_FILE = '/tmp/test_operator_ids_operators.js'
+
+
+class OperatorIdsTestCase(TestCase):
+
+    def tearDown(self) -> None:
+        for filepath in (REGISTRY_FILE, OPERATORS_FILE):
+            if os.path.exists(filepath):
+                os.unlink(filepath)
+        return super().tearDown()
+
+    def test_it_seeds_ids_from_published_operators_file(self):
+        with open(OPERATORS_FILE, 'w', encoding='utf-8') as f:
+            f.write('landlineOperators = {"1": {"id": "1", "name": "VODAFONE ONO", "date_added": "2003-07-10"}}')
+
+        expect(operator_ids.load(REGISTRY_FILE, operators_js=OPERATORS_FILE)).to(equal({'VODAFONE ONO': '1'}))
+        expect(operator_ids.load(REGISTRY_FILE)).to(equal({}))
+
+    def test_it_keeps_retired_operators(self):
+        operator_ids.save(REGISTRY_FILE, {'RETIRED': '1', 'VODAFONE ONO': '2'})
+
+        ids = operator_ids.merge(
+            operator_ids.load(REGISTRY_FILE, operators_js=OPERATORS_FILE),
+            {'2': {'id': '2', 'name': 'VODAFONE ONO'}, '3': {'id': '3', 'name': 'AVATEL MÓVIL'}}
+        )
+        operator_ids.save(REGISTRY_FILE, ids)
+
+        expect(operator_ids.load(REGISTRY_FILE)).to(equal({'RETIRED': '1', 'VODAFONE ONO': '2', 'AVATEL MÓVIL': '3'}))
@@ -0,0 +1,61 @@
+import os
+import shutil
+import time
+from unittest import TestCase
+
+from expects import (
+    be_none,
+    equal,
+    expect
+)
+
+from backend import parse_cache
+
+CACHE_DIR = '/tmp/test_parse_cache'
+SOURCE_FILE = '/tmp/test_parse_cache.txt'
+
+
+class ParseCacheTestCase(TestCase):
+
+    def setUp(self):
+        with open(SOURCE_FILE, 'w', encoding='iso-8859-15') as f:
+            f.write('815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2021\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        try:
+            os.unlink(SOURCE_FILE)
+        except Exception:
+            pass
+        return super().tearDown()
+
+    def test_it_keys_sources_by_content_and_parser_version(self):
+        key = parse_cache.source_key(SOURCE_FILE, '1')
+
+        expect(parse_cache.source_key(SOURCE_FILE, '1')).to(equal(key))
+        expect(parse_cache.source_key(SOURCE_FILE, '2') == key).to(equal(False))
+        with open(SOURCE_FILE, 'a', encoding='iso-8859-15') as f:
+            f.write('822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003\n')
+        expect(parse_cache.source_key(SOURCE_FILE, '1') == key).to(equal(False))
+
+    def test_it_has_no_key_for_missing_sources(self):
+        expect(parse_cache.source_key('/tmp/missing_source.txt', '1')).to(be_none)
+
+    def test_it_loads_stored_registries(self):
+        registries = [{'operator': 'AVATEL MÓVIL', 'volume': 10000}]
+
+        parse_cache.store(CACHE_DIR, 'key', registries, max_bytes=1024 * 1024)
+
+        expect(parse_cache.load(CACHE_DIR, 'key')).to(equal(registries))
+        expect(parse_cache.load(CACHE_DIR, 'missing_key')).to(be_none)
+
+    def test_it_evicts_least_recently_used_entries_above_size_limit(self):
+        parse_cache.store(CACHE_DIR, 'first', ['x' * 1000], max_bytes=2500)
+        parse_cache.store(CACHE_DIR, 'second', ['y' * 1000], max_bytes=2500)
+        past = time.time() - 60
+        os.utime(f'{CACHE_DIR}/second.pickle', (past, past))
+        parse_cache.load(CACHE_DIR, 'first')
+
+        parse_cache.store(CACHE_DIR, 'third', ['z' * 1000], max_bytes=2500)
+
+        expect(sorted(os.listdir(CACHE_DIR))).to(equal(['first.pickle', 'third.pickle']))
@@ -1,13 +1,23 @@
+import io
 import os
 import json
+import pickle
+import shutil
+import threading
 from datetime import (
     datetime,
     timedelta
 )
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
 from unittest import (
-    TestCase
+    TestCase,
+    skipIf,
 )
 from unittest import mock
+from zipfile import ZipFile
 
 from expects import (
     be_true,
@@ -16,16 +26,51 @@ from expects import (
     expect
 )
 
+from backend import (
+    binary_dataset,
+    delta,
+)
+from backend.number_index import NumberIndex
 from backend.preprocess_data import (
     run,
-    _build_dataset,
+    _db_is_outdated,
+    _download_bd,
+    _get_operators,
+    _http_session,
     _load_file,
+)
+from backend.registries import (
+    np,
+    Registry,
+    build_dataset,
+    read_csv_lines,
+    unique_ordered_years,
+    _iter_registries,
     _operators_status_by_year,
-    _read_csv_lines,
-    _unique_ordered_years,
 )
 
 db_is_up_to_date = mock.MagicMock(return_value=False)
+# Mocks only apply to the current process
+serial_pipelines = mock.patch('backend.preprocess_data.PIPELINE_WORKERS', 1)
+
+
+LANDLINE_LINES = (
+    '815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2021\n'
+    '822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003\n'
+)
+MOBILE_LINES = (
+    '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998\n'
+    '601#4##Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#21/09/2015\n'
+    '601#4# #Subasignado 0#XFERA MÓVILES, S.A. UNIPERSONAL#02/02/2021\n'
+)
+
+
+def _zip_content(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w') as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content.encode('iso-8859-15'))
+    return buffer.getvalue()
 
 
 class BaseTestCase(TestCase):
@@ -36,8 +81,16 @@ class BaseTestCase(TestCase):
             '/tmp/moviles.txt',
             '/tmp/landline_operators.js',
             '/tmp/mobile_operators.js',
+            '/tmp/landline_operator_ids.json',
+            '/tmp/mobile_operator_ids.json',
+            '/tmp/layout.js',
+            '/tmp/clusters.js',
+            '/tmp/dataset.bin',
+            '/tmp/.static_assets.json',
             '/tmp/landline_data.js',
             '/tmp/mobile_data.js',
+            '/tmp/bd-num.zip',
+            '/tmp/bd-num.meta.json',
         )
         for filepath in files_to_delete:
             try:
@@ -47,6 +100,247 @@ class BaseTestCase(TestCase):
         return super().tearDown()
 
 
+@mock.patch('backend.preprocess_data._db_is_outdated', db_is_up_to_date)
+@mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
+class PreprocessDataRunTestCase(BaseTestCase):
+
+    def setUp(self):
+        for filepath, content in (('/tmp/geograficos.txt', LANDLINE_LINES), ('/tmp/moviles.txt', MOBILE_LINES)):
+            with open(filepath, 'w', encoding='iso-8859-15') as f:
+                f.write(content)
+
+    def _outputs(self, output_dir='/tmp'):
+        outputs = []
+        for filename in ('landline_operators.js', 'mobile_operators.js', 'dataset.js'):
+            with open(f'{output_dir}/{filename}', encoding='utf-8') as f:
+                outputs.append(f.read())
+        return outputs
+
+    def test_it_generates_same_outputs_in_parallel_and_serially(self):
+        expect(run(workers=2)).to(equal(0))
+        parallel_outputs = self._outputs()
+
+        expect(run(workers=1)).to(equal(0))
+        expect(self._outputs()).to(equal(parallel_outputs))
+
+    def test_it_exports_dataset_shards_with_manifest(self):
+        self.addCleanup(shutil.rmtree, '/tmp/shards', ignore_errors=True)
+        run(workers=1)
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        landline_data = json.loads(content[len('landlineData = '):content.index('; mobileData = ')])
+
+        run(workers=1, dataset_format='shards')
+
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        expect(content.startswith('datasetManifest = ')).to(be_true)
+        manifest = json.loads(content[len('datasetManifest = '):-1])
+        expect(sorted(manifest['landline'])).to(equal(sorted(landline_data)))
+        expect(manifest['landline']['2003']['file']).to(equal('data/shards/landline/2003.json'))
+        with open('/tmp/shards/landline/2003.json', encoding='utf-8') as f:
+            expect(json.load(f)).to(equal(landline_data['2003']))
+
+    def test_it_exports_dataset_deltas(self):
+        run(workers=1)
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        mobile_data = json.loads(content[content.index('; mobileData = ') + len('; mobileData = '):-1])
+
+        run(workers=1, dataset_format='delta')
+
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        expect(content.startswith('landlineDelta = ')).to(be_true)
+        mobile_delta = json.loads(content[content.index('; mobileDelta = ') + len('; mobileDelta = '):-1])
+        expect(delta.decode(mobile_delta)).to(equal(mobile_data))
+
+    def test_it_exports_binary_dataset(self):
+        run(workers=1)
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        landline_data = json.loads(content[len('landlineData = '):content.index('; mobileData = ')])
+
+        run(workers=2, dataset_format='binary')
+
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        expect(content.startswith('datasetBinary = ')).to(be_true)
+        expect(json.loads(content[len('datasetBinary = '):-1])['file']).to(equal('data/dataset.bin'))
+        with open('/tmp/dataset.bin', 'rb') as f:
+            expect(binary_dataset.decode(f.read())['landline']).to(equal(landline_data))
+
+    def test_it_removes_sidecars_when_no_longer_precompressing(self):
+        run(workers=1, precompress=True)
+        expect(os.path.exists('/tmp/dataset.js.gz')).to(be_true)
+
+        run(workers=1)
+
+        expect(os.path.exists('/tmp/dataset.js.gz')).to(equal(False))
+        expect(os.path.exists('/tmp/landline_operators.js.gz')).to(equal(False))
+
+    def test_it_removes_files_of_other_dataset_formats(self):
+        self.addCleanup(shutil.rmtree, '/tmp/shards', ignore_errors=True)
+        run(workers=1, dataset_format='binary', precompress=True)
+        run(workers=1, dataset_format='shards', precompress=True)
+        expect(os.path.exists('/tmp/dataset.bin')).to(equal(False))
+        expect(os.path.exists('/tmp/dataset.bin.gz')).to(equal(False))
+        expect(os.path.exists('/tmp/shards/landline/2003.json.gz')).to(be_true)
+
+        run(workers=1)
+
+        expect(os.path.exists('/tmp/shards')).to(equal(False))
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            expect(f.read().startswith('landlineData = ')).to(be_true)
+
+    def test_it_writes_stage_report_when_enabled(self):
+        self.addCleanup(os.unlink, '/tmp/report.json')
+
+        with mock.patch.dict(os.environ, {'PREPROCESS_DATA_REPORT': '/tmp/report.json'}):
+            expect(run(workers=2)).to(equal(0))
+
+        with open('/tmp/report.json', encoding='utf-8') as f:
+            report = json.load(f)
+        expect(report['exit_code']).to(equal(0))
+        stages = {(stage.get('market'), stage['stage']): stage for stage in report['stages']}
+        expect(stages[('mobile', 'parse')]['rows_out']).to(equal(3))
+        expect(stages[('mobile', 'dataset')]['rows_out']).to(equal(24))
+        expect(stages[(None, 'export')]['rows_in']).to(equal(43))
+        expect(stages[(None, 'export')]['peak_bytes'] > 0).to(be_true)
+
+    def test_it_saves_number_indexes(self):
+        self.addCleanup(shutil.rmtree, '/tmp/number_index', ignore_errors=True)
+
+        expect(run(workers=2, number_index_dir='/tmp/number_index')).to(equal(0))
+
+        index = NumberIndex.load('/tmp/number_index/mobile.numidx')
+        expect(index.lookup(601400123)['sub_assignees']).to(equal(['XFERA MÓVILES, S.A. UNIPERSONAL']))
+        expect(NumberIndex.load('/tmp/number_index/landline.numidx').lookup(822010000)['assignees']).to(
+            equal(['VODAFONE ONO'])
+        )
+
+    def test_it_builds_same_dataset_from_sqlite(self):
+        for suffix in ('', '-wal', '-shm'):
+            self.addCleanup(lambda path: os.path.exists(path) and os.unlink(path), f'/tmp/registries.sqlite{suffix}')
+        run(workers=1)
+        outputs = self._outputs()
+
+        expect(run(workers=2, sqlite_path='/tmp/registries.sqlite', sqlite_datasets=True)).to(equal(0))
+
+        expect(self._outputs()).to(equal(outputs))
+
+    def test_it_builds_outputs_from_archived_releases(self):
+        self.addCleanup(shutil.rmtree, '/tmp/releases', ignore_errors=True)
+        with mock.patch('backend.preprocess_data._release_date', return_value='2021-05-01'):
+            run(workers=1, archive_dir='/tmp/releases')
+        first_outputs = self._outputs()
+        with open('/tmp/moviles.txt', 'w', encoding='iso-8859-15') as f:
+            f.write(MOBILE_LINES.replace('VODAFONE', 'TELEFONICA'))
+        with mock.patch('backend.preprocess_data._release_date', return_value='2021-06-01'):
+            run(workers=1, archive_dir='/tmp/releases')
+
+        self.addCleanup(shutil.rmtree, '/tmp/as_of', ignore_errors=True)
+        with open('/tmp/mobile_operator_ids.json', encoding='utf-8') as f:
+            operator_ids = f.read()
+        live_outputs = self._outputs()
+
+        expect(run(workers=2, archive_dir='/tmp/releases', as_of='2021-05-31', output_dir='/tmp/as_of')).to(equal(0))
+
+        expect(self._outputs(output_dir='/tmp/as_of')).to(equal(first_outputs))
+        expect(self._outputs()).to(equal(live_outputs))
+        with open('/tmp/mobile_operator_ids.json', encoding='utf-8') as f:
+            expect(f.read()).to(equal(operator_ids))
+        with self.assertRaises(ValueError):
+            run(workers=1, archive_dir='/tmp/releases', as_of='2021-05-31')
+
+    def test_it_doesnt_archive_releases_that_cant_be_parsed(self):
+        self.addCleanup(shutil.rmtree, '/tmp/releases', ignore_errors=True)
+        os.unlink('/tmp/moviles.txt')
+
+        expect(run(workers=1, archive_dir='/tmp/releases')).to(equal(1))
+
+        expect(os.path.exists('/tmp/releases/releases.json')).to(equal(False))
+
+    def test_it_keeps_operator_ids_between_runs(self):
+        run(workers=1)
+        landline_operators, _, _ = self._outputs()
+        with open('/tmp/geograficos.txt', 'w', encoding='iso-8859-15') as f:
+            f.write('810#00#Madrid#Asignado#NEW OPERATOR#01/01/2021\n' + ''.join(reversed(LANDLINE_LINES.splitlines(True))))
+
+        run(workers=2)
+
+        with open('/tmp/landline_operators.js', encoding='utf-8') as f:
+            operators = json.loads(f.read()[len('landlineOperators = '):])
+        expect({_id: operator['name'] for _id, operator in operators.items()}).to(equal({
+            '1': 'AVATEL MÓVIL', '2': 'VODAFONE ONO', '3': 'NEW OPERATOR'
+        }))
+        expect(landline_operators.startswith('landlineOperators = {"1": {"id": "1", "name": "AVATEL')).to(be_true)
+
+    def test_it_keeps_unchanged_outputs_untouched(self):
+        run(workers=1)
+        for filename in ('landline_operators.js', 'mobile_operators.js', 'dataset.js'):
+            os.utime(f'/tmp/{filename}', (0, 0))
+
+        run(workers=1)
+
+        for filename in ('landline_operators.js', 'mobile_operators.js', 'dataset.js'):
+            expect(os.path.getmtime(f'/tmp/{filename}')).to(equal(0))
+
+    def test_it_keeps_operator_ids_out_of_published_files(self):
+        self.addCleanup(shutil.rmtree, '/tmp/published', ignore_errors=True)
+        self.addCleanup(shutil.rmtree, '/tmp/test_state', ignore_errors=True)
+
+        run(workers=1, output_dir='/tmp/published', state_dir='/tmp/test_state')
+
+        expect([name for name in os.listdir('/tmp/published') if 'operator_ids' in name]).to(equal([]))
+        with open('/tmp/test_state/landline_operator_ids.json', encoding='utf-8') as f:
+            expect(json.load(f)['operators']).to(equal({'AVATEL MÓVIL': '1', 'VODAFONE ONO': '2'}))
+
+    @skipIf(np is None, 'NumPy is not installed')
+    def test_it_exports_graph_layout_of_every_year(self):
+        run(workers=2, graph_layout=True)
+
+        with open('/tmp/dataset.js', encoding='utf-8') as f:
+            content = f.read()
+        mobile_data = json.loads(content[content.index('; mobileData = ') + len('; mobileData = '):-1])
+        with open('/tmp/layout.js', encoding='utf-8') as f:
+            content = f.read()
+        mobile_layout = json.loads(content[content.index('; mobileLayout = ') + len('; mobileLayout = '):-1])
+        expect(list(mobile_layout)).to(equal(list(mobile_data)))
+        expect(sorted(mobile_layout['2021'])).to(equal(
+            sorted(['0'] + [op['id'] for op in mobile_data['2021']['operators']])
+        ))
+
+        run(workers=1)
+
+        with open('/tmp/layout.js', encoding='utf-8') as f:
+            expect(f.read()).to(equal('landlineLayout = {}; mobileLayout = {};'))
+
+    def test_it_exports_clustered_views_of_every_year(self):
+        run(workers=2, cluster_top=1)
+
+        with open('/tmp/clusters.js', encoding='utf-8') as f:
+            content = f.read()
+        mobile_clusters = json.loads(content[content.index('; mobileClusters = ') + len('; mobileClusters = '):-1])
+        expect([op['id'] for op in mobile_clusters['2021']['operators']]).to(equal(['1']))
+        expect(mobile_clusters['2021']['clusters']).to(equal([
+            {'id': 'cluster-1', 'volume': 10000, 'links': ['1'], 'members': ['2']}
+        ]))
+
+    def test_it_returns_error_code_when_one_market_has_no_data(self):
+        os.unlink('/tmp/moviles.txt')
+
+        expect(run(workers=2)).to(equal(1))
+
+    def test_it_raises_pipeline_errors_to_the_caller(self):
+        with open('/tmp/moviles.txt', 'w', encoding='iso-8859-15') as f:
+            f.write('601#4# #Subasignado 0#XFERA MÓVILES, S.A. UNIPERSONAL#02/02/2021\n')
+
+        with self.assertRaises(ZeroDivisionError):
+            run(workers=2)
+
+
+@serial_pipelines
 class PreprocessDataDownloadDbTestCase(BaseTestCase):
 
     def setUp(self):
@@ -59,10 +353,12 @@ class PreprocessDataDownloadDbTestCase(BaseTestCase):
 
         run()
 
-        http_client.get.assert_called_with(
+        http_client.Session.return_value.get.assert_called_with(
             self.bd_url,
             headers={'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:88.0) Gecko/20100101 Firefox/88.0'},
-            allow_redirects=True
+            allow_redirects=True,
+            stream=True,
+            timeout=60
         )
 
     @mock.patch('backend.preprocess_data.requests')
@@ -72,14 +368,186 @@ class PreprocessDataDownloadDbTestCase(BaseTestCase):
 
         run()
 
-        http_client.get.assert_not_called()
+        http_client.Session.return_value.get.assert_not_called()
+
+    @mock.patch('backend.preprocess_data.requests')
+    def test_it_streams_bd_to_disk_and_extracts_files(self, http_client):
+        content = _zip_content({'geograficos.txt': LANDLINE_LINES, 'moviles.txt': MOBILE_LINES})
+        http_client.get.return_value.headers = {'ETag': '"v1"'}
+        http_client.get.return_value.iter_content.return_value = [content[:100], content[100:]]
+
+        _download_bd(self.bd_url)
+
+        http_client.get.return_value.iter_content.assert_called_with(chunk_size=1024 * 1024)
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(LANDLINE_LINES.splitlines()))
+        expect(read_csv_lines('/tmp/moviles.txt')).to(equal(MOBILE_LINES.splitlines()))
+        expect(os.path.exists('/tmp/bd-num.zip')).to(equal(False))
+
+    @mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
+    @mock.patch('backend.preprocess_data.requests')
+    @mock.patch('backend.preprocess_data._db_is_outdated')
+    def test_it_parses_bd_files_from_zip(self, is_outdated, http_client):
+        is_outdated.return_value = True
+        content = _zip_content({'geograficos.txt': LANDLINE_LINES, 'moviles.txt': MOBILE_LINES})
+        http_client.Session.return_value.get.return_value.headers = {}
+        http_client.Session.return_value.get.return_value.iter_content.return_value = [content]
+
+        return_code = run(from_zip=True)
+
+        expect(return_code).to(equal(0))
+        is_outdated.assert_called_with(filepath='/tmp/bd-num.zip', session=http_client.Session.return_value)
+        expect(os.path.exists('/tmp/geograficos.txt')).to(equal(False))
+        expect(os.path.exists('/tmp/bd-num.zip')).to(be_true)
+        expect(_load_file('/tmp/moviles.txt', archive='/tmp/bd-num.zip')[0]).to(have_keys({
+            'operator': 'VODAFONE ESPAÑA, S.A. UNIPERSONAL',
+            'nmin': 600000000,
+        }))
+
+
+class BdRequestHandler(BaseHTTPRequestHandler):
+    content = b''
+    etag = ''
+    status = 200
+    requests = []
+
+    def do_HEAD(self):
+        self._respond(with_body=False)
+
+    def do_GET(self):
+        self._respond(with_body=True)
+
+    def _respond(self, with_body):
+        not_modified = self.headers.get('If-None-Match') == self.etag
+        BdRequestHandler.requests.append((self.command, 304 if not_modified else self.status))
+        if not_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(self.status)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.content)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(self.content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreprocessDataFreshnessTestCase(BaseTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), BdRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/bd-num.zip'
+        self.session = _http_session()
+        BdRequestHandler.requests = []
+        BdRequestHandler.status = 200
+        self._publish('"v1"', LANDLINE_LINES)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        return super().tearDown()
+
+    def _publish(self, etag, landline_lines):
+        BdRequestHandler.etag = etag
+        BdRequestHandler.content = _zip_content({'geograficos.txt': landline_lines, 'moviles.txt': MOBILE_LINES})
+
+    def test_it_skips_download_when_bd_is_not_modified(self):
+        _download_bd(self.url, session=self.session)
+
+        is_outdated = _db_is_outdated('/tmp/geograficos.txt', session=self.session, url=self.url)
+        _download_bd(self.url, session=self.session)
+
+        expect(is_outdated).to(equal(False))
+        expect(BdRequestHandler.requests).to(equal([('GET', 200), ('HEAD', 304), ('GET', 304)]))
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(LANDLINE_LINES.splitlines()))
+
+    def test_it_downloads_bd_again_when_modified_the_same_day(self):
+        _download_bd(self.url, session=self.session)
+        self._publish('"v2"', '822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013\n')
 
+        is_outdated = _db_is_outdated('/tmp/geograficos.txt', session=self.session, url=self.url)
+        _download_bd(self.url, session=self.session)
 
+        expect(is_outdated).to(be_true)
+        expect(BdRequestHandler.requests).to(equal([('GET', 200), ('HEAD', 200), ('GET', 200)]))
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(['822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013']))
+
+    def test_it_keeps_cached_bd_when_server_answers_an_error(self):
+        _download_bd(self.url, extract=False, session=self.session)
+        with open('/tmp/bd-num.zip', 'rb') as f:
+            archive = f.read()
+        BdRequestHandler.status = 404
+        BdRequestHandler.etag = '"v2"'
+        BdRequestHandler.content = b'<html>Not Found</html>'
+
+        _download_bd(self.url, extract=False, session=self.session)
+
+        with open('/tmp/bd-num.zip', 'rb') as f:
+            expect(f.read()).to(equal(archive))
+        with open('/tmp/bd-num.meta.json', encoding='utf-8') as f:
+            expect(json.load(f)['etag']).to(equal('"v1"'))
+        expect(os.path.exists('/tmp/bd-num.zip.part')).to(equal(False))
+
+    def test_it_keeps_cached_bd_when_downloaded_archive_is_corrupt(self):
+        _download_bd(self.url, session=self.session)
+        self._publish('"v2"', '822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013\n')
+        content = BdRequestHandler.content
+        position = content.index(b'AIRE')
+        BdRequestHandler.content = content[:position] + b'X' + content[position + 1:]
+
+        _download_bd(self.url, session=self.session)
+
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(LANDLINE_LINES.splitlines()))
+        with open('/tmp/bd-num.meta.json', encoding='utf-8') as f:
+            expect(json.load(f)['etag']).to(equal('"v1"'))
+        expect(os.path.exists('/tmp/bd-num.zip.part')).to(equal(False))
+
+    def test_it_keeps_cached_bd_when_server_keeps_failing(self):
+        _download_bd(self.url, session=self.session)
+        BdRequestHandler.status = 503
+        BdRequestHandler.etag = '"v2"'
+        BdRequestHandler.requests = []
+
+        with mock.patch('backend.preprocess_data.HTTP_RETRIES', 1):
+            session = _http_session()
+        self.addCleanup(session.close)
+        _download_bd(self.url, session=session)
+
+        expect(BdRequestHandler.requests).to(equal([('GET', 503), ('GET', 503)]))
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(LANDLINE_LINES.splitlines()))
+
+    def test_it_keeps_cached_bd_when_server_is_unreachable(self):
+        _download_bd(self.url, session=self.session)
+        self.server.shutdown()
+        self.server.server_close()
+
+        with mock.patch('backend.preprocess_data.HTTP_RETRIES', 0):
+            session = _http_session()
+        self.addCleanup(session.close)
+        _download_bd(self.url, session=session)
+
+        expect(read_csv_lines('/tmp/geograficos.txt')).to(equal(LANDLINE_LINES.splitlines()))
+
+    def test_it_checks_file_date_when_bd_metadata_is_unknown(self):
+        with open('/tmp/geograficos.txt', 'w') as f:
+            f.write(LANDLINE_LINES)
+
+        is_outdated = _db_is_outdated('/tmp/geograficos.txt', session=self.session, url=self.url)
+
+        expect(is_outdated).to(equal(False))
+        expect(BdRequestHandler.requests).to(equal([]))
+
+
+@serial_pipelines
 @mock.patch('backend.preprocess_data._db_is_outdated', db_is_up_to_date)
 class PreprocessDataLoadTestCase(BaseTestCase):
 
     def test_it_reads_landline_and_mobile_files(self):
-        with mock.patch('backend.preprocess_data.open', mock.mock_open()) as open_file:
+        with mock.patch('backend.registries.open', mock.mock_open()) as open_file:
 
             run()
 
@@ -103,7 +571,7 @@ class PreprocessDataLoadTestCase(BaseTestCase):
         with open('/tmp/test.csv', encoding='iso-8859-15', mode='w') as f:
             f.write(file_content)
 
-        lines = _read_csv_lines(filepath='/tmp/test.csv')
+        lines = read_csv_lines(filepath='/tmp/test.csv')
 
         expect(lines).to(equal([
             '815#00#Madrid#Asignado#AVATEL MÓVIL, S.L. UNIPERSONAL#30/04/2021',
@@ -111,6 +579,27 @@ class PreprocessDataLoadTestCase(BaseTestCase):
             '822#01#Alicante#Compartido#VODAFONE ESPAÑA, S.A. UNIPERSONAL#21/12/2016'
         ]))
 
+    def test_it_streams_csv_lines_lazily(self):
+        file_content = (
+            '815#00#Madrid#Asignado#AVATEL MÓVIL, S.L. UNIPERSONAL#30/04/2021\n'
+            '640#4##Libre con Portados##21/12/2018\n'
+            'wrong line\n'
+        )
+        with open('/tmp/test.csv', encoding='iso-8859-15', mode='w') as f:
+            f.write(file_content)
+
+        lines = read_csv_lines(filepath='/tmp/test.csv', stream=True)
+
+        expect(next(lines)).to(equal('815#00#Madrid#Asignado#AVATEL MÓVIL, S.L. UNIPERSONAL#30/04/2021'))
+        registries = list(_iter_registries(read_csv_lines(filepath='/tmp/test.csv', stream=True)))
+        expect(len(registries)).to(equal(1))
+        expect(registries[0]).to(have_keys({'operator': 'AVATEL MÓVIL, S.L. UNIPERSONAL', 'nmin': 815000000}))
+
+    def test_it_streams_nothing_when_file_is_missing(self):
+        lines = read_csv_lines(filepath='/tmp/missing_file.csv', stream=True)
+
+        expect(list(lines)).to(equal([]))
+
     def test_it_loads_file_content_into_objects(self):
         file_content = (
             '815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2021\n'
@@ -187,11 +676,121 @@ class PreprocessDataLoadTestCase(BaseTestCase):
         }))
 
 
+class PreprocessDataRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.fields = {
+            'operator': 'WIFI CANARIAS',
+            'wholesaler': '',
+            'date': '2018-05-15',
+            'index': '822',
+            'block': '24',
+            'sub_block': '03',
+            'nmin': 822240300,
+            'nmax': 822240399,
+            'volume': 100,
+            'type': 'subasignado',
+        }
+
+    def test_it_behaves_like_a_registry_dict(self):
+        registry = Registry(**self.fields)
+
+        registry['wholesaler'] = 'AIRE NETWORKS'
+
+        expect(registry).to(equal(dict(self.fields, wholesaler='AIRE NETWORKS')))
+        expect(registry.get('unknown')).to(equal(None))
+        with self.assertRaises(KeyError):
+            registry['unknown'] = 'value'
+
+    def test_it_interns_repeated_strings(self):
+        first = Registry(**dict(self.fields, operator=''.join(['WIFI ', 'CANARIAS'])))
+        second = Registry(**self.fields)
+
+        expect(first['operator'] is second['operator']).to(be_true)
+
+    def test_it_can_be_pickled(self):
+        registry = Registry(**self.fields)
+
+        expect(pickle.loads(pickle.dumps(registry))).to(equal(registry))
+
+
+class PreprocessDataParseCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        with open('/tmp/test.csv', encoding='iso-8859-15', mode='w') as f:
+            f.write(LANDLINE_LINES + '822#01#Cuenca#Compartido#VODAFONE ESPAÑA#21/12/2016\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree('/tmp/test_parse_cache', ignore_errors=True)
+        return super().tearDown()
+
+    def test_it_reuses_registries_parsed_from_identical_files(self):
+        registries = _load_file('/tmp/test.csv', cache_dir='/tmp/test_parse_cache')
+
+        with mock.patch('backend.preprocess_data._parse_file') as parse_file:
+            cached_registries = _load_file('/tmp/test.csv', cache_dir='/tmp/test_parse_cache')
+
+            parse_file.assert_not_called()
+        expect(list(cached_registries)).to(equal(list(registries)))
+        expect(_get_operators(cached_registries)).to(equal(_get_operators(registries)))
+        expect(cached_registries[2]).to(have_keys({'operator': 'VODAFONE ESPAÑA', 'volume': 5000}))
+
+    def test_it_parses_file_again_when_content_changes(self):
+        _load_file('/tmp/test.csv', cache_dir='/tmp/test_parse_cache')
+        with open('/tmp/test.csv', encoding='iso-8859-15', mode='a') as f:
+            f.write('822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013\n')
+
+        registries = _load_file('/tmp/test.csv', cache_dir='/tmp/test_parse_cache')
+
+        expect(len(registries)).to(equal(4))
+
+
+@skipIf(np is None, 'NumPy is not installed')
+class PreprocessDataVectorizedLoadTestCase(BaseTestCase):
+
+    def setUp(self):
+        file_content = (
+            '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998\n'
+            '601#4##Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#21/09/2015\n'
+            '601#4# #Subasignado 0#XFERA MÓVILES, S.A. UNIPERSONAL#02/02/2021\n'
+            '640#4##Libre con Portados##21/12/2018\n'
+            '822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003\n'
+            '822#01#Cuenca#Compartido#VODAFONE ESPAÑA#21/12/2016\n'
+            '822#01#Cuenca#Compartido#DUOCOM#21/12/2017\n'
+            '822#24#Cuenca#Subasignado 03#WIFI CANARIAS#15/05/2018\n'
+            '822#24#Cuenca#Asignado#AIRE NETWORKS#09/07/2013\n'
+        )
+        with open('/tmp/test.csv', encoding='iso-8859-15', mode='w') as f:
+            f.write(file_content)
+
+    def test_it_loads_same_registries_with_and_without_numpy(self):
+        vectorized_registries = _load_file('/tmp/test.csv')
+        with mock.patch('backend.registries.np', None):
+            registries = _load_file('/tmp/test.csv')
+
+        expect(len(vectorized_registries)).to(equal(8))
+        expect(vectorized_registries).to(equal(registries))
+        expect(vectorized_registries[5]).to(have_keys({'volume': 3333, 'type': 'compartido'}))
+        expect(vectorized_registries[2]).to(have_keys({
+            'wholesaler': 'VODAFONE ESPAÑA, S.A. UNIPERSONAL',
+            'nmin': 601400000,
+            'nmax': 601409999,
+        }))
+
+    def test_it_falls_back_to_python_path_on_blocks_without_owner(self):
+        with open('/tmp/test.csv', encoding='iso-8859-15', mode='w') as f:
+            f.write('822#24#Cuenca#Subasignado 03#WIFI CANARIAS#15/05/2018\n')
+
+        with self.assertRaises(ZeroDivisionError):
+            _load_file('/tmp/test.csv')
+
+
+@serial_pipelines
 @mock.patch('backend.preprocess_data._db_is_outdated', db_is_up_to_date)
 class PreprocessDataExportOperatorsTestCase(BaseTestCase):
 
     @mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
-    @mock.patch('backend.preprocess_data._read_csv_lines')
+    @mock.patch('backend.preprocess_data.read_csv_lines')
     def test_it_exports_landline_operators(self, read_csv_lines):
         file_content = (
             '815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2021',
@@ -239,7 +838,7 @@ class PreprocessDataExportOperatorsTestCase(BaseTestCase):
             expect(file_content).to(equal(expected_content))
 
     @mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
-    @mock.patch('backend.preprocess_data._read_csv_lines')
+    @mock.patch('backend.preprocess_data.read_csv_lines')
     def test_it_exports_mobile_operators(self, read_csv_lines):
         file_content = (
             '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998',
@@ -269,6 +868,7 @@ class PreprocessDataExportOperatorsTestCase(BaseTestCase):
             expect(file_content).to(equal(expected_content))
 
 
+@serial_pipelines
 @mock.patch('backend.preprocess_data._db_is_outdated', db_is_up_to_date)
 class PreprocessDataBuildBaseGraphDatasetTestCase(BaseTestCase):
 
@@ -310,7 +910,7 @@ class PreprocessDataBuildBaseGraphDatasetTestCase(BaseTestCase):
             }
         ]
 
-        years = _unique_ordered_years(registries)
+        years = unique_ordered_years(registries)
 
         expect(years).to(equal(['2020', '2021']))
 
@@ -403,7 +1003,7 @@ class PreprocessDataBuildBaseGraphDatasetTestCase(BaseTestCase):
         ]
         operators_by_name = {'operator 1': '1', 'operator 2': '2', 'operator 3': '3'}
 
-        dataset = _build_dataset(registries, operators_by_name)
+        dataset = build_dataset(registries, operators_by_name)
 
         expect(len(dataset)).to(equal(21))
         expect(dataset['1999']).to(have_keys({
@@ -436,8 +1036,26 @@ class PreprocessDataBuildBaseGraphDatasetTestCase(BaseTestCase):
             ]
         }))
 
+    def test_it_builds_same_dataset_as_operators_status_by_year(self):
+        registries = [
+            {'operator': 'operator 3', 'wholesaler': '', 'date': '2001-05-01', 'volume': 10000, 'type': 'asignado'},
+            {'operator': 'operator 1', 'wholesaler': '', 'date': '2003-01-30', 'volume': 10000, 'type': 'asignado'},
+            {'operator': 'operator 2', 'wholesaler': 'operator 10', 'date': '2002-02-01', 'volume': 100, 'type': 'subasignado'},
+            {'operator': 'operator 2', 'wholesaler': 'operator 3', 'date': '2004-02-01', 'volume': 100, 'type': 'subasignado'},
+            {'operator': 'operator 10', 'wholesaler': '', 'date': '1999-12-01', 'volume': 5000, 'type': 'compartido'},
+            {'operator': 'operator 1', 'wholesaler': 'operator 10', 'date': '1999-07-07', 'volume': 100, 'type': 'subasignado'},
+        ]
+        operators_by_name = {'operator 1': '1', 'operator 2': '2', 'operator 3': '3', 'operator 10': '10'}
+
+        dataset = build_dataset(registries, operators_by_name)
+
+        expect(list(dataset.keys())).to(equal(['1999', '2000', '2001', '2002', '2003', '2004']))
+        for year, status in dataset.items():
+            expect(status['operators']).to(equal(_operators_status_by_year(year, registries, operators_by_name)))
+        expect(dataset['2004']['operators'][-1]).to(equal({'id': '2', 'volume': 200, 'links': ['10', '3']}))
+
     @mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
-    @mock.patch('backend.preprocess_data._read_csv_lines')
+    @mock.patch('backend.preprocess_data.read_csv_lines')
     def test_it_generates_dataset_file(self, read_csv_lines):
         landline_file_content = (
             '815#00#Madrid#Asignado#AVATEL MÓVIL#30/04/2021',
@@ -527,3 +1145,33 @@ class PreprocessDataBuildBaseGraphDatasetTestCase(BaseTestCase):
             file_content = f.read()
             for registry in minimum_expected_registries:
                 expect(registry in file_content).to(be_true)
+
+    @mock.patch('backend.preprocess_data.OUTPUT_DIR', '/tmp')
+    @mock.patch('backend.preprocess_data.read_csv_lines')
+    def test_it_generates_same_dataset_file_incrementally(self, read_csv_lines):
+        landline_file_content = (
+            '822#01#Cuenca#Asignado#VODAFONE ONO#10/07/2003',
+            '822#01#Cuenca#Compartido#VODAFONE ESPAÑA#21/12/2016',
+        )
+        new_landline_file_content = landline_file_content + (
+            '822#01#Cuenca#Subasignado 03#WIFI CANARIAS#15/05/2018',
+        )
+        mobile_file_content = (
+            '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998',
+        )
+        self.addCleanup(shutil.rmtree, '/tmp/test_state', ignore_errors=True)
+        read_csv_lines.side_effect = (
+            landline_file_content, mobile_file_content,
+            new_landline_file_content, mobile_file_content,
+            new_landline_file_content, mobile_file_content,
+        )
+
+        run(state_dir='/tmp/test_state')
+        run(state_dir='/tmp/test_state')
+        with open('/tmp/dataset.js', 'r', encoding='utf-8') as f:
+            incremental_content = f.read()
+        run(state_dir='/tmp/test_state', full_rebuild=True)
+
+        with open('/tmp/dataset.js', 'r', encoding='utf-8') as f:
+            expect(f.read()).to(equal(incremental_content))
+        expect('{"id":"3","volume":50,"links":["1"]}' in incremental_content).to(be_true)
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import shutil
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import incremental
+from backend.registries import (
+    Registry,
+    build_dataset,
+)
+from backend.query_service import (
+    MAX_REQUEST_LINE,
+    QueryService,
+    ResponseCache,
+)
+
+STATE_DIR = '/tmp/test_query_service'
+
+
+def _registry(operator, prefix, _date, _type='asignado', wholesaler=''):
+    nmin, nmax = int(prefix.ljust(9, '0')), int(prefix.ljust(9, '9'))
+    return Registry(operator, wholesaler, _date, prefix[:3], prefix[3:], '', nmin, nmax, nmax - nmin + 1, _type)
+
+
+def _save_state(market, registries):
+    operators_by_name = {}
+    for registry in registries:
+        operators_by_name.setdefault(registry['operator'], str(len(operators_by_name) + 1))
+    incremental.save_state(
+        f'{STATE_DIR}/{market}.state.pickle', registries, operators_by_name, build_dataset(registries, operators_by_name)
+    )
+
+
+async def _get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+async def _raw(port, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+class QueryServiceTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(STATE_DIR)
+        _save_state('mobile', [
+            _registry('VODAFONE', '6014', '2011-03-01'),
+            _registry('XFERA', '60140', '2012-05-01', 'subasignado', 'VODAFONE'),
+        ])
+        _save_state('landline', [_registry('VODAFONE ONO', '82201', '2003-07-10')])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(STATE_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def _run(self, queries):
+        async def _queries():
+            service = QueryService(STATE_DIR, reload_interval=0)
+            _, port = await service.start()
+            try:
+                return await queries(service, port)
+            finally:
+                await service.close()
+        return asyncio.run(_queries())
+
+    def test_it_answers_yearly_operators_history_and_number_owners(self):
+        async def queries(service, port):
+            return [
+                await _get(port, '/markets/mobile/years/2012'),
+                await _get(port, '/markets/mobile/operators/2'),
+                await _get(port, '/numbers/601400123'),
+                await _get(port, '/numbers/999999999'),
+            ]
+
+        year, history, owners, unknown = self._run(queries)
+
+        expect(year).to(equal((200, {'year': '2012', 'operators': [
+            {'id': '1', 'volume': 100000, 'links': ['0'], 'name': 'VODAFONE'},
+            {'id': '2', 'volume': 10000, 'links': ['1'], 'name': 'XFERA'},
+        ]})))
+        expect(history).to(equal((200, {'id': '2', 'name': 'XFERA', 'years': [
+            {'year': '2012', 'id': '2', 'volume': 10000, 'links': ['1']},
+        ]})))
+        expect(owners).to(equal((200, {
+            'number': '601400123', 'market': 'mobile', 'assignees': ['VODAFONE'], 'sub_assignees': ['XFERA'],
+            'wholesaler': 'VODAFONE',
+        })))
+        expect(unknown[0]).to(equal(404))
+
+    def test_it_reloads_regenerated_data_and_drops_cached_responses(self):
+        async def queries(service, port):
+            before = await _get(port, '/markets/landline/years/2003')
+            _save_state('landline', [_registry('TELEFONICA', '82201', '2003-07-10')])
+            os.utime(f'{STATE_DIR}/landline.state.pickle', ns=(1, 1))
+            reloaded = await service.reload_if_changed()
+            after = await _get(port, '/markets/landline/years/2003')
+            status = await _get(port, '/status')
+            return before, reloaded, after, status
+
+        before, reloaded, after, status = self._run(queries)
+
+        expect(before[1]['operators'][0]['name']).to(equal('VODAFONE ONO'))
+        expect(reloaded).to(equal(True))
+        expect(after[1]['operators'][0]['name']).to(equal('TELEFONICA'))
+        expect(status[1]['generation']).to(equal(2))
+
+    def test_it_answers_bad_request_to_empty_and_oversized_request_lines(self):
+        async def queries(service, port):
+            return [
+                await _raw(port, b'\r\n\r\n'),
+                await _raw(port, f'GET /{"x" * MAX_REQUEST_LINE * 2} HTTP/1.1\r\n\r\n'.encode('latin-1')),
+                await _get(port, '/status'),
+            ]
+
+        empty, oversized, status = self._run(queries)
+
+        expect(empty).to(equal((400, {'error': 'bad request'})))
+        expect(oversized).to(equal((400, {'error': 'bad request'})))
+        expect(status[0]).to(equal(200))
+
+    def test_it_reports_current_status_without_caching_it(self):
+        async def queries(service, port):
+            first = await _get(port, '/status')
+            await _get(port, '/markets/mobile/years/2012')
+            await _get(port, '/markets/landline/years/2003')
+            return first, await _get(port, '/status')
+
+        first, second = self._run(queries)
+
+        expect(first[1]['cached_responses']).to(equal(0))
+        expect(second[1]['cached_responses']).to(equal(2))
+
+
+class ResponseCacheTestCase(TestCase):
+
+    def test_it_evicts_least_recently_used_responses(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('/a', (200, b'a'))
+        cache.put('/b', (200, b'b'))
+        cache.get('/a')
+
+        cache.put('/c', (200, b'c'))
+
+        expect(cache.get('/b')).to(equal(None))
+        expect(cache.get('/a')).to(equal((200, b'a')))
@@ -0,0 +1,104 @@
+import random
+import shutil
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from expects import (
+    be_none,
+    equal,
+    expect
+)
+
+from backend import release_archive
+
+ARCHIVE_DIR = '/tmp/test_release_archive'
+SOURCE_FILE = '/tmp/test_release_archive_moviles.txt'
+LINES = [
+    '600###Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#19/11/1998',
+    '601#4##Asignado#VODAFONE ESPAÑA, S.A. UNIPERSONAL#21/09/2015',
+    '601#4# #Subasignado 0#XFERA MÓVILES, S.A. UNIPERSONAL#02/02/2021',
+    '602#1##Asignado#ORANGE ESPAGNE, S.A. UNIPERSONAL#01/01/2001',
+]
+
+
+def _write_source(lines):
+    with open(SOURCE_FILE, 'w', encoding='iso-8859-15') as f:
+        f.writelines(f'{line}\n' for line in lines)
+
+
+def _archive(release_date, lines):
+    _write_source(lines)
+    return release_archive.archive_release(ARCHIVE_DIR, release_date, {'mobile': SOURCE_FILE})
+
+
+class ReleaseArchiveTestCase(TestCase):
+
+    def tearDown(self) -> None:
+        shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def test_it_refuses_to_archive_markets_without_lines(self):
+        _archive('2021-05-01', LINES)
+
+        with self.assertRaises(ValueError):
+            release_archive.archive_release(ARCHIVE_DIR, '2021-06-01', {'mobile': '/tmp/test_release_archive_missing.txt'})
+
+        expect([release['id'] for release in release_archive.read_index(ARCHIVE_DIR)]).to(equal(['2021-05-01']))
+        expect(release_archive.release_at(ARCHIVE_DIR, 'mobile', '2021-06-02')['id']).to(equal('2021-05-01'))
+
+    def test_it_skips_unchanged_releases(self):
+        expect(_archive('2021-01-01', LINES)).to(equal('2021-01-01'))
+
+        expect(_archive('2021-02-01', LINES)).to(be_none)
+        expect(len(release_archive.read_index(ARCHIVE_DIR))).to(equal(1))
+
+    def test_it_stores_diffs_and_rebuilds_every_release(self):
+        releases = [
+            ('2021-01-01', LINES),
+            ('2021-02-01', LINES[:2] + LINES[3:]),
+            ('2021-03-01', LINES[:2] + ['601#5##Asignado#LEMONVIL, S.L.#01/03/2021'] + LINES[3:]),
+        ]
+        for release_date, lines in releases:
+            _archive(release_date, lines)
+
+        kinds = [release['markets']['mobile']['kind'] for release in release_archive.read_index(ARCHIVE_DIR)]
+        expect(kinds).to(equal(['checkpoint', 'diff', 'diff']))
+        for release_date, lines in releases:
+            expect(release_archive.release_lines(ARCHIVE_DIR, 'mobile', release_date)).to(equal(lines))
+
+    def test_it_writes_checkpoints_periodically_and_for_reordered_files(self):
+        with mock.patch('backend.release_archive.CHECKPOINT_INTERVAL', 2):
+            _archive('2021-01-01', LINES)
+            _archive('2021-02-01', LINES[:3])
+            _archive('2021-03-01', LINES[:2])
+        _archive('2021-04-01', LINES[::-1])
+
+        kinds = [release['markets']['mobile']['kind'] for release in release_archive.read_index(ARCHIVE_DIR)]
+        expect(kinds).to(equal(['checkpoint', 'diff', 'checkpoint', 'checkpoint']))
+        expect(release_archive.release_lines(ARCHIVE_DIR, 'mobile', '2021-04-01')).to(equal(LINES[::-1]))
+
+    def test_it_rebuilds_registries_of_any_archived_date(self):
+        _archive('2021-01-01', LINES)
+        _archive('2021-06-01', LINES[:2])
+
+        before = release_archive.registries_at(ARCHIVE_DIR, 'mobile', '2021-05-31')
+        after = release_archive.registries_at(ARCHIVE_DIR, 'mobile', '2021-06-01')
+
+        expect([registry['operator'] for registry in before][-1]).to(equal('ORANGE ESPAGNE, S.A. UNIPERSONAL'))
+        expect(len(after)).to(equal(2))
+        expect(release_archive.registries_at(ARCHIVE_DIR, 'mobile', '2020-12-31')).to(equal([]))
+
+    def test_diffs_patch_previous_lines_into_new_ones(self):
+        rnd = random.Random(2021)
+        previous = [f'line {i}' for i in range(50)]
+        for release in range(100):
+            lines = [line for line in previous if rnd.random() > 0.2]
+            for i in range(rnd.randint(0, 10)):
+                lines.insert(rnd.randint(0, len(lines)), f'line {release}.{i}')
+
+            diff = release_archive._diff(previous, lines)
+
+            expect(release_archive._patch(previous, diff)).to(equal(lines))
+            previous = lines
@@ -0,0 +1,56 @@
+import io
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import resolve_numbers
+from backend.number_index import NumberIndex
+from backend.registries import Registry
+
+EXPECTED_CSV = (
+    'number,assignees,sub_assignees,wholesaler\n'
+    '601400123,"VODAFONE ESPAÑA, S.A.|ORANGE",XFERA,"VODAFONE ESPAÑA, S.A."\n'
+    '601410000,"VODAFONE ESPAÑA, S.A.|ORANGE",,\n'
+    '+34 822 01 00 00,VODAFONE ONO,,\n'
+    '700000000,,,\n'
+    '"60,1",,,\n'
+)
+
+
+def _registry(operator, prefix, _type='asignado', wholesaler=''):
+    nmin, nmax = int(prefix.ljust(9, '0')), int(prefix.ljust(9, '9'))
+    return Registry(operator, wholesaler, '2021-01-01', prefix[:3], prefix[3:], '', nmin, nmax, nmax - nmin + 1, _type)
+
+
+class ResolveNumbersTestCase(TestCase):
+
+    def setUp(self):
+        self.indexes = [
+            NumberIndex.from_registries([_registry('VODAFONE ONO', '82201')]),
+            NumberIndex.from_registries([
+                _registry('VODAFONE ESPAÑA, S.A.', '6014'),
+                _registry('ORANGE', '6014'),
+                _registry('XFERA', '60140', 'subasignado', 'VODAFONE ESPAÑA, S.A.'),
+            ]),
+        ]
+        self.lines = ['601400123\n', '601410000\n', '+34 822 01 00 00\n', '700000000\n', '60,1\n']
+
+    def _resolve(self, chunk_size):
+        output = io.StringIO()
+        resolved = resolve_numbers.resolve(self.lines, self.indexes, output, chunk_size=chunk_size)
+        expect(resolved).to(equal(len(self.lines)))
+        return output.getvalue()
+
+    def test_it_writes_owners_of_every_number_as_csv(self):
+        expect(self._resolve(chunk_size=2)).to(equal(EXPECTED_CSV))
+        expect(self._resolve(chunk_size=100)).to(equal(EXPECTED_CSV))
+
+    def test_it_resolves_numbers_without_numpy(self):
+        with mock.patch('backend.resolve_numbers.np', None):
+            expect(self._resolve(chunk_size=2)).to(equal(EXPECTED_CSV))
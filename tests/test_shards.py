@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import shutil
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import shards
+
+OUTPUT_DIR = '/tmp/test_shards'
+
+
+class ShardsExportTestCase(TestCase):
+
+    def setUp(self):
+        self.datasets = {
+            'landline': {
+                '2003': {'year': '2003', 'operators': [{'id': '2', 'volume': 15000, 'links': ['0']}]},
+                '2004': {'year': '2004', 'operators': [{'id': '2', 'volume': 15000, 'links': ['0']}]},
+            },
+            'mobile': {
+                '1998': {'year': '1998', 'operators': [{'id': '1', 'volume': 1000000, 'links': ['0']}]},
+            },
+        }
+
+    def tearDown(self) -> None:
+        shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def test_it_writes_one_file_per_market_and_year(self):
+        manifest = shards.export(OUTPUT_DIR, 'data/shards', self.datasets)
+
+        with open(f'{OUTPUT_DIR}/landline/2004.json', 'rb') as f:
+            content = f.read()
+        expect(json.loads(content)).to(equal(self.datasets['landline']['2004']))
+        expect(manifest['landline']['2004']).to(equal({
+            'file': 'data/shards/landline/2004.json',
+            'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        }))
+        expect(sorted(manifest['mobile'])).to(equal(['1998']))
+
+    def test_it_keeps_unchanged_shards_and_removes_stale_ones(self):
+        shards.export(OUTPUT_DIR, 'data/shards', self.datasets)
+        os.utime(f'{OUTPUT_DIR}/landline/2003.json', (0, 0))
+        del self.datasets['landline']['2004']
+
+        shards.export(OUTPUT_DIR, 'data/shards', self.datasets)
+
+        expect(os.path.getmtime(f'{OUTPUT_DIR}/landline/2003.json')).to(equal(0))
+        expect(os.listdir(f'{OUTPUT_DIR}/landline')).to(equal(['2003.json']))
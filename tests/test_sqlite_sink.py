@@ -0,0 +1,77 @@
+import json
+import os
+import random
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import sqlite_sink
+from backend.preprocess_data import _get_operators
+from backend.registries import (
+    Registry,
+    build_dataset,
+)
+
+DB_FILE = '/tmp/test_sqlite_sink.sqlite'
+
+
+def _registries(size, seed):
+    rnd = random.Random(seed)
+    names = [f'OPERATOR {i}' for i in range(20)]
+    registries = []
+    for i in range(size):
+        sub_assigned = rnd.random() < 0.3
+        registries.append(Registry(
+            rnd.choice(names),
+            rnd.choice(names) if sub_assigned else '',
+            f'{rnd.randint(1998, 2010)}-{rnd.randint(1, 12):02d}-01',
+            str(600 + i % 100),
+            str(i // 100),
+            '0' if sub_assigned else '',
+            0,
+            0,
+            rnd.choice([10000, 100000]),
+            'subasignado' if sub_assigned else 'asignado'
+        ))
+    return registries
+
+
+class SqliteSinkTestCase(TestCase):
+
+    def setUp(self):
+        self.connection = sqlite_sink.connect(DB_FILE)
+
+    def tearDown(self) -> None:
+        self.connection.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(f'{DB_FILE}{suffix}'):
+                os.unlink(f'{DB_FILE}{suffix}')
+        return super().tearDown()
+
+    def test_it_replaces_stored_market_registries_and_operators(self):
+        sqlite_sink.store_market(self.connection, 'mobile', _registries(50, 1), _get_operators(_registries(50, 1)))
+        registries = _registries(30, 2)
+
+        sqlite_sink.store_market(self.connection, 'mobile', registries, _get_operators(registries))
+
+        expect(self.connection.execute('SELECT COUNT(*) FROM registries').fetchone()).to(equal((30, )))
+        expect(self.connection.execute(
+            'SELECT operator, volume FROM registries WHERE market = ? AND position = 7', ('mobile', )
+        ).fetchone()).to(equal((registries[7]['operator'], registries[7]['volume'])))
+        expect(self.connection.execute('SELECT COUNT(*) FROM operators').fetchone()).to(
+            equal((len(_get_operators(registries)), ))
+        )
+
+    def test_it_builds_same_dataset_as_registries_scan(self):
+        for seed in range(5):
+            registries = _registries(500, seed)
+            operators = _get_operators(registries)
+            operators_by_name = {operator['name']: _id for _id, operator in operators.items()}
+            sqlite_sink.store_market(self.connection, 'landline', registries, operators)
+
+            dataset = sqlite_sink.build_dataset(self.connection, 'landline')
+
+            expect(json.dumps(dataset)).to(equal(json.dumps(build_dataset(registries, operators_by_name))))
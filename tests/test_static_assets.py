@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import os
+import shutil
+from unittest import TestCase
+
+from expects import (
+    equal,
+    expect
+)
+
+from backend import static_assets
+
+UI_DIR = '/tmp/test_static_assets'
+OUTPUT_DIR = f'{UI_DIR}/data'
+INDEX_HTML = f'{UI_DIR}/index.html'
+HTML = (
+    '<script type="text/javascript" src="data/dataset.js"></script>\n'
+    '<script type="text/javascript" src="js/visualization.js"></script>\n'
+)
+
+
+class StaticAssetsPublishTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(OUTPUT_DIR)
+        self.content = b'landlineData = {}; mobileData = {};'
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        with open(f'{OUTPUT_DIR}/dataset.js', 'wb') as f:
+            f.write(self.content)
+        with open(INDEX_HTML, 'w') as f:
+            f.write(HTML)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(UI_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def test_it_writes_reproducible_gzip_sidecars(self):
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'])
+        with open(f'{OUTPUT_DIR}/dataset.js.gz', 'rb') as f:
+            first = f.read()
+        os.unlink(f'{OUTPUT_DIR}/dataset.js.gz')
+
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'])
+
+        with open(f'{OUTPUT_DIR}/dataset.js.gz', 'rb') as f:
+            second = f.read()
+        expect(gzip.decompress(second)).to(equal(self.content))
+        expect(second).to(equal(first))
+
+    def test_it_publishes_hashed_names_and_rewrites_script_references(self):
+        published = static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, hashed=True)
+
+        hashed_name = f'dataset.{self.digest[:10]}.js'
+        expect(published).to(equal({'dataset.js': hashed_name}))
+        with open(f'{OUTPUT_DIR}/{hashed_name}', 'rb') as f:
+            expect(f.read()).to(equal(self.content))
+        with open(INDEX_HTML) as f:
+            expect(f.read()).to(equal(HTML.replace('data/dataset.js', f'data/{hashed_name}')))
+
+    def test_it_skips_unchanged_artifacts_and_removes_replaced_ones(self):
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, hashed=True)
+        old_name = f'dataset.{self.digest[:10]}.js'
+        os.utime(f'{OUTPUT_DIR}/{old_name}.gz', (0, 0))
+        os.utime(INDEX_HTML, (0, 0))
+
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, hashed=True)
+
+        expect(os.path.getmtime(f'{OUTPUT_DIR}/{old_name}.gz')).to(equal(0))
+        expect(os.path.getmtime(INDEX_HTML)).to(equal(0))
+
+        names = [old_name]
+        for year in range(2019, 2019 + static_assets.KEEP_HASHED_NAMES):
+            with open(f'{OUTPUT_DIR}/dataset.js', 'wb') as f:
+                f.write(f'landlineData = {{"{year}": {{}}}}; mobileData = {{}};'.encode('utf-8'))
+            names.append(static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, hashed=True)['dataset.js'])
+
+        expect(os.path.exists(f'{OUTPUT_DIR}/{old_name}')).to(equal(False))
+        expect(os.path.exists(f'{OUTPUT_DIR}/{old_name}.gz')).to(equal(False))
+        expect(sorted(name for name in os.listdir(OUTPUT_DIR) if name.startswith('dataset.') and name.endswith('.js'))).to(
+            equal(sorted(['dataset.js'] + names[1:]))
+        )
+        with open(INDEX_HTML) as f:
+            expect(f.read()).to(equal(HTML.replace('data/dataset.js', f'data/{names[-1]}')))
+
+    def test_it_removes_hashed_copies_and_sidecars_of_other_modes(self):
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, hashed=True)
+        static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML)
+        with open(f'{OUTPUT_DIR}/dataset.js', 'wb') as f:
+            f.write(b'landlineData = {"2021": {}}; mobileData = {};')
+
+        published = static_assets.publish(OUTPUT_DIR, ['dataset.js'], html_path=INDEX_HTML, compress=False)
+
+        expect(published).to(equal({'dataset.js': 'dataset.js'}))
+        expect(sorted(os.listdir(OUTPUT_DIR))).to(equal(['.static_assets.json', 'dataset.js']))
+        with open(INDEX_HTML) as f:
+            expect(f.read()).to(equal(HTML))
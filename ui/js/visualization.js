@@ -1,7 +1,25 @@
 const bigNetworkNodesQuantity = 100;
+// Sharded export: dataset.js only has the manifest, years are fetched on demand
+const shardManifest = (typeof datasetManifest !== 'undefined') ? datasetManifest : null;
+var shardCache = {};
+// Binary export: dataset.js only points to dataset.bin, decoded once it is fetched
+const binaryDataset = (typeof datasetBinary !== 'undefined') ? datasetBinary : null;
+var binaryDatasetCache = null;
+// Precomputed node positions (--layout): { year: { id: [x, y] } } per market
+const graphLayouts = (typeof landlineLayout !== 'undefined') ? {
+    landline: landlineLayout,
+    mobile: mobileLayout,
+} : null;
+// Level of detail views (--clusters): { year: { operators, clusters } } per market
+const clusterViews = (typeof landlineClusters !== 'undefined') ? {
+    landline: landlineClusters,
+    mobile: mobileClusters,
+} : null;
+var filtersRequest = 0;
 var operators = mobileOperators;
-var dataset = mobileData;
+var market = 'mobile';
 var opsData = null;
+var clustersData = [];
 var filterYear = new Date().getFullYear();
 var network = null;
 
@@ -47,8 +65,21 @@ function operatorSize(volume, stats) {
     return parseInt(size * 12);
 }
 
+function clusterPosition(cluster, positions) {
+    // Centroid of the members, where they show up once expanded
+    let x = 0, y = 0, placed = 0;
+    for (const id of cluster.members) {
+        if (positions[id] != undefined) {
+            x += positions[id][0];
+            y += positions[id][1];
+            placed++;
+        }
+    }
+    return placed ? [x / placed, y / placed] : undefined;
+}
+
 function buildGraph() {
-    const stats = operatorsStats(opsData);
+    const stats = operatorsStats(opsData.concat(clustersData));
     if (network != null) {
         network.destroy();
     }
@@ -62,8 +93,13 @@ function buildGraph() {
         margin: 6,
     },];
     var edgesData = [];
-    const nodesQuantity = opsData.length;
+    const nodesQuantity = opsData.length + clustersData.length;
     const isBigNetwork = nodesQuantity >= bigNetworkNodesQuantity;
+    const positions = (graphLayouts != null) ? graphLayouts[market][filterYear] : undefined;
+    if (positions != undefined && positions["0"] != undefined) {
+        nodesData[0].x = positions["0"][0];
+        nodesData[0].y = positions["0"][1];
+    }
 
     for(let index in opsData) {
         let op = opsData[index];
@@ -79,10 +115,34 @@ function buildGraph() {
         if (!isBigNetwork) {
             nodeData.mass = calcMass(nodesQuantity)
         }
+        if (positions != undefined && positions[op.id] != undefined) {
+            nodeData.x = positions[op.id][0];
+            nodeData.y = positions[op.id][1];
+        }
         nodesData.push(nodeData);
-        for (let _id in op.links) {
+        for (let link of op.links) {
             // [ { from: 1, to: 3 }, { from: 1, to: 2 }, ... ]
-            edgesData.push({ 'from': _id, 'to': op.id });
+            edgesData.push({ 'from': link, 'to': op.id });
+        }
+    }
+    for (const cluster of clustersData) {
+        let nodeData = {
+            id: cluster.id,
+            label: `+${cluster.members.length}`,
+            shape: 'ellipse',
+            color: { background: '#e9ecef', border: '#adb5bd' },
+            margin: 2 * (1 + operatorSize(cluster.volume, stats)),
+            title: `${cluster.members.length} smaller companies\nTotal lines:\t${cluster.volume.toLocaleString()}\nClick to expand`,
+            value: cluster.volume,
+        };
+        const position = (positions != undefined) ? clusterPosition(cluster, positions) : undefined;
+        if (position != undefined) {
+            nodeData.x = position[0];
+            nodeData.y = position[1];
+        }
+        nodesData.push(nodeData);
+        for (let link of cluster.links) {
+            edgesData.push({ 'from': link, 'to': cluster.id });
         }
     }
 
@@ -121,7 +181,10 @@ function buildGraph() {
           tooltipDelay: 200,
         },
     };
-    if (isBigNetwork) {
+    if (positions != undefined) {
+        // Nodes are already placed, skip stabilization in the browser
+        options.physics = false;
+    } else if (isBigNetwork) {
         document.getElementById("loading").style.display = 'block';
         options.layout = {
             improvedLayout: false,
@@ -139,6 +202,10 @@ function buildGraph() {
         if (_id == undefined || _id == '0') {
             return;
         }
+        if (clustersData.some(cluster => cluster.id == _id)) {
+            expandCluster(_id);
+            return;
+        }
         selectCompany(_id);
     });
 }
@@ -162,11 +229,177 @@ function buildSelectorFilter() {
     $f.selectpicker('render');
 }
 
-function applyFilters() {
+function deltaDecoder(encoded) {
+    // Rebuilds yearly snapshots from delta export, every decoded year is memoized.
+    // { years: [...], deltas: [{ add, remove, volume, links, order }, ...] }
+    const snapshots = {};
+    var operators = {};
+    var order = [];
+    var next = 0;
+    return function (year) {
+        year = '' + year;
+        while (!(year in snapshots) && next < encoded.years.length) {
+            const delta = encoded.deltas[next];
+            for (const id of (delta.remove || [])) {
+                delete operators[id];
+            }
+            order = order.filter(id => id in operators);
+            for (const [id, volume, links] of (delta.add || [])) {
+                operators[id] = { volume: volume, links: links.slice() };
+                order.push(id);
+            }
+            for (const id in (delta.volume || {})) {
+                operators[id].volume += delta.volume[id];
+            }
+            for (const id in (delta.links || {})) {
+                operators[id].links = operators[id].links.concat(delta.links[id]).sort();
+            }
+            if (delta.order) {
+                order = delta.order.slice();
+            }
+            const _year = encoded.years[next];
+            snapshots[_year] = {
+                year: _year,
+                operators: order.map(id => ({ id: id, volume: operators[id].volume, links: operators[id].links.slice() })),
+            };
+            next++;
+        }
+        return snapshots[year];
+    };
+}
+
+// Delta export: dataset.js has yearly changes instead of full snapshots
+const deltaDecoders = (typeof landlineDelta !== 'undefined') ? {
+    landline: deltaDecoder(landlineDelta),
+    mobile: deltaDecoder(mobileDelta),
+} : null;
+
+function binaryDatasetDecoder(buffer) {
+    // Little-endian uint32 values, see backend/binary_dataset.py:
+    // 'TMDS', version, markets, then per market: name length, years, name (4 bytes aligned)
+    // and per year: year, operators, links, ids, volumes, link offsets, link targets.
+    // Years are only indexed here and decoded when requested, then memoized.
+    const view = new DataView(buffer);
+    const uint32 = (offset) => view.getUint32(offset, true);
+    if (uint32(0) != 0x53444d54 || uint32(4) != 1) {
+        throw new Error(`Unknown dataset format in ${binaryDataset.file}`);
+    }
+    const positions = {};
+    const snapshots = {};
+    let position = 12;
+    for (let m = 0; m < uint32(8); m++) {
+        const nameLength = uint32(position);
+        const years = uint32(position + 4);
+        const name = new TextDecoder().decode(new Uint8Array(buffer, position + 8, nameLength));
+        position += 8 + Math.ceil(nameLength / 4) * 4;
+        positions[name] = {};
+        snapshots[name] = {};
+        for (let y = 0; y < years; y++) {
+            const count = uint32(position + 4);
+            positions[name]['' + uint32(position)] = position;
+            position += 12 + 4 * (3 * count + 1 + uint32(position + 8));
+        }
+    }
+    return function (market, year) {
+        year = '' + year;
+        if (!(year in snapshots[market]) && year in positions[market]) {
+            const position = positions[market][year];
+            const count = uint32(position + 4);
+            const ids = position + 12;
+            const volumes = ids + 4 * count;
+            const offsets = volumes + 4 * count;
+            const targets = offsets + 4 * (count + 1);
+            const operators = new Array(count);
+            for (let i = 0; i < count; i++) {
+                const links = [];
+                for (let l = uint32(offsets + 4 * i); l < uint32(offsets + 4 * (i + 1)); l++) {
+                    links.push('' + uint32(targets + 4 * l));
+                }
+                operators[i] = { id: '' + uint32(ids + 4 * i), volume: uint32(volumes + 4 * i), links: links };
+            }
+            snapshots[market][year] = { year: year, operators: operators };
+        }
+        return snapshots[market][year];
+    };
+}
+
+async function yearData(market, year) {
+    if (deltaDecoders != null) {
+        return deltaDecoders[market](year);
+    }
+    if (binaryDataset != null) {
+        if (binaryDatasetCache == null) {
+            binaryDatasetCache = fetch(`${binaryDataset.file}?v=${binaryDataset.sha256.substring(0, 12)}`).then(function (response) {
+                if (!response.ok) {
+                    throw new Error(`Can't load ${binaryDataset.file}`);
+                }
+                return response.arrayBuffer();
+            }).then(binaryDatasetDecoder).catch(function (error) {
+                // Network, body and decoding failures are retried on the next call
+                binaryDatasetCache = null;
+                throw error;
+            });
+        }
+        return (await binaryDatasetCache)(market, year);
+    }
+    if (shardManifest == null) {
+        return (market == 'landline' ? landlineData : mobileData)[year];
+    }
+    const shard = shardManifest[market][year];
+    if (shard == undefined) {
+        return undefined;
+    }
+    const key = `${market}/${year}`;
+    if (!(key in shardCache)) {
+        shardCache[key] = fetch(`${shard.file}?v=${shard.sha256.substring(0, 12)}`).then(function (response) {
+            if (!response.ok) {
+                throw new Error(`Can't load ${shard.file}`);
+            }
+            return response.json();
+        }).catch(function (error) {
+            delete shardCache[key];
+            throw error;
+        });
+    }
+    return shardCache[key];
+}
+
+async function applyFilters() {
     const year = parseInt(document.getElementById('year').value);
     const limit = parseInt(document.getElementById('limit').value);
-    dataset[year].operators.sort(opIsSmaller)
-    opsData = dataset[year].operators.slice(0, limit);
+    const request = ++filtersRequest;
+    // The level of detail view replaces the limit, the whole year is only loaded to expand clusters
+    const view = (clusterViews != null) ? clusterViews[market][year] : undefined;
+    document.getElementById('limit').disabled = view != undefined;
+    document.getElementById('apply_limit').disabled = view != undefined;
+    const data = (view != undefined) ? view : await yearData(market, year);
+    if (data == undefined || request != filtersRequest) {
+        return;
+    }
+    filterYear = year;
+    if (view != undefined) {
+        opsData = view.operators.slice().sort(opIsSmaller);
+        clustersData = view.clusters.slice();
+    } else {
+        data.operators.sort(opIsSmaller)
+        opsData = data.operators.slice(0, limit);
+        clustersData = [];
+    }
+    buildSelectorFilter();
+    buildGraph();
+}
+
+async function expandCluster(clusterId) {
+    // Replaces the cluster node with its members, taken from the whole year
+    const request = filtersRequest;
+    const data = await yearData(market, filterYear);
+    const index = clustersData.findIndex(cluster => cluster.id == clusterId);
+    if (data == undefined || request != filtersRequest || index < 0) {
+        return;
+    }
+    const members = new Set(clustersData[index].members);
+    clustersData.splice(index, 1);
+    opsData = opsData.concat(data.operators.filter(op => members.has(op.id))).sort(opIsSmaller);
     buildSelectorFilter();
     buildGraph();
 }
@@ -176,11 +409,11 @@ var datasetChange = function(e) {
     $( "#dataset_landline" ).removeClass('active');
     var obj = $( e.target );
     if (obj.attr('id') == "dataset_landline") {
-        dataset = landlineData;
+        market = 'landline';
         operators = landlineOperators;
         $( "#dataset_landline" ).addClass('active');
     } else {
-        dataset = mobileData;
+        market = 'mobile';
         operators = mobileOperators;
         $( "#dataset_mobile" ).addClass('active');
     }
@@ -211,7 +444,7 @@ document.addEventListener("DOMContentLoaded", async function(event) {
     document.getElementById('yearValue').innerText = year;
     // document.getElementById("dataset_landline").addEventListener('click', datasetChange);
     // document.getElementById("dataset_mobile").addEventListener('click', datasetChange);
-    if (dataset == landlineData) {
+    if (market == 'landline') {
         $( "#dataset_landline" ).addClass('active');
     } else {
         $( "#dataset_mobile" ).addClass('active');